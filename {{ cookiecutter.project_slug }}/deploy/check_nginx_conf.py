@@ -0,0 +1,158 @@
+"""
+Render the nginx templates of the roles setup_nginx_with_cert and setup_nginx_with_certbot, and check them with
+`nginx -t`, without ansible nor a server:
+
+    python3 check_nginx_conf.py
+    python3 check_nginx_conf.py --env live --role setup_nginx_with_certbot --profile performance --nginx /usr/sbin/nginx
+    python3 check_nginx_conf.py --render-only
+
+The variables are the defaults of the role, then env/<env>/group_vars/all.yml, then sample hosts. The paths of the
+certificates, logs and cache are replaced by files of a temporary directory, with a self-signed certificate.
+
+Requires jinja2 and PyYAML (installed with ansible), openssl and nginx.
+"""
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import jinja2
+import yaml
+
+DEPLOY_DIR = os.path.dirname(os.path.abspath(__file__))
+ROLES = ('setup_nginx_with_cert', 'setup_nginx_with_certbot')
+PROFILES = ('default', 'performance')
+SAMPLE_HOSTS = (('live-1', '10.0.0.11'), ('live-2', '10.0.0.12'))
+
+NGINX_CONF = """pid %(directory)s/nginx.pid;
+error_log %(directory)s/error.log;
+
+events {
+    worker_connections 64;
+}
+
+http {
+    access_log %(directory)s/access.log;
+    client_body_temp_path %(directory)s/client_body;
+    proxy_temp_path %(directory)s/proxy;
+    fastcgi_temp_path %(directory)s/fastcgi;
+    uwsgi_temp_path %(directory)s/uwsgi;
+    scgi_temp_path %(directory)s/scgi;
+
+    include %(site)s;
+}
+"""
+
+# (directive, replacement): paths of the server replaced by paths of the temporary directory
+PATH_DIRECTIVES = (
+    ('ssl_certificate_key', 'server.key'),
+    ('ssl_certificate', 'server.crt'),
+    ('access_log', 'site.access.log'),
+    ('error_log', 'site.error.log'),
+    ('proxy_cache_path', 'cache'),
+)
+
+
+def load_yaml(path):
+    with open(path) as f:
+        return yaml.safe_load(f) or {}
+
+
+def get_variables(role, env, profile):
+    variables = load_yaml(os.path.join(DEPLOY_DIR, 'roles', role, 'defaults', 'main.yml'))
+    variables.update(load_yaml(os.path.join(DEPLOY_DIR, 'env', env, 'group_vars', 'all.yml')))
+    hosts = [host for host, _ in SAMPLE_HOSTS]
+    variables.update({
+        'groups': {'django_server_hosts': hosts, 'load_balancer': hosts[:1]},
+        'hostvars': {host: {'private_ip': private_ip} for host, private_ip in SAMPLE_HOSTS},
+        'use_wildcard_certificate': False,
+        'wildcard_host': variables.get('server_host'),
+        'nginx_profile': profile,
+    })
+    # the variables refer to each other, render them until they do not change
+    environment = jinja2.Environment()
+    for _ in range(10):
+        changed = False
+        for name, value in variables.items():
+            if isinstance(value, str) and '{' in value:
+                rendered = environment.from_string(value).render(variables)
+                changed = changed or rendered != value
+                variables[name] = rendered
+        if not changed:
+            break
+    return variables
+
+
+def render(role, variables):
+    # the template module of ansible uses trim_blocks
+    environment = jinja2.Environment(trim_blocks=True, undefined=jinja2.StrictUndefined,
+                                     loader=jinja2.FileSystemLoader(os.path.join(DEPLOY_DIR, 'roles', role)))
+    return environment.get_template('templates/nginx_conf').render(variables)
+
+
+def localize(conf, directory):
+    for directive, filename in PATH_DIRECTIVES:
+        path = os.path.join(directory, filename)
+        conf = re.sub(r'^(\s*%s\s+)[^\s;]+' % directive, lambda m: m.group(1) + path, conf, flags=re.MULTILINE)
+    return conf
+
+
+def create_certificate(directory):
+    subprocess.run(
+        ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1', '-subj', '/CN=localhost',
+         '-keyout', os.path.join(directory, 'server.key'), '-out', os.path.join(directory, 'server.crt')],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def check(nginx, role, env, profile):
+    """
+    :return: (whether `nginx -t` succeeded, its output)
+    """
+    directory = tempfile.mkdtemp(prefix='nginx_%s_%s_' % (role, profile))
+    try:
+        create_certificate(directory)
+        site = os.path.join(directory, 'site.conf')
+        with open(site, 'w') as f:
+            f.write(localize(render(role, get_variables(role, env, profile)), directory))
+        conf = os.path.join(directory, 'nginx.conf')
+        with open(conf, 'w') as f:
+            f.write(NGINX_CONF % {'directory': directory, 'site': site})
+        result = subprocess.run([nginx, '-t', '-p', directory, '-c', conf],
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        return result.returncode == 0, result.stdout
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render the nginx templates and check them with nginx -t.')
+    parser.add_argument('--env', default='live')
+    parser.add_argument('--role', choices=ROLES, action='append', help='all the roles by default')
+    parser.add_argument('--profile', choices=PROFILES, action='append', help='all the profiles by default')
+    parser.add_argument('--nginx', default='nginx', help='the nginx binary')
+    parser.add_argument('--render-only', action='store_true', help='print the rendered templates, without nginx -t')
+    args = parser.parse_args()
+
+    failed = 0
+    for role in args.role or ROLES:
+        for profile in args.profile or PROFILES:
+            if args.render_only:
+                print('# %s, profile %s' % (role, profile))
+                print(render(role, get_variables(role, args.env, profile)))
+                continue
+            if shutil.which(args.nginx) is None:
+                print('nginx not found: %s, use --nginx or --render-only' % args.nginx, file=sys.stderr)
+                return 2
+            ok, output = check(args.nginx, role, args.env, profile)
+            print('%s %s, profile %s' % ('OK  ' if ok else 'FAIL', role, profile))
+            if not ok:
+                failed += 1
+                print(output)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
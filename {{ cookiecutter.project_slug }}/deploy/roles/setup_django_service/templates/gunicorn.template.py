@@ -1,10 +1,92 @@
+import os
+import signal
+import time
+
 bind = '{{private_ip}}:{{django_port}}'
 forwarded_allow_ips = "{% for host in groups['load_balancer'] %}{% if loop.index0 != 0 %},{% endif %}{{ hostvars[host]['private_ip'] }}{% endfor %}"
 max_requests = {{max_requests}}
+max_requests_jitter = {{max_requests_jitter}}
 workers = {{workers}}
 worker_class = '{{worker_class}}'
 graceful_timeout = {{graceful_timeout}}
 timeout = {{timeout}}
 keepalive = {{keepalive}}
 chdir = '{{chdir}}'
-errorlog = '{{errorlog}}'
\ No newline at end of file
+errorlog = '{{errorlog}}'
+preload_app = {{preload_app | bool}}
+WARMUP = {{warmup | bool}}
+# The workers write their metrics in this directory, see common.metrics
+METRICS_DIRECTORY = '{{metrics_directory}}'
+os.environ['METRICS_DIRECTORY'] = METRICS_DIRECTORY
+# Seconds of the shutdown budget kept for writing the buffered log records, after the executors
+LOG_FLUSH_MARGIN = 2
+# Worker id of the sortable ids (common.ids): IDS_HOST_INDEX * IDS_SLOTS_PER_HOST + the slot of the worker, the
+# lowest slot no running worker of this master uses. A reload runs the old and the new workers together for a while.
+IDS_HOST_INDEX = {{ groups['django_server_hosts'].index(inventory_hostname) }}
+IDS_SLOTS_PER_HOST = {{ids_slots_per_host}}
+
+
+def on_starting(server):
+    # The counters of the workers of the previous run are not part of this one
+    from common.metrics import clear_directory
+    clear_directory(METRICS_DIRECTORY)
+
+
+def pre_fork(server, worker):
+    # Called in the master
+    used = {getattr(running, 'ids_slot', None) for running in server.WORKERS.values()}
+    worker.ids_slot = next(slot for slot in range(len(used) + 1) if slot not in used)
+    # With preload_app, connections opened while loading the application must not be shared with the workers
+    if server.cfg.preload_app:
+        from django.db import connections
+        from common.db.pool import close_pools
+        connections.close_all()
+        close_pools()
+
+
+def post_fork(server, worker):
+    # Without a worker id, the live settings make the first sortable id raise instead of risking duplicates
+    if worker.ids_slot < IDS_SLOTS_PER_HOST:
+        os.environ['IDS_WORKER_ID'] = str(IDS_HOST_INDEX * IDS_SLOTS_PER_HOST + worker.ids_slot)
+        os.environ['IDS_WORKER_PID'] = str(os.getpid())
+    else:
+        server.log.error('No worker id for the sortable ids: slot %s, ids_slots_per_host is %s', worker.ids_slot,
+                         IDS_SLOTS_PER_HOST)
+    if server.cfg.preload_app:
+        from django.db import connections
+        connections.close_all()
+
+
+def post_worker_init(worker):
+    # Called after the application is loaded, before the worker accepts requests
+    # Remember when the worker is asked to stop: the master kills it graceful_timeout seconds after its SIGTERM
+    handle_exit = worker.handle_exit
+
+    def on_sigterm(sig, frame):
+        worker.exit_requested_at = time.time()
+        handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, on_sigterm)
+    signal.siginterrupt(signal.SIGTERM, False)
+    if WARMUP:
+        from common.warmup import warmup
+        warmup()
+
+
+def child_exit(server, worker):
+    # Called in the master: the gauges of an exited worker are not current anymore
+    from common.metrics import mark_process_dead
+    mark_process_dead(worker.pid, METRICS_DIRECTORY)
+
+
+def worker_exit(server, worker):
+    # Finish the pending tasks of should_asynchronous, then write the log records which are still buffered
+    # (common.loggers.QueuedDailyFileHandler)
+    # The time spent finishing the requests is part of graceful_timeout; a worker which stops by itself (max_requests)
+    # is killed timeout seconds after its last heartbeat
+    import logging
+    from common.executors import shutdown_executors
+    now = time.time()
+    deadline = min(getattr(worker, 'exit_requested_at', now) + server.cfg.graceful_timeout, now + server.cfg.timeout)
+    shutdown_executors(timeout=max(deadline - now - LOG_FLUSH_MARGIN, 0))
+    logging.shutdown()
@@ -0,0 +1,13 @@
+"""
+Micro benchmarks of the hot paths of the `common` package.
+
+They run offline, with an in-memory SQLite database (see `benchmarks.settings`), from the directory of manage.py.
+The suite (cases in `benchmarks.cases`) saves its results as JSON and compares them with a baseline:
+
+    python -m benchmarks --output results.json
+    python -m benchmarks --baseline baseline.json --threshold 0.2
+
+Some optimizations also have a script comparing the code before and after, e.g.
+
+    python -m benchmarks.dispatch_plan
+"""
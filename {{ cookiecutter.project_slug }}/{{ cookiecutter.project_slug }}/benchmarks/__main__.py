@@ -0,0 +1,63 @@
+"""
+Run the benchmark suite:
+
+    python -m benchmarks --output results.json
+    python -m benchmarks --baseline benchmarks/baseline.json --threshold 0.2
+    python -m benchmarks --filter paginator --scale 0.1
+"""
+import argparse
+import sys
+
+from benchmarks.utils import setup_django
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Micro benchmarks of common.')
+    parser.add_argument('--filter', help='only run the benchmarks whose name matches this regular expression')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply the number of calls of every benchmark')
+    parser.add_argument('--output', help='save the results to this JSON file')
+    parser.add_argument('--baseline', help='compare the results with this JSON file, saved by --output')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='a benchmark slower than its baseline by more than this ratio is a regression')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    setup_django()
+
+    from benchmarks import cases
+    from benchmarks.suite import compare_results, load_results, run_benchmarks, save_results
+
+    cases.setup()
+
+    def report(name, result):
+        print('%-60s %12.3f %12.3f' % (name, result['best_us'], result['median_us']))
+        sys.stdout.flush()
+
+    print('%-60s %12s %12s' % ('benchmark', 'best (us)', 'median (us)'))
+    results = run_benchmarks(pattern=args.filter, scale=args.scale, report=report)
+
+    if args.output:
+        save_results(results, args.output)
+
+    if not args.baseline:
+        return 0
+
+    regressions = 0
+    print('\n%-60s %12s %12s %8s' % ('benchmark', 'baseline', 'best (us)', 'ratio'))
+    for name, base, best, ratio, is_regression in compare_results(results, load_results(args.baseline),
+                                                                  args.threshold):
+        if ratio is None:
+            print('%-60s %12s %12.3f %8s' % (name, '-', best, 'new'))
+            continue
+        regressions += is_regression
+        print('%-60s %12.3f %12.3f %8.2f%s' % (name, base, best, ratio, '  REGRESSION' if is_regression else ''))
+    if regressions:
+        print('\n%s benchmark(s) slower than their baseline by more than %d%%' % (regressions, args.threshold * 100))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,344 @@
+"""
+The benchmark cases of the suite, see `benchmarks.suite.benchmark`.
+"""
+import datetime
+import decimal
+import logging
+import random
+import shutil
+import tempfile
+import uuid
+
+import pytz
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.exceptions import NotAuthenticated
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+
+from benchmarks.models import Event
+from benchmarks.suite import benchmark
+from benchmarks.utils import create_tables
+from common import ids, json_engine, utils
+from common.exceptions import InvalidParameters, exception_handler
+from common.export import FORMAT_CSV, FORMAT_NDJSON, ExportAPIView
+from common.loggers import DailyFileHandler
+from common.pagination import KeysetPaginator
+from common.views import BaseAPIView, format_errors
+
+TABLE_SIZES = (1000, 10000)
+PAGE_SIZE = 20
+PAGE_DEPTHS = (1, 50)
+
+
+class QuerySerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=64)
+    page_size = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+
+class EventSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Event
+        fields = ('id', 'name', 'score', 'created_at')
+
+
+class PingView(BaseAPIView):
+    http_method_get_serializer_class = None
+    access_log_sample_rate = 0
+
+    def get(self, request, serializer):
+        return Response({'ping': 'pong'})
+
+
+class LoggedPingView(PingView):
+    access_log_sample_rate = 1.0
+
+
+class QueryView(BaseAPIView):
+    http_method_get_serializer_class = QuerySerializer
+    access_log_sample_rate = 0
+
+    def get(self, request, serializer):
+        return Response(serializer.validated_data)
+
+
+def dispatch_case(view_cls, params=None):
+    def case():
+        view = view_cls.as_view()
+        request = APIRequestFactory().get('/', params or {})
+        yield lambda: view(request)
+
+    return case
+
+
+benchmark('dispatch.no_validation')(dispatch_case(PingView))
+benchmark('dispatch.access_log')(dispatch_case(LoggedPingView))
+benchmark('dispatch.validation')(dispatch_case(QueryView, {'name': 'benchmark'}))
+
+
+class QueriesView(PingView):
+    access_log_sql = False
+
+    def get(self, request, serializer):
+        return Response([Event.objects.filter(pk=pk).exists() for pk in range(5)])
+
+
+class RecordedQueriesView(QueriesView):
+    access_log_sql = True
+
+
+benchmark('dispatch.queries')(dispatch_case(QueriesView))
+benchmark('dispatch.queries.sql_log')(dispatch_case(RecordedQueriesView))
+
+
+@benchmark('format_errors', number=5000)
+def format_errors_case():
+    serializer = QuerySerializer(data={'page_size': 1000, 'name': 'x' * 100})
+    serializer.is_valid()
+    errors = dict(serializer.errors, address={'city': ['This field is required.'], 'zip': ['Invalid.']})
+    yield lambda: format_errors(errors)
+
+
+def exception_handler_case(exc_class):
+    def case():
+        def handle():
+            try:
+                raise exc_class()
+            except Exception as exc:
+                exception_handler(exc, {})
+
+        yield handle
+
+    return case
+
+
+benchmark('exception_handler.drf', number=5000)(exception_handler_case(NotAuthenticated))
+benchmark('exception_handler.business', number=5000)(exception_handler_case(InvalidParameters))
+
+
+@benchmark('DailyFileHandler.emit', number=5000)
+def daily_file_handler_case():
+    folder = tempfile.mkdtemp()
+    handler = DailyFileHandler('%s/logs/benchmark.log' % folder)
+    handler.setFormatter(logging.Formatter('%(asctime)s|%(levelname)s|%(message)s'))
+    record = logging.makeLogRecord({
+        'name': 'main', 'levelno': logging.INFO, 'levelname': 'INFO',
+        'msg': 'benchmark|key=%s,value=%s', 'args': ('key', 42),
+    })
+    yield lambda: handler.emit(record)
+    handler.close()
+    shutil.rmtree(folder)
+
+
+def populate_events(size):
+    Event.objects.all().delete()
+    start = timezone.now()
+    Event.objects.bulk_create([
+        Event(name='event %s' % i, score=i % 100, created_at=start - datetime.timedelta(seconds=i // 3))
+        for i in range(size)
+    ])
+
+
+def paginator_case(size, depth, use_cursor):
+    def case():
+        populate_events(size)
+        sort_options = ('-created_at',)
+        cursor = None
+        page_number = depth
+        if use_cursor and depth > 1:
+            paginator = KeysetPaginator(Event.objects.all(), PAGE_SIZE, ordering=sort_options)
+            cursor = paginator.get_page(offset=(depth - 2) * PAGE_SIZE).next_cursor
+            page_number = 1
+        yield lambda: utils.generate_result_from_paginator(
+            Event, EventSerializer, sort_options=sort_options,
+            page_number=page_number, page_size=PAGE_SIZE, cursor=cursor,
+        )
+
+    return case
+
+
+for _size in TABLE_SIZES:
+    for _depth in PAGE_DEPTHS:
+        benchmark('generate_result_from_paginator.rows_%s.page_%s' % (_size, _depth), number=200)(
+            paginator_case(_size, _depth, use_cursor=False))
+        if _depth > 1:
+            benchmark('generate_result_from_paginator.rows_%s.page_%s.cursor' % (_size, _depth), number=200)(
+                paginator_case(_size, _depth, use_cursor=True))
+
+
+def list_result_case(projection):
+    def case():
+        populate_events(TABLE_SIZES[0])
+        yield lambda: utils.get_list_result_from_paginator(
+            Event.objects.order_by('-created_at', '-id'), PAGE_SIZE * 5, 1, EventSerializer, projection=projection)
+
+    return case
+
+
+# EventSerializer only has plain columns: the projection gives rows of values() instead of instances
+benchmark('get_list_result_from_paginator.projection', number=200)(list_result_case(projection=True))
+benchmark('get_list_result_from_paginator.no_projection', number=200)(list_result_case(projection=False))
+
+
+class EventExportView(ExportAPIView):
+    http_method_get_serializer_class = None
+    access_log_sample_rate = 0
+    export_serializer_class = EventSerializer
+
+    def get_export_queryset(self, request, serializer):
+        return Event.objects.order_by('id')
+
+
+def export_case(export_format, gzip):
+    def case():
+        populate_events(TABLE_SIZES[0])
+        view = EventExportView.as_view()
+        headers = {'HTTP_ACCEPT_ENCODING': 'gzip'} if gzip else {}
+        request = APIRequestFactory().get('/', {'export_format': export_format}, **headers)
+        yield lambda: b''.join(view(request).streaming_content)
+
+    return case
+
+
+@benchmark('export.materialized.rows_%s' % TABLE_SIZES[0], number=20)
+def materialized_export_case():
+    # the reference: the whole list in memory
+    populate_events(TABLE_SIZES[0])
+    yield lambda: json_engine.dumps_bytes(EventSerializer(Event.objects.order_by('id'), many=True).data)
+
+
+benchmark('export.ndjson.rows_%s' % TABLE_SIZES[0], number=20)(export_case(FORMAT_NDJSON, gzip=False))
+benchmark('export.ndjson.gzip.rows_%s' % TABLE_SIZES[0], number=20)(export_case(FORMAT_NDJSON, gzip=True))
+benchmark('export.csv.rows_%s' % TABLE_SIZES[0], number=20)(export_case(FORMAT_CSV, gzip=False))
+
+
+def make_event():
+    return Event(id=1, name='event', score=10, created_at=timezone.now(), attachment='files/a.png')
+
+
+DIFF_INPUT = {
+    'name': 'renamed',
+    'score': 10,
+    'attachment': 'files/b.png',
+    'created_at': datetime.datetime(2020, 1, 1, tzinfo=pytz.utc),
+    'unknown': 1,
+}
+
+
+@benchmark('diff', number=5000)
+def diff_case():
+    event = make_event()
+    yield lambda: utils.diff(event, DIFF_INPUT)
+
+
+@benchmark('get_diff', number=5000)
+def get_diff_case():
+    event = make_event()
+    yield lambda: utils.get_diff(event, DIFF_INPUT)
+
+
+@benchmark('dump_to_json', number=5000)
+def dump_to_json_case():
+    data = {
+        'id': 1,
+        'name': 'event',
+        'price': decimal.Decimal('10.50'),
+        'created_at': timezone.now(),
+        'day': datetime.date(2020, 1, 1),
+        'tags': ['a', 'b', 'c'],
+        'changes': {'name': {'from': 'a', 'to': 'b'}},
+    }
+    yield lambda: utils.dump_to_json(data)
+
+
+def legacy_random_string(length, allowed_chars=utils.RANDOM_CHARACTER_SET):
+    # utils.random_string before common.ids, the reference of the ids benchmarks
+    max_index = len(allowed_chars) - 1
+    return ''.join([allowed_chars[random.randint(0, max_index)] for _ in range(length)])
+
+
+@benchmark('random_string', number=5000)
+def random_string_case():
+    yield lambda: utils.random_string(32)
+
+
+@benchmark('random_string.legacy', number=5000)
+def legacy_random_string_case():
+    yield lambda: legacy_random_string(32)
+
+
+@benchmark('random_digit.otp', number=5000)
+def random_digit_case():
+    yield lambda: utils.random_digit(6)
+
+
+@benchmark('ids.random_tokens.1000', number=20)
+def random_tokens_case():
+    yield lambda: ids.random_tokens(1000, 32)
+
+
+@benchmark('ids.random_tokens.1000.legacy', number=20)
+def legacy_random_tokens_case():
+    yield lambda: [legacy_random_string(32) for _ in range(1000)]
+
+
+@benchmark('ids.next_id', number=10000)
+def next_id_case():
+    yield ids.next_id
+
+
+@benchmark('ids.next_id_string', number=10000)
+def next_id_string_case():
+    yield ids.next_id_string
+
+
+@benchmark('ids.next_ids.1000', number=20)
+def next_ids_case():
+    yield lambda: ids.next_ids(1000)
+
+
+@benchmark('ids.uuid4', number=10000)
+def uuid4_case():
+    # the usual alternative for unique keys, not sortable
+    yield lambda: uuid.uuid4().hex
+
+
+@benchmark('datetime_to_utc_unix_ms', number=10000)
+def datetime_to_utc_unix_ms_case():
+    now = timezone.now()
+    yield lambda: utils.datetime_to_utc_unix_ms(now)
+
+
+@benchmark('datetime_to_utc_unix', number=10000)
+def datetime_to_utc_unix_case():
+    now = timezone.now()
+    yield lambda: utils.datetime_to_utc_unix(now)
+
+
+@benchmark('utc_unix_to_current_datetime', number=10000)
+def utc_unix_to_current_datetime_case():
+    yield lambda: utils.utc_unix_to_current_datetime(1577836800000)
+
+
+@benchmark('datetimes_to_utc_unix_ms.500', number=100)
+def datetimes_to_utc_unix_ms_case():
+    now = timezone.now()
+    values = [now + datetime.timedelta(seconds=i) for i in range(500)]
+    yield lambda: utils.datetimes_to_utc_unix_ms(values)
+
+
+@benchmark('utc_unix_to_current_datetimes.500', number=100)
+def utc_unix_to_current_datetimes_case():
+    values = [1577836800000 + i * 61000 for i in range(500)]
+    with timezone.override(pytz.timezone('Asia/Ho_Chi_Minh')):
+        yield lambda: utils.utc_unix_to_current_datetimes(values)
+
+
+@benchmark('date_to_datetime', number=10000)
+def date_to_datetime_case():
+    day = datetime.date(2020, 1, 1)
+    yield lambda: utils.date_to_datetime(day)
+
+
+def setup():
+    create_tables(Event)
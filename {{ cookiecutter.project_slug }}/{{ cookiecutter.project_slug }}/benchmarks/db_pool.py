@@ -0,0 +1,131 @@
+"""
+Run concurrent greenlets doing queries through the pooled SQLite backend (common.db.backends.sqlite3), with a file
+database in a temporary directory, and print the pool statistics.
+
+Before, check that the connections of greenlets which do not close them go back to the pool: tasks of the greenlet
+executor, then bare greenlets. Exit with 1 if a check fails.
+
+    python -m benchmarks.db_pool --greenlets 200 --pool-size 4
+"""
+from gevent import monkey
+
+monkey.patch_all()
+
+import argparse  # noqa: E402
+import os  # noqa: E402
+import shutil  # noqa: E402
+import sys  # noqa: E402
+import tempfile  # noqa: E402
+import time  # noqa: E402
+
+import gevent  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+from benchmarks.utils import create_tables, setup_django  # noqa: E402
+
+
+def configure(path, pool_size, checkout_timeout):
+    setup_django()
+    settings.DATABASES['default'].update({
+        'ENGINE': 'common.db.backends.sqlite3',
+        'NAME': path,
+        'CONN_MAX_AGE': 0,
+        'POOL': {'MAX_SIZE': pool_size, 'CHECKOUT_TIMEOUT': checkout_timeout},
+        'PRAGMAS': {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'busy_timeout': 5000},
+    })
+
+
+def check_leaks(pool_size):
+    """
+    Run 3 x `pool_size` queries which do not close their connection, in tasks of a GreenletExecutor (which closes
+    them after every task), then in bare greenlets (whose connections are reclaimed by the pool once they end).
+
+    :return: the failed checks
+    """
+    from django.db import connection
+
+    from benchmarks.models import Event
+    from common.db.pool import get_pool
+    from common.executors import GreenletExecutor
+
+    def query():
+        Event.objects.filter(score=0).count()
+
+    errors = []
+    executor = GreenletExecutor('db_pool_check', pool_size=pool_size * 3)
+    for _ in range(pool_size * 3):
+        executor.submit(query)
+    executor.shutdown(timeout=30)
+    pool = get_pool(connection.alias)
+    if executor.failed or executor.completed != pool_size * 3:
+        errors.append('executor|completed=%s,failed=%s' % (executor.completed, executor.failed))
+    if pool.stats()['in_use']:
+        errors.append('executor|in_use=%s' % pool.stats()['in_use'])
+
+    greenlets = [gevent.spawn(query) for _ in range(pool_size * 3)]
+    gevent.joinall(greenlets)
+    failed = [greenlet.exception for greenlet in greenlets if greenlet.exception is not None]
+    if failed:
+        errors.append('greenlets|failed=%s|%r' % (len(failed), failed[0]))
+    if not pool.stats()['reclaimed']:
+        errors.append('greenlets|nothing reclaimed')
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.db_pool')
+    parser.add_argument('--greenlets', type=int, default=200)
+    parser.add_argument('--queries', type=int, default=20, help='queries per greenlet')
+    parser.add_argument('--pool-size', type=int, default=4)
+    parser.add_argument('--checkout-timeout', type=float, default=10)
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp()
+    configure(os.path.join(folder, 'db.sqlite3'), args.pool_size, args.checkout_timeout)
+
+    from django.db import close_old_connections, connection
+
+    from benchmarks.models import Event
+    from common.db.pool import get_pools_stats
+
+    create_tables(Event)
+    connection.close()
+
+    failed_checks = check_leaks(args.pool_size)
+    for error in failed_checks:
+        print(error)
+    print('%s check(s) failed' % len(failed_checks))
+
+    errors = []
+
+    def request(i):
+        try:
+            for j in range(args.queries):
+                if j % 5 == 0:
+                    Event.objects.create(name='greenlet %s' % i, created_at='2020-01-01 00:00:00Z')
+                else:
+                    Event.objects.filter(score=0).count()
+                # Let the other greenlets run, as network I/O would
+                gevent.sleep(0)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            # Same as the request_finished signal
+            close_old_connections()
+            connection.close()
+
+    start = time.time()
+    gevent.joinall([gevent.spawn(request, i) for i in range(args.greenlets)])
+    elapsed = time.time() - start
+
+    print('greenlets=%s, queries=%s, elapsed=%.2fs, errors=%s' % (
+        args.greenlets, args.greenlets * args.queries, elapsed, len(errors)))
+    for error in errors[:5]:
+        print('  %r' % error)
+    print(get_pools_stats())
+    shutil.rmtree(folder)
+    return 1 if failed_checks else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+Per-request overhead of the serializer validation wrapper of BaseAPIView, before and after the dispatch plans
+computed by SerializerValidationMeta.
+
+    python -m benchmarks.dispatch_plan
+"""
+from benchmarks.utils import measure, setup_django
+
+setup_django()
+
+from rest_framework import exceptions, serializers  # noqa: E402
+from rest_framework.response import Response  # noqa: E402
+from rest_framework.test import APIRequestFactory  # noqa: E402
+
+from benchmarks.models import Event  # noqa: E402
+from common.exceptions import InvalidParameters  # noqa: E402
+from common.views import BaseAPIView, HTTP_METHOD_SERIALIZER_CLASS_NAME_FORMAT, format_errors  # noqa: E402
+
+
+def legacy_validate_serializer_wrapper(method, _func):
+    """
+    The wrapper as it was before the dispatch plans, kept for comparison.
+    """
+
+    def inner(self, request, *args, **kwargs):
+        serializer_class_name = HTTP_METHOD_SERIALIZER_CLASS_NAME_FORMAT % method.lower()
+        if hasattr(self, serializer_class_name):
+            serializer_class = getattr(self, serializer_class_name)
+            if serializer_class is None:
+                return _func(self, request, None, *args, **kwargs)
+        else:
+            try:
+                serializer_class = self.get_serializer_class()
+            except (AssertionError, AttributeError):
+                if method.lower() == 'get':
+                    return _func(self, request, None, *args, **kwargs)
+                raise exceptions.APIException(
+                    'For http method, you must define a serializer class which is used to validate the input data.'
+                )
+
+        if method == 'get':
+            serializer = serializer_class(data=request.query_params)
+        else:
+            serializer = serializer_class(data=request.data)
+
+        if not serializer.is_valid():
+            raise InvalidParameters(detail=format_errors(serializer.errors))
+
+        return _func(self, request, serializer, *args, **kwargs)
+
+    return inner
+
+
+class EmptySerializer(serializers.Serializer):
+    pass
+
+
+class QuerySerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=64)
+    page_size = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+
+class EventSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Event
+        fields = ('name', 'score')
+        extra_kwargs = {'score': {'required': False}}
+
+
+def get(self, request, serializer):
+    return Response({})
+
+
+def make_views(**attrs):
+    attrs = dict(attrs, access_log_sample_rate=0, get=get)
+    planned = type('PlannedView', (BaseAPIView,), dict(attrs))
+    legacy = type('LegacyView', (BaseAPIView,), dict(attrs))
+    legacy.get = legacy_validate_serializer_wrapper('get', get)
+    return planned, legacy
+
+
+CASES = [
+    ('skip validation', {'http_method_get_serializer_class': None}),
+    ('empty serializer', {'http_method_get_serializer_class': EmptySerializer}),
+    ('empty serializer, serializer_class', {'serializer_class': EmptySerializer}),
+    ('serializer', {'http_method_get_serializer_class': QuerySerializer}),
+    ('model serializer', {'http_method_get_serializer_class': EventSerializer}),
+    ('model serializer, fast_validation', {'http_method_get_serializer_class': EventSerializer,
+                                           'fast_validation': True}),
+]
+
+
+def run(number=2000):
+    factory = APIRequestFactory()
+    results = []
+    for name, attrs in CASES:
+        planned, legacy = make_views(**attrs)
+        timings = {}
+        for label, view_cls in (('before', legacy), ('after', planned)):
+            view = view_cls()
+            request = view.initialize_request(factory.get('/', {'name': 'benchmark'}))
+            view.request = request
+            timings[label] = measure(lambda: view.get(request), number=number, repeat=7)
+        results.append((name, timings['before'], timings['after']))
+    return results
+
+
+def main():
+    print('%-36s %12s %12s' % ('case', 'before (us)', 'after (us)'))
+    for name, before, after in run():
+        print('%-36s %12.2f %12.2f' % (name, before, after))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Cost of `common.exceptions.exception_handler` under a burst of bad requests, before and after the traceback is
+formatted lazily and the repeated errors are rate limited.
+
+    python -m benchmarks.exception_handler
+"""
+from benchmarks.utils import measure, setup_django
+
+setup_django()
+
+import logging  # noqa: E402
+import traceback  # noqa: E402
+
+from rest_framework.exceptions import NotAuthenticated  # noqa: E402
+from rest_framework.views import exception_handler as rest_exception_handler  # noqa: E402
+
+from common.exceptions import BaseAPIBusinessError, InvalidParameters, exception_handler  # noqa: E402
+
+logger = logging.getLogger('main')
+
+
+def legacy_exception_handler(exc, context=None):
+    """
+    The business error path of the handler as it was before, kept for comparison.
+    """
+    message = traceback.format_exc()
+    response = rest_exception_handler(exc, context)
+    if response is not None and isinstance(exc, BaseAPIBusinessError):
+        logger.warning(message)
+        response.data['error_code'] = response.data['detail'].code
+    return response
+
+
+def raise_and_handle(handler, exc_class):
+    def func():
+        try:
+            raise exc_class()
+        except Exception as exc:
+            handler(exc, {})
+
+    return func
+
+
+def run(number=5000):
+    results = []
+    for exc_class in (NotAuthenticated, InvalidParameters):
+        before = measure(raise_and_handle(legacy_exception_handler, exc_class), number=number)
+        after = measure(raise_and_handle(exception_handler, exc_class), number=number)
+        results.append((exc_class.__name__, before, after))
+    return results
+
+
+def main():
+    print('%-36s %12s %12s' % ('exception', 'before (us)', 'after (us)'))
+    for name, before, after in run():
+        print('%-36s %12.2f %12.2f' % (name, before, after))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Check the properties of `common.ids`: the characters of the tokens are uniformly distributed, the sortable ids of
+concurrent threads are unique and increasing per thread, and their base62 strings sort like the numbers. Exit with 1
+if a check fails. The speed is compared with the previous helpers by `python -m benchmarks --filter ids`.
+
+    python -m benchmarks.ids
+"""
+import sys
+
+from benchmarks.utils import setup_django
+
+setup_django()
+
+import threading  # noqa: E402
+from collections import Counter  # noqa: E402
+
+from common import ids  # noqa: E402
+
+TOKEN_CHARS = 1000000
+THREADS = 8
+IDS_PER_THREAD = 50000
+
+
+def check_distribution(alphabet):
+    counts = Counter(''.join(ids.random_tokens(TOKEN_CHARS // 100, 100, alphabet)))
+    expected = TOKEN_CHARS / len(alphabet)
+    chi_square = sum((counts.get(char, 0) - expected) ** 2 / expected for char in set(alphabet))
+    # degrees of freedom + 5 standard deviations: a biased mapping (e.g. byte % 62) is far above
+    freedom = len(set(alphabet)) - 1
+    limit = freedom + 5 * (2 * freedom) ** 0.5
+    if chi_square > limit:
+        return ['distribution|%s|chi_square=%.1f|limit=%.1f' % (alphabet, chi_square, limit)]
+    return []
+
+
+def check_sortable_ids():
+    results = [None] * THREADS
+
+    def generate(index):
+        results[index] = [ids.next_id() for _ in range(IDS_PER_THREAD)]
+
+    threads = [threading.Thread(target=generate, args=(index,)) for index in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    errors = []
+    all_ids = [value for values in results for value in values]
+    if len(set(all_ids)) != len(all_ids):
+        errors.append('unique|%s duplicate(s)' % (len(all_ids) - len(set(all_ids))))
+    for index, values in enumerate(results):
+        if any(a >= b for a, b in zip(values, values[1:])):
+            errors.append('increasing|thread=%s' % index)
+    if max(all_ids).bit_length() > 63:
+        errors.append('bits|%s' % max(all_ids).bit_length())
+
+    sample = sorted(all_ids[::97] + [0, 1, 2 ** 63 - 1, 2 ** 64 - 1])
+    strings = [ids.encode_base62(value) for value in sample]
+    if strings != sorted(strings) or len({len(string) for string in strings}) != 1:
+        errors.append('base62|order')
+    if [ids.decode_base62(string) for string in strings] != sample:
+        errors.append('base62|round trip')
+    return errors
+
+
+def main():
+    errors = check_distribution(ids.ALPHANUMERIC) + check_distribution(ids.DIGITS) + check_sortable_ids()
+    for error in errors:
+        print(error)
+    print('%s check(s) failed' % len(errors))
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""
+Check that `common.json_engine` gives the same output with orjson and the standard library, and with REST
+framework's renderer and parser, then compare their speed. Exit with 1 if an output differs.
+
+    python -m benchmarks.json_engine
+"""
+import sys
+
+from benchmarks.utils import measure, setup_django
+
+setup_django()
+
+import datetime  # noqa: E402
+import decimal  # noqa: E402
+import io  # noqa: E402
+import uuid  # noqa: E402
+from collections import OrderedDict  # noqa: E402
+
+import pytz  # noqa: E402
+from django.utils.translation import gettext_lazy  # noqa: E402
+from rest_framework import parsers, renderers  # noqa: E402
+
+from common import json_engine  # noqa: E402
+from common.parsers import JSONParser  # noqa: E402
+from common.renderers import JSONRenderer  # noqa: E402
+
+SAMPLES = OrderedDict([
+    ('scalars', {'int': 1, 'big': 2 ** 70 + 1, 'negative_big': -2 ** 63 - 1, 'float': 1.5, 'bool': True, 'none': None,
+                 'str': 'tiếng việt  '}),
+    ('decimal', {'price': decimal.Decimal('10.50'), 'zero': decimal.Decimal('0E-8')}),
+    ('datetime', {
+        'aware': datetime.datetime(2020, 1, 2, 3, 4, 5, 678901, tzinfo=pytz.utc),
+        'local': pytz.timezone('Asia/Ho_Chi_Minh').localize(datetime.datetime(2020, 1, 2, 3, 4, 5)),
+        'naive': datetime.datetime(2020, 1, 2, 3, 4, 5, 6),
+        'date': datetime.date(2020, 1, 2),
+        'time': datetime.time(3, 4, 5, 123456),
+        'timedelta': datetime.timedelta(days=1, seconds=5),
+    }),
+    ('uuid', {'id': uuid.UUID('12345678-1234-5678-1234-567812345678')}),
+    ('lazy', {'detail': gettext_lazy('Invalid parameters.')}),
+    ('nested', OrderedDict([('b', [1, (2, 3), {'c': [{}]}]), ('a', {1: 'int key'})])),
+    ('long_digits', {'phone': '0' * 25, 'ids': [2 ** 64 - 1, 2 ** 64, 10 ** 30 + 7]}),
+    ('page', {'data': [
+        OrderedDict([('id', i), ('name', 'item %s' % i), ('score', decimal.Decimal(i) / 3),
+                     ('created_at', datetime.datetime(2020, 1, 1, tzinfo=pytz.utc) + datetime.timedelta(seconds=i))])
+        for i in range(100)
+    ], 'has_next': True}),
+])
+
+
+def check_outputs():
+    errors = []
+    for name, sample in SAMPLES.items():
+        outputs = {engine: json_engine.dumps(sample, engine=engine)
+                   for engine in (json_engine.ENGINE_ORJSON, json_engine.ENGINE_JSON)}
+        if len(set(outputs.values())) != 1:
+            errors.append('dumps|%s|%s' % (name, outputs))
+
+        rendered = (JSONRenderer().render(sample), renderers.JSONRenderer().render(sample))
+        if rendered[0] != rendered[1]:
+            errors.append('render|%s|%s' % (name, rendered))
+
+        parsed = (JSONParser().parse(io.BytesIO(rendered[1])), parsers.JSONParser().parse(io.BytesIO(rendered[1])))
+        if parsed[0] != parsed[1]:
+            errors.append('parse|%s|%s' % (name, parsed))
+    return errors
+
+
+def main():
+    if json_engine.orjson is None:
+        print('orjson is not installed, nothing to compare')
+        return 0
+
+    errors = check_outputs()
+    for error in errors:
+        print(error)
+    print('%s output(s) differ' % len(errors))
+
+    page = SAMPLES['page']
+    body = renderers.JSONRenderer().render(page)
+    fast, default = JSONRenderer(), renderers.JSONRenderer()
+    print('%-36s %12s %12s' % ('case', 'json (us)', 'orjson (us)'))
+    print('%-36s %12.2f %12.2f' % (
+        'dumps', measure(lambda: json_engine.dumps(page, engine=json_engine.ENGINE_JSON)),
+        measure(lambda: json_engine.dumps(page))))
+    print('%-36s %12.2f %12.2f' % ('render', measure(lambda: default.render(page)), measure(lambda: fast.render(page))))
+    print('%-36s %12.2f %12.2f' % (
+        'parse', measure(lambda: parsers.JSONParser().parse(io.BytesIO(body))),
+        measure(lambda: JSONParser().parse(io.BytesIO(body)))))
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
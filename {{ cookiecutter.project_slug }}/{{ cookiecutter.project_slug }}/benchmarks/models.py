@@ -0,0 +1,11 @@
+from django.db import models
+
+
+class Event(models.Model):
+    name = models.CharField(max_length=64)
+    score = models.IntegerField(default=0)
+    created_at = models.DateTimeField(db_index=True)
+    attachment = models.FileField(blank=True, default='')
+
+    class Meta:
+        app_label = 'benchmarks'
@@ -0,0 +1,43 @@
+"""
+Settings used by the benchmarks: no network, no file, an in-memory SQLite database.
+"""
+SECRET_KEY = 'benchmarks'
+DEBUG = False
+ALLOWED_HOSTS = ['testserver']
+
+INSTALLED_APPS = [
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'rest_framework',
+    'benchmarks',
+]
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+}
+
+ROOT_URLCONF = 'benchmarks.urls'
+
+TIME_ZONE = 'Asia/Ho_Chi_Minh'
+USE_I18N = False
+USE_TZ = True
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'null': {
+            'class': 'logging.NullHandler',
+        },
+    },
+    'loggers': {
+        'main': {
+            'handlers': ['null'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
@@ -0,0 +1,119 @@
+import datetime
+import json
+import platform
+import re
+import statistics
+import time
+from collections import OrderedDict
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name, number=1000, repeat=5):
+    """
+    Register a benchmark case. The decorated function prepares the case and yields the callable which is timed, the
+    code after the `yield` cleans up:
+
+        @benchmark('random_string')
+        def random_string_case():
+            yield lambda: random_string(32)
+
+    :param name: unique, used as the key of the results
+    :param number: calls per run
+    :param repeat: runs, the best and the median run are reported
+    """
+
+    def decorator(func):
+        if name in BENCHMARKS:
+            raise ValueError('Benchmark %s is already registered.' % name)
+        BENCHMARKS[name] = (func, number, repeat)
+        return func
+
+    return decorator
+
+
+def time_calls(func, number, repeat):
+    """
+    :return: list of the times of one call of `func`, in microseconds, one per run
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number * 1000000)
+    return timings
+
+
+def run_benchmarks(pattern=None, scale=1.0, report=None):
+    """
+    :param pattern: regular expression, only the benchmarks whose name matches are run
+    :param scale: multiply the number of calls of every benchmark, e.g. 0.1 for a quick run
+    :param report: called with (name, result) after every benchmark
+    :return: {name: {'best_us', 'median_us', 'number', 'repeat'}}
+    """
+    results = OrderedDict()
+    for name, (func, number, repeat) in BENCHMARKS.items():
+        if pattern and not re.search(pattern, name):
+            continue
+        number = max(int(number * scale), 1)
+        case = func()
+        try:
+            timings = time_calls(next(case), number, repeat)
+        finally:
+            case.close()
+        results[name] = OrderedDict([
+            ('best_us', round(min(timings), 3)),
+            ('median_us', round(statistics.median(timings), 3)),
+            ('number', number),
+            ('repeat', repeat),
+        ])
+        if report:
+            report(name, results[name])
+    return results
+
+
+def get_environment():
+    import django
+    import rest_framework
+
+    return OrderedDict([
+        ('python', platform.python_version()),
+        ('implementation', platform.python_implementation()),
+        ('django', django.get_version()),
+        ('rest_framework', rest_framework.VERSION),
+        ('machine', platform.machine()),
+        ('platform', platform.platform()),
+        ('created_at', datetime.datetime.utcnow().replace(microsecond=0).isoformat() + 'Z'),
+    ])
+
+
+def save_results(results, path):
+    with open(path, 'w') as f:
+        json.dump(OrderedDict([('environment', get_environment()), ('results', results)]), f, indent=2)
+        f.write('\n')
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+def compare_results(results, baseline, threshold):
+    """
+    Compare the best times of `results` with those of `baseline`.
+
+    :param results:
+    :param baseline: results of a previous run
+    :param threshold: ratio, e.g. 0.2: a benchmark more than 20% slower than its baseline is a regression
+    :return: list of (name, baseline best_us or None, best_us, ratio or None, is_regression)
+    """
+    comparison = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or not base['best_us']:
+            comparison.append((name, None, result['best_us'], None, False))
+            continue
+        ratio = result['best_us'] / base['best_us']
+        comparison.append((name, base['best_us'], result['best_us'], ratio, ratio > 1 + threshold))
+    return comparison
@@ -0,0 +1,94 @@
+"""
+Check that the batch timestamp conversions of common.utils give exactly the output of the datetime helpers, value by
+value, then compare their speed on a page of events. Exit with 1 if an output differs.
+
+    python -m benchmarks.timestamps
+"""
+import sys
+
+from benchmarks.utils import measure, setup_django
+
+setup_django()
+
+import datetime  # noqa: E402
+
+import pytz  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from common import utils  # noqa: E402
+
+TIME_ZONES = ('UTC', 'Asia/Ho_Chi_Minh', 'America/New_York', 'Australia/Lord_Howe')
+ROWS = 500
+
+
+def get_datetimes():
+    values = [None]
+    for name in TIME_ZONES:
+        tz = pytz.timezone(name)
+        for naive in (datetime.datetime(1969, 12, 31, 23, 59, 59, 500000), datetime.datetime(1970, 1, 1),
+                      datetime.datetime(2020, 3, 8, 1, 59, 59, 999999), datetime.datetime(2020, 11, 1, 1, 30),
+                      datetime.datetime(2038, 1, 19, 3, 14, 8, 1), datetime.datetime(9000, 6, 1, 12, 0, 0, 999999)):
+            values.append(tz.localize(naive))
+    start = datetime.datetime(2020, 1, 1, tzinfo=pytz.utc)
+    values += [start + datetime.timedelta(seconds=i * 3607.123457) for i in range(1000)]
+    return values
+
+
+def get_unix_times():
+    values = [None, 0, 1, -1, 999, -1500, 1.5, 1577836800123, 1583650799999, 1604208600000, 253402214399999]
+    values += [1577836800000 + i * 3607123 for i in range(1000)]
+    # across the DST transitions of 2020 in America/New_York and Australia/Lord_Howe, every 7 minutes
+    for start in (1583600000000, 1585972800000, 1601740800000, 1604150000000):
+        values += [start + i * 420000 for i in range(500)]
+    return values
+
+
+def get_page_datetimes(count):
+    start = datetime.datetime(2020, 1, 1, tzinfo=pytz.utc)
+    return [start + datetime.timedelta(seconds=i * 61.5) for i in range(count)]
+
+
+def check_outputs():
+    errors = []
+    datetimes = get_datetimes()
+    for name, helper, batch in (('unix_ms', utils.datetime_to_utc_unix_ms, utils.datetimes_to_utc_unix_ms),
+                                ('unix', utils.datetime_to_utc_unix, utils.datetimes_to_utc_unix)):
+        expected = [helper(value) for value in datetimes]
+        if batch(datetimes) != expected:
+            errors.append('%s|%s' % (name, [(value, result) for value, result in zip(datetimes, batch(datetimes))
+                                            if result != helper(value)][:5]))
+
+    unix_times = get_unix_times()
+    for name in TIME_ZONES:
+        with timezone.override(pytz.timezone(name)):
+            expected = [utils.utc_unix_to_current_datetime(value) for value in unix_times]
+            results = utils.utc_unix_to_current_datetimes(unix_times)
+        # the same instant is not enough: the same wall clock and offset
+        if [(value, value and value.utcoffset()) for value in results] != \
+                [(value, value and value.utcoffset()) for value in expected]:
+            errors.append('datetime|%s' % name)
+    return errors
+
+
+def main():
+    errors = check_outputs()
+    for error in errors:
+        print(error)
+    print('%s output(s) differ' % len(errors))
+
+    datetimes = get_page_datetimes(ROWS)
+    unix_times = utils.datetimes_to_utc_unix_ms(datetimes)
+    print('%-36s %12s %12s' % ('case (%s values)' % ROWS, 'helper (us)', 'batch (us)'))
+    print('%-36s %12.2f %12.2f' % (
+        'datetime_to_utc_unix_ms', measure(lambda: [utils.datetime_to_utc_unix_ms(value) for value in datetimes], 100),
+        measure(lambda: utils.datetimes_to_utc_unix_ms(datetimes), 100)))
+    with timezone.override(pytz.timezone('Asia/Ho_Chi_Minh')):
+        print('%-36s %12.2f %12.2f' % (
+            'utc_unix_to_current_datetime',
+            measure(lambda: [utils.utc_unix_to_current_datetime(value) for value in unix_times], 100),
+            measure(lambda: utils.utc_unix_to_current_datetimes(unix_times), 100)))
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,31 @@
+import os
+import time
+
+import django
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    django.setup()
+
+
+def create_tables(*model_classes):
+    from django.db import connection
+
+    with connection.schema_editor() as schema_editor:
+        for model_cls in model_classes:
+            schema_editor.create_model(model_cls)
+
+
+def measure(func, number=1000, repeat=5):
+    """
+    :return: the best time of one call of `func` over `repeat` runs of `number` calls, in microseconds
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = (time.perf_counter() - start) / number
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000000
@@ -0,0 +1,213 @@
+import json
+import logging
+import random
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.datastructures import MultiValueDict
+
+from common.sql_log import QueryRecorder
+
+TRUNCATED = '...'
+REDACTED = '***'
+DEFAULT_BODY_BUDGET = 4096
+
+logger = logging.getLogger('main')
+
+
+def get_access_log_setting(name, default=None):
+    return getattr(settings, 'ACCESS_LOG', {}).get(name, default)
+
+
+def exceeds_budget(obj, budget):
+    """
+    Walk `obj` and add up a lower bound of the size of its JSON encoding, stop as soon as it exceeds `budget`.
+    Every visited value adds at least 1 to the bound, so the walk costs O(budget) whatever the size of `obj`.
+    """
+    size = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if isinstance(o, str):
+            size += len(o) + 2
+        elif isinstance(o, dict):
+            # {"k": v, ...}: at least the braces, the quotes and ': ' per item
+            size += 2 + 4 * len(o)
+            if size > budget:
+                return True
+            for key, value in o.items():
+                size += len(key) if isinstance(key, str) else 1
+                stack.append(value)
+        elif isinstance(o, (list, tuple)):
+            # [v, ...]: at least the brackets and ', ' between items
+            size += 2 * len(o)
+            if size > budget:
+                return True
+            stack.extend(o)
+        else:
+            size += 1
+        if size > budget:
+            return True
+    return False
+
+
+def encode_capped(obj, budget=DEFAULT_BODY_BUDGET):
+    """
+    :param obj:
+    :param budget: maximum length of the result
+    :return: the JSON encoding of `obj`, or `...` if it is longer than `budget` or can not be encoded
+    """
+    if exceeds_budget(obj, budget):
+        return TRUNCATED
+    return encode_checked(obj, budget)
+
+
+def encode_checked(obj, budget):
+    """
+    `encode_capped` of an `obj` already checked with `exceeds_budget`.
+    """
+    try:
+        data = json.dumps(obj)
+    except (TypeError, ValueError):
+        return TRUNCATED
+    if len(data) > budget:
+        return TRUNCATED
+    return data
+
+
+def to_dict(obj):
+    """
+    :return: a QueryDict (query params, form data) as a dict, with a list of the values of a repeated key
+    """
+    if isinstance(obj, MultiValueDict):
+        return {key: values[0] if len(values) == 1 else values for key, values in obj.lists()}
+    return obj
+
+
+def redact(obj, fields):
+    """
+    Return a copy of `obj` where the values of the keys in `fields` are replaced, at any depth.
+    """
+    if isinstance(obj, dict):
+        return {k: REDACTED if k in fields else redact(v, fields) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [redact(v, fields) for v in obj]
+    return obj
+
+
+class AccessLogEntry(OrderedDict):
+    """
+    The structured fields of an access log line.
+    It is passed as the message argument and as `record.access_log`, so it is rendered only if the record is emitted
+    and formatters can output the fields as they want.
+    """
+
+    def __str__(self):
+        return ', '.join('%s=[%s]' % item for item in self.items())
+
+
+class AccessLogger:
+    """
+    Log one line per request, for a view with the attributes of `BaseAPIView`:
+
+        - access_log_sample_rate: the ratio of requests which are logged, ACCESS_LOG['SAMPLE_RATE'] by default
+        - access_log_status_sample_rates: {status code: ratio}, added to ACCESS_LOG['STATUS_SAMPLE_RATES']
+        - access_log_body: whether the query params, request data and response data are logged
+        - access_log_redact_fields: keys whose values are not logged, added to ACCESS_LOG['REDACT_FIELDS']
+        - access_log_sql: whether the queries are recorded, ACCESS_LOG['SQL'] by default
+
+    Bodies longer than ACCESS_LOG['BODY_BUDGET'] characters are logged as `...`; the encoder gives up as soon as it
+    knows the budget is exceeded instead of serializing the whole body.
+
+    The queries of a request are recorded by an execute wrapper (see `common.sql_log.QueryRecorder`), so it works
+    without DEBUG: their count, total time, the slowest one and the most repeated statement are added to the line.
+    A warning is logged, whatever the sampling, when a statement is repeated ACCESS_LOG['N_PLUS_ONE_THRESHOLD'] times
+    (likely an N+1 pattern), or when ACCESS_LOG['SQL_COUNT_THRESHOLD'] queries or ACCESS_LOG['SQL_TIME_THRESHOLD_MS']
+    are exceeded. A threshold set to None is not checked.
+    """
+
+    def __init__(self, view_cls):
+        self.sample_rate = view_cls.access_log_sample_rate
+        if self.sample_rate is None:
+            self.sample_rate = get_access_log_setting('SAMPLE_RATE', 1.0)
+        self.status_sample_rates = dict(get_access_log_setting('STATUS_SAMPLE_RATES', {}))
+        self.status_sample_rates.update(view_cls.access_log_status_sample_rates or {})
+        self.log_body = view_cls.access_log_body
+        self.redact_fields = frozenset(get_access_log_setting('REDACT_FIELDS', ())).union(
+            view_cls.access_log_redact_fields or ())
+        self.body_budget = get_access_log_setting('BODY_BUDGET', DEFAULT_BODY_BUDGET)
+        self.log_sql = view_cls.access_log_sql
+        if self.log_sql is None:
+            self.log_sql = get_access_log_setting('SQL', True)
+        self.n_plus_one_threshold = get_access_log_setting('N_PLUS_ONE_THRESHOLD', 10)
+        self.sql_count_threshold = get_access_log_setting('SQL_COUNT_THRESHOLD', 100)
+        self.sql_time_threshold = get_access_log_setting('SQL_TIME_THRESHOLD_MS', 1000)
+
+    def should_log(self, status_code):
+        if not logger.isEnabledFor(logging.INFO):
+            return False
+        rate = self.status_sample_rates.get(status_code, self.sample_rate)
+        return rate >= 1 or random.random() < rate
+
+    def encode_field(self, obj, field):
+        if not hasattr(obj, field):
+            return TRUNCATED
+        value = to_dict(getattr(obj, field))
+        if exceeds_budget(value, self.body_budget):
+            return TRUNCATED
+        if self.redact_fields:
+            value = redact(value, self.redact_fields)
+        return encode_checked(value, self.body_budget)
+
+    def get_query_recorder(self):
+        """
+        :return: QueryRecorder, or None if the queries are not recorded
+        """
+        return QueryRecorder() if self.log_sql else None
+
+    def get_sql_fields(self, view, request, recorder):
+        """
+        Log a warning if the queries recorded by `recorder` cross a threshold.
+
+        :return: the fields of the queries, for `log`
+        """
+        fields = recorder.get_fields()
+        reasons = []
+        if self.n_plus_one_threshold is not None and fields['sql_repeated'] >= self.n_plus_one_threshold:
+            reasons.append('n_plus_one')
+        if self.sql_count_threshold is not None and fields['sql_count'] > self.sql_count_threshold:
+            reasons.append('count')
+        if self.sql_time_threshold is not None and fields['sql_ms'] > self.sql_time_threshold:
+            reasons.append('time')
+        if reasons:
+            logger.warning('sql|%s|view=%s,method=%s,path=%s,count=%s,time_ms=%s,repeated=%s|%s',
+                           '+'.join(reasons), view.get_view_name(), request.method, request._request.path,
+                           fields['sql_count'], fields['sql_ms'], fields['sql_repeated'],
+                           fields['sql_repeated_template'] or fields['sql_slowest'])
+        return fields
+
+    def log(self, view, request, response, duration, **extra_fields):
+        """
+        :param view:
+        :param request: the REST framework request
+        :param response:
+        :param duration: in milliseconds
+        :param extra_fields: added to the line
+        """
+        if not self.should_log(response.status_code):
+            return
+
+        entry = AccessLogEntry()
+        entry['view'] = view.get_view_name()
+        entry['uri'] = request._request.build_absolute_uri(request._request.get_full_path())
+        entry['user'] = request.user
+        entry['method'] = request.method
+        entry['duration_ms'] = duration
+        entry['response_status'] = response.status_code
+        entry.update(extra_fields)
+        if self.log_body:
+            entry['query_params'] = self.encode_field(request, 'query_params')
+            entry['data'] = self.encode_field(request, 'data')
+            entry['response_content'] = self.encode_field(response, 'data')
+
+        logger.info('ACCESS_LOG|%s', entry, extra={'access_log': entry})
@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+
+
+class CommonConfig(AppConfig):
+    name = 'common'
+
+    def ready(self):
+        from common.invalidation import check_invalidation_cache, watch_models
+
+        # the generations must be bumped by every process, before it handles a request
+        watch_models()
+        check_invalidation_cache()
@@ -0,0 +1,191 @@
+import logging
+from collections import OrderedDict
+
+from django.db import connections, router, transaction
+from django.db.models import Case, Expression, F, Q, Value, When
+
+from common.exceptions import OptimisticConcurrencyControlFailed
+from common.field_plans import compute_changes, get_field_plan
+from common.invalidation import bump_model_generation_on_commit
+from common.utils import update_instance
+
+DEFAULT_VERSION_FIELD = 'version'
+DEFAULT_BATCH_SIZE = 500
+
+logger = logging.getLogger('main')
+
+
+class _VersionMismatch(Exception):
+    pass
+
+
+def get_version_field(model_cls, version_field):
+    if not version_field or version_field not in get_field_plan(model_cls).getters:
+        return None
+    return model_cls._meta.get_field(version_field)
+
+
+def get_auto_now_fields(model_cls):
+    return [f for f in model_cls._meta.concrete_fields if getattr(f, 'auto_now', False)]
+
+
+def _get_value(instance, field):
+    value = getattr(instance, field.attname)
+    if not isinstance(value, Expression):
+        value = Value(value, output_field=field)
+    return value
+
+
+def _update_versioned(model_cls, rows, fields, version_field, db):
+    """
+    UPDATE ... SET field = CASE WHEN pk = ... END, version = version + 1 WHERE (pk = ... AND version = ...) OR ...
+
+    :return: number of updated rows
+    """
+    condition = Q()
+    for instance, version in rows:
+        condition |= Q(pk=instance.pk, **{version_field.attname: version})
+
+    values = {}
+    for field in fields:
+        if len(rows) == 1:
+            values[field.attname] = _get_value(rows[0][0], field)
+        else:
+            values[field.attname] = Case(
+                *[When(pk=instance.pk, then=_get_value(instance, field)) for instance, _ in rows],
+                output_field=field
+            )
+    values[version_field.attname] = F(version_field.attname) + 1
+    return model_cls._base_manager.using(db).filter(condition).update(**values)
+
+
+def get_versioned_batch_size(fields, rows, batch_size, db):
+    """
+    :return: `batch_size`, bounded by the query parameters limit of the database (999 on SQLite before 3.32): a row
+        binds its pk and version in the condition, and its pk and value in the CASE of every field
+    """
+    params = ['pk', 'pk'] + ['pk', 'pk'] * len(fields)
+    return max(min(batch_size, connections[db].ops.bulk_batch_size(params, rows)), 1)
+
+
+def _find_conflicts(versioned, version_field_name, db):
+    """
+    :param versioned: {model class: {pk: expected version}}
+    :return: ids of the rows whose version is not the expected one anymore, or which do not exist
+    """
+    conflicting_ids = []
+    for model_cls, expected in versioned.items():
+        current = dict(model_cls._base_manager.using(db).filter(pk__in=list(expected))
+                       .values_list('pk', version_field_name))
+        conflicting_ids.extend(pk for pk, version in expected.items() if current.get(pk) != version)
+    return conflicting_ids
+
+
+def bulk_update_instances(pairs, version_field=DEFAULT_VERSION_FIELD, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Write the changes of many instances with a few queries, instead of `get_diff`, `update_instance` and `save()`
+    per instance.
+
+    Only the changed concrete fields are written (plus the `auto_now` fields of changed rows). Rows are grouped by
+    model and changed fields, every group is written by batches of `batch_size` rows:
+
+        - with `QuerySet.bulk_update` if the model has no `version_field`
+        - with one conditional `UPDATE ... WHERE pk = %s AND version = %s OR ...` otherwise, which also increments
+          the version. If `input_data` contains the version, it must be the version of the instance.
+
+    Everything is written in one transaction: if the version of any row changed since it was loaded, nothing is
+    written and OptimisticConcurrencyControlFailed is raised with the `conflicting_ids`.
+
+    .. note::
+        As with `QuerySet.update`, no signal is sent. The generations of the updated models are bumped when the
+        transaction commits (see `common.invalidation`).
+
+    :param pairs: iterable of (instance, input_data), the instances must be saved in the same database
+    :param version_field: name of the version field, None to disable the version check
+    :param batch_size:
+    :return: the number of updated rows
+    :raise OptimisticConcurrencyControlFailed:
+    """
+    groups = OrderedDict()
+    versioned = OrderedDict()
+    stale_ids = []
+    applied = []
+    db = None
+
+    for instance, input_data in pairs:
+        model_cls = type(instance)
+        db = db or instance._state.db or router.db_for_write(model_cls, instance=instance)
+        plan = get_field_plan(model_cls)
+        version = get_version_field(model_cls, version_field)
+        pk_names = (model_cls._meta.pk.name, model_cls._meta.pk.attname)
+        input_data = {name: value for name, value in input_data.items()
+                      if (name in plan.getters or name in plan.attnames) and name not in pk_names}
+
+        if version is not None:
+            expected = getattr(instance, version.attname)
+            if input_data.pop(version.name, expected) != expected:
+                stale_ids.append(instance.pk)
+                continue
+
+        from_data, to_data, changes = compute_changes(instance, input_data)
+        if not changes:
+            continue
+
+        update_instance(instance, to_data)
+        applied.append((instance, from_data))
+        fields = []
+        for field in [model_cls._meta.get_field(name) for name in sorted(changes)] + get_auto_now_fields(model_cls):
+            if field in fields:
+                continue
+            if field.name not in changes and field.attname not in changes:
+                field.pre_save(instance, False)
+            elif field.is_relation and field.attname in changes and field.is_cached(instance):
+                # The related object was changed by its id
+                field.delete_cached_value(instance)
+            fields.append(field)
+
+        key = (model_cls, tuple(f.name for f in fields))
+        groups.setdefault(key, []).append((instance, None if version is None else expected))
+        if version is not None:
+            versioned.setdefault(model_cls, OrderedDict())[instance.pk] = expected
+
+    if stale_ids:
+        for instance, from_data in applied:
+            update_instance(instance, from_data)
+        raise OptimisticConcurrencyControlFailed(conflicting_ids=stale_ids)
+
+    updated = 0
+    try:
+        with transaction.atomic(using=db):
+            for (model_cls, field_names), rows in groups.items():
+                fields = [model_cls._meta.get_field(name) for name in field_names]
+                version = get_version_field(model_cls, version_field)
+                size = batch_size if version is None else get_versioned_batch_size(fields, rows, batch_size, db)
+                for start in range(0, len(rows), size):
+                    batch = rows[start:start + size]
+                    if version is None:
+                        model_cls._base_manager.using(db).bulk_update([i for i, _ in batch], field_names)
+                        updated += len(batch)
+                        continue
+                    count = _update_versioned(model_cls, batch, fields, version, db)
+                    if count != len(batch):
+                        raise _VersionMismatch()
+                    updated += count
+    except Exception as e:
+        for instance, from_data in applied:
+            update_instance(instance, from_data)
+        if not isinstance(e, _VersionMismatch):
+            raise
+        # The transaction is rolled back, the rows which do not have the expected version are the conflicts
+        conflicting_ids = _find_conflicts(versioned, version_field, db)
+        logger.warning('bulk_update_instances|conflict|ids=%s', conflicting_ids)
+        raise OptimisticConcurrencyControlFailed(conflicting_ids=conflicting_ids)
+
+    for (model_cls, _), rows in groups.items():
+        version = get_version_field(model_cls, version_field)
+        if version is not None:
+            for instance, expected in rows:
+                setattr(instance, version.attname, expected + 1)
+    for model_cls in {model_cls for model_cls, _ in groups}:
+        bump_model_generation_on_commit(model_cls, db)
+    return updated
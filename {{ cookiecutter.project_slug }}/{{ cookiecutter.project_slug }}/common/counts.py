@@ -0,0 +1,166 @@
+import hashlib
+import json
+import logging
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Model
+from django.utils.functional import cached_property
+
+from common.invalidation import get_invalidation_cache, get_model_generation, get_model_label, watch_model
+
+COUNT_CACHE_KEY_FORMAT = 'count:%s:%s:%s'
+
+logger = logging.getLogger('main')
+
+CountResult = namedtuple('CountResult', ['total', 'is_estimated'])
+
+
+class SearchOptionsJSONEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        if isinstance(o, Model):
+            return '%s:%s' % (get_model_label(o), o.pk)
+        if isinstance(o, (set, frozenset)):
+            return sorted(o, key=str)
+        return super(SearchOptionsJSONEncoder, self).default(o)
+
+
+def normalize_search_options(search_options):
+    """
+    :param search_options: filter kwargs
+    :return: a stable string for `search_options`, or None if they contain values which can not be compared
+        without hitting the database (querysets, expressions...)
+    """
+    try:
+        return json.dumps(search_options or {}, cls=SearchOptionsJSONEncoder, sort_keys=True, separators=(',', ':'))
+    except TypeError:
+        return None
+
+
+def _estimate_postgresql_count(queryset, cursor):
+    if not queryset.query.where:
+        cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+        return int(row[0]) if row and row[0] >= 0 else None
+    sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+    cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+    plan = cursor.fetchone()[0]
+    # psycopg2 decodes the json column
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def _estimate_mysql_count(queryset, cursor):
+    if not queryset.query.where:
+        cursor.execute(
+            'SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s',
+            [queryset.model._meta.db_table]
+        )
+        row = cursor.fetchone()
+        return int(row[0]) if row and row[0] is not None else None
+    sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+    cursor.execute('EXPLAIN ' + sql, params)
+    columns = [c[0].lower() for c in cursor.description]
+    row = dict(zip(columns, cursor.fetchone()))
+    return int((row.get('rows') or 0) * float(row.get('filtered') or 100) / 100)
+
+
+ESTIMATORS = {
+    'postgresql': _estimate_postgresql_count,
+    'mysql': _estimate_mysql_count,
+}
+
+
+def estimate_count(queryset):
+    """
+    Ask the database planner (or the table statistics for an unfiltered queryset) how many rows `queryset` returns.
+
+    :param queryset:
+    :return: the estimated number of rows, or None if the database does not provide estimates
+    """
+    connection = connections[queryset.db]
+    estimator = ESTIMATORS.get(connection.vendor)
+    if estimator is None:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            return estimator(queryset, cursor)
+    except Exception:
+        logger.exception('estimate_count|error|model=%s', get_model_label(queryset.model))
+        return None
+
+
+class CountStrategy:
+    """
+    Count the rows of a queryset, using in order:
+
+    1. A cached count, keyed by the model, its generation and the normalized search options. The generation changes
+       on post_save/post_delete of the model (see `common.invalidation`), the cache timeout bounds the staleness of
+       changes which do not send signals.
+    2. A planner estimate, if the database provides one and it is above `estimate_threshold`.
+    3. An exact `COUNT(*)`.
+    """
+
+    def __init__(self, cache_timeout=None, estimate_threshold=None):
+        self.cache_timeout = cache_timeout if cache_timeout is not None \
+            else getattr(settings, 'COUNT_CACHE_TIMEOUT', 60)
+        self.estimate_threshold = estimate_threshold if estimate_threshold is not None \
+            else getattr(settings, 'COUNT_ESTIMATE_THRESHOLD', None)
+
+    def get_cache_key(self, model_cls, search_options):
+        normalized = normalize_search_options(search_options)
+        if normalized is None or not self.cache_timeout:
+            return None
+        digest = hashlib.md5(normalized.encode('utf-8')).hexdigest()
+        return COUNT_CACHE_KEY_FORMAT % (get_model_label(model_cls), get_model_generation(model_cls), digest)
+
+    def count(self, queryset, search_options):
+        """
+        :param queryset:
+        :param search_options: the filter kwargs `queryset` was built with, they must fully describe its filters
+        :return: CountResult
+        """
+        watch_model(queryset.model)
+        cache_key = self.get_cache_key(queryset.model, search_options)
+        if cache_key:
+            cached = get_invalidation_cache().get(cache_key)
+            if cached is not None:
+                return CountResult(*cached)
+
+        result = self._count(queryset)
+        if cache_key:
+            get_invalidation_cache().set(cache_key, tuple(result), self.cache_timeout)
+        return result
+
+    def _count(self, queryset):
+        if self.estimate_threshold is not None:
+            estimated = estimate_count(queryset)
+            if estimated is not None and estimated >= self.estimate_threshold:
+                return CountResult(estimated, True)
+        return CountResult(queryset.count(), False)
+
+
+class CountStrategyPaginator(Paginator):
+    """
+    Paginator which gets its total from a `CountStrategy` instead of an exact `COUNT(*)`.
+
+    .. note::
+        When the total is estimated, `num_pages` is estimated too.
+    """
+
+    def __init__(self, object_list, per_page, search_options=None, count_strategy=None, **kwargs):
+        super(CountStrategyPaginator, self).__init__(object_list, per_page, **kwargs)
+        self.search_options = search_options or {}
+        self.count_strategy = count_strategy or CountStrategy()
+
+    @cached_property
+    def count_result(self):
+        return self.count_strategy.count(self.object_list, self.search_options)
+
+    @cached_property
+    def count(self):
+        return self.count_result.total
@@ -0,0 +1,3 @@
+"""
+Database backends with a connection pool, see `common.db.backends`.
+"""
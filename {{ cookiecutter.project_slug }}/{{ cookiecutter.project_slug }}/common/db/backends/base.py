@@ -0,0 +1,67 @@
+from functools import partial
+
+from common.db.pool import ConnectionPool, get_pool
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    Take the connections of a database wrapper from a ConnectionPool, configured by the POOL key of its settings:
+
+        DATABASES = {
+            'default': {
+                'ENGINE': 'common.db.backends.sqlite3',
+                ...
+                # the pool keeps the connections, Django gives them back at the end of every request
+                'CONN_MAX_AGE': 0,
+                'POOL': {
+                    'MAX_SIZE': 10,
+                    'CHECKOUT_TIMEOUT': 10,
+                    'MAX_AGE': 3600,
+                    'HEALTH_CHECK_INTERVAL': 30,
+                },
+            }
+        }
+
+    Under gevent every greenlet has its own database wrapper, so the pool bounds the number of connections of a
+    worker whatever the number of concurrent requests.
+
+    Without POOL, the wrapper behaves as the one of Django.
+    """
+    health_check_query = 'SELECT 1'
+
+    def is_pooled(self):
+        return bool(self.settings_dict.get('POOL'))
+
+    def create_connection(self, conn_params):
+        return super(PooledDatabaseWrapperMixin, self).get_new_connection(conn_params)
+
+    def check_connection(self, connection):
+        cursor = connection.cursor()
+        try:
+            cursor.execute(self.health_check_query)
+        finally:
+            cursor.close()
+
+    def create_pool(self, conn_params):
+        options = {key.lower(): value for key, value in self.settings_dict['POOL'].items()}
+        return ConnectionPool(self.alias, partial(self.create_connection, conn_params),
+                              health_check=self.check_connection, **options)
+
+    def get_new_connection(self, conn_params):
+        if not self.is_pooled():
+            return self.create_connection(conn_params)
+        return get_pool(self.alias, partial(self.create_pool, conn_params)).checkout()
+
+    def _close(self):
+        pool = get_pool(self.alias) if self.is_pooled() else None
+        if pool is None:
+            return super(PooledDatabaseWrapperMixin, self)._close()
+
+        reusable = not self.errors_occurred or self.is_usable()
+        if reusable and (self.in_atomic_block or not self.autocommit):
+            # Do not give a connection in a transaction to another request
+            try:
+                self.connection.rollback()
+            except Exception:
+                reusable = False
+        pool.checkin(self.connection, reusable=reusable)
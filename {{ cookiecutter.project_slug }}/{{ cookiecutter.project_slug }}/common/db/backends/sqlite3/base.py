@@ -0,0 +1,28 @@
+from django.db.backends.sqlite3 import base
+
+from common.db.backends.base import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    """
+    SQLite with a connection pool, and the PRAGMAS of its settings executed on every new connection, e.g.
+
+        'PRAGMAS': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'mmap_size': 256 * 1024 * 1024,
+            'cache_size': -64000,
+            'busy_timeout': 5000,
+        }
+
+    In-memory databases are not pooled.
+    """
+
+    def is_pooled(self):
+        return super(DatabaseWrapper, self).is_pooled() and not self.is_in_memory_db()
+
+    def create_connection(self, conn_params):
+        connection = super(DatabaseWrapper, self).create_connection(conn_params)
+        for name, value in (self.settings_dict.get('PRAGMAS') or {}).items():
+            connection.execute('PRAGMA %s = %s' % (name, value))
+        return connection
@@ -0,0 +1,256 @@
+import logging
+import os
+import threading
+import time
+import weakref
+
+from django.db.utils import OperationalError
+
+try:
+    import greenlet
+except ImportError:
+    greenlet = None
+
+logger = logging.getLogger('main')
+
+# seconds between two looks for the connections of dead owners, while waiting for a connection
+RECLAIM_INTERVAL = 1.0
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+def get_owner():
+    """
+    :return: the greenlet (spawned by gevent) or the thread running the caller
+    """
+    if greenlet is not None:
+        current = greenlet.getcurrent()
+        # the main greenlet of a thread lives as long as the thread
+        if current.parent is not None:
+            return current
+    return threading.current_thread()
+
+
+def is_alive(owner):
+    if owner is None:
+        return False
+    if isinstance(owner, threading.Thread):
+        return owner.is_alive()
+    return not owner.dead
+
+
+class PooledConnection:
+    __slots__ = ('connection', 'created_at', 'checked_at', 'owner')
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = self.checked_at = time.time()
+        self.owner = None
+
+    def set_owner(self):
+        self.owner = weakref.ref(get_owner())
+
+    def is_owner_alive(self):
+        return is_alive(self.owner and self.owner())
+
+
+class ConnectionPool:
+    """
+    At most `max_size` database connections, shared by the threads (or the greenlets when gevent has patched
+    threading) of a process.
+
+    `checkout` gives an idle connection, most recently used first, or opens a new one if there are less than
+    `max_size`, or waits up to `checkout_timeout` seconds for one to be checked in, then raises PoolTimeout.
+
+    A connection idle for more than `health_check_interval` seconds is checked with `health_check` before being
+    given, a connection older than `max_age` seconds is closed instead of being given.
+
+    A connection is checked out by a greenlet or a thread, its owner. When none is idle, the connections whose owner
+    has ended without checking them in (a greenlet which did not close its database connections) are closed and
+    their slots reused, with a warning: the code of the owner leaks connections.
+    """
+
+    def __init__(self, name, connect, max_size=10, checkout_timeout=10, max_age=3600, health_check_interval=30,
+                 health_check=None):
+        self.name = name
+        self.connect = connect
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.max_age = max_age
+        self.health_check_interval = health_check_interval
+        self.health_check = health_check
+        self._idle = []
+        self._in_use = {}
+        self._opening = 0
+        self._lock = threading.Condition(threading.Lock())
+        self.waiting = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.opened = 0
+        self.discarded = 0
+        self.reclaimed = 0
+        self.wait_max = 0.0
+
+    @property
+    def size(self):
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    def _is_expired(self, pooled, now):
+        return self.max_age and now - pooled.created_at > self.max_age
+
+    def _is_healthy(self, pooled, now):
+        if self.health_check is None or now - pooled.checked_at < self.health_check_interval:
+            return True
+        try:
+            self.health_check(pooled.connection)
+        except Exception:
+            return False
+        pooled.checked_at = now
+        return True
+
+    def _discard(self, connection):
+        self.discarded += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _reclaim(self):
+        """
+        Free the slots of the connections whose owner has ended, called with the lock held.
+
+        :return: the connections to close
+        """
+        dead = [key for key, pooled in self._in_use.items() if not pooled.is_owner_alive()]
+        connections = [self._in_use.pop(key).connection for key in dead]
+        if connections:
+            self.reclaimed += len(connections)
+            logger.warning('db_pool|reclaimed|name=%s,count=%s|connections of ended greenlets or threads, they must '
+                           'close their database connections', self.name, len(connections))
+        return connections
+
+    def checkout(self):
+        start = time.time()
+        deadline = start + self.checkout_timeout
+        reclaimed = []
+        try:
+            with self._lock:
+                while not self._idle and len(self._in_use) + self._opening >= self.max_size:
+                    reclaimed += self._reclaim()
+                    if len(self._in_use) + self._opening < self.max_size:
+                        break
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        logger.warning('db_pool|timeout|name=%s,max_size=%s', self.name, self.max_size)
+                        raise PoolTimeout('No connection available in the pool %s after %ss.' % (
+                            self.name, self.checkout_timeout))
+                    self.waiting += 1
+                    try:
+                        self._lock.wait(min(remaining, RECLAIM_INTERVAL))
+                    finally:
+                        self.waiting -= 1
+                self.checkouts += 1
+                self.wait_max = max(self.wait_max, time.time() - start)
+                if self._idle:
+                    pooled = self._idle.pop()
+                    pooled.set_owner()
+                    self._in_use[id(pooled.connection)] = pooled
+                else:
+                    pooled = None
+                    self._opening += 1
+        finally:
+            for connection in reclaimed:
+                self._discard(connection)
+
+        if pooled is not None:
+            now = time.time()
+            if not self._is_expired(pooled, now) and self._is_healthy(pooled, now):
+                return pooled.connection
+            with self._lock:
+                del self._in_use[id(pooled.connection)]
+                self._opening += 1
+            self._discard(pooled.connection)
+
+        # Connect outside of the lock, the slot is counted in `_opening`
+        try:
+            pooled = PooledConnection(self.connect())
+        except Exception:
+            with self._lock:
+                self._opening -= 1
+                self._lock.notify()
+            raise
+        pooled.set_owner()
+        with self._lock:
+            self._opening -= 1
+            self._in_use[id(pooled.connection)] = pooled
+            self.opened += 1
+        return pooled.connection
+
+    def checkin(self, connection, reusable=True):
+        """
+        :param connection: a connection given by `checkout`
+        :param reusable: False to close the connection instead of keeping it
+        """
+        with self._lock:
+            pooled = self._in_use.pop(id(connection), None)
+            if pooled is not None and reusable:
+                self._idle.append(pooled)
+            self._lock.notify()
+        if pooled is None or not reusable:
+            self._discard(connection)
+
+    def stats(self):
+        in_use = len(self._in_use) + self._opening
+        return {
+            'max_size': self.max_size,
+            'size': self.size,
+            'in_use': in_use,
+            'idle': len(self._idle),
+            'waiting': self.waiting,
+            'saturation': round(in_use / self.max_size, 2) if self.max_size else 0,
+            'checkouts': self.checkouts,
+            'timeouts': self.timeouts,
+            'opened': self.opened,
+            'discarded': self.discarded,
+            'reclaimed': self.reclaimed,
+            'wait_max_ms': int(self.wait_max * 1000),
+        }
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for pooled in idle:
+            self._discard(pooled.connection)
+
+
+_pools = {}
+_pools_pid = None
+
+
+def get_pool(alias, create=None):
+    """
+    :param alias: the alias of the database
+    :param create: called to build the pool of `alias` if the process does not have it yet
+    :return: ConnectionPool, or None
+    """
+    global _pools_pid
+    if _pools_pid != os.getpid():
+        # The connections of a parent process can not be used after a fork
+        _pools.clear()
+        _pools_pid = os.getpid()
+    pool = _pools.get(alias)
+    if pool is None and create is not None:
+        pool = _pools[alias] = create()
+    return pool
+
+
+def get_pools_stats():
+    return {alias: pool.stats() for alias, pool in _pools.items()} if _pools_pid == os.getpid() else {}
+
+
+def close_pools():
+    for pool in list(_pools.values()):
+        pool.close()
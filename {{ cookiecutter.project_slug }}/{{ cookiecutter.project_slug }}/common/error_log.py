@@ -0,0 +1,88 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from common.metrics import API_ERRORS
+
+
+def get_error_log_setting(name, default=None):
+    return getattr(settings, 'ERROR_LOG', {}).get(name, default)
+
+
+def get_origin(tb):
+    """
+    :return: (filename, line number, function name) of the frame where the exception was raised
+    """
+    if tb is None:
+        return None
+    while tb.tb_next is not None:
+        tb = tb.tb_next
+    code = tb.tb_frame.f_code
+    return code.co_filename, tb.tb_lineno, code.co_name
+
+
+class ErrorCounters:
+    """
+    Number of handled exceptions per error code, in the `api_errors_total` metric of all the workers, see
+    common.metrics.
+    """
+
+    def increment(self, error_code):
+        API_ERRORS.inc(error_code)
+
+
+class ErrorLogLimiter:
+    """
+    Decide which occurrences of an error are logged.
+
+    Occurrences are grouped by key, e.g. (error code, exception class, origin frame). In every `window` seconds, the
+    first `burst` occurrences of a key are logged, the others are only counted, and the count is reported with the
+    next logged occurrence. At most `max_keys` keys are tracked, the least recently seen are forgotten.
+    """
+
+    def __init__(self, window=None, burst=None, max_keys=None):
+        self.window = window if window is not None else get_error_log_setting('WINDOW', 60)
+        self.burst = burst if burst is not None else get_error_log_setting('BURST', 5)
+        self.max_keys = max_keys or get_error_log_setting('MAX_KEYS', 1000)
+        # key: [window start, logged in the window, suppressed since the last logged occurrence]
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key, now=None):
+        """
+        :return: (whether this occurrence should be logged, number of occurrences suppressed before it)
+        """
+        if not self.window:
+            return True, 0
+        now = now or time.time()
+        with self._lock:
+            state = self._keys.get(key)
+            if state is None:
+                if len(self._keys) >= self.max_keys:
+                    self._keys.popitem(last=False)
+                state = self._keys[key] = [now, 0, 0]
+            else:
+                self._keys.move_to_end(key)
+                if now - state[0] >= self.window:
+                    state[0], state[1] = now, 0
+
+            if state[1] >= self.burst:
+                state[2] += 1
+                return False, 0
+            state[1] += 1
+            suppressed, state[2] = state[2], 0
+            return True, suppressed
+
+
+error_counters = ErrorCounters()
+
+_limiter = None
+
+
+def get_error_log_limiter():
+    global _limiter
+    if _limiter is None:
+        _limiter = ErrorLogLimiter()
+    return _limiter
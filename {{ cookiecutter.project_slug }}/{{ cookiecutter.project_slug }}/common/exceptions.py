@@ -1,5 +1,4 @@
 import logging
-import traceback
 from collections import defaultdict
 
 from django.utils import six
@@ -10,9 +9,28 @@ from rest_framework.exceptions import APIException, NotAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import exception_handler as rest_exception_handler
 
+from common.error_log import error_counters, get_error_log_limiter, get_origin
+
 logger = logging.getLogger('main')
 
 
+def log_exception(level, exc, error_code):
+    """
+    Log `exc` with its traceback, unless the same error was logged too often recently (see ERROR_LOG).
+    The traceback is only formatted if the record is emitted.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    origin = get_origin(exc.__traceback__)
+    should_log, suppressed = get_error_log_limiter().acquire((error_code, exc.__class__, origin))
+    if not should_log:
+        return
+    filename, lineno, _ = origin or ('', 0, '')
+    logger.log(level, 'exception|code=%s,class=%s,origin=%s:%s,suppressed=%s|%s',
+               error_code, exc.__class__.__name__, filename, lineno, suppressed, exc,
+               exc_info=(exc.__class__, exc, exc.__traceback__))
+
+
 def exception_handler(exc, context=None):
     """
     Call REST framework's default exception handler first.
@@ -21,23 +39,25 @@ def exception_handler(exc, context=None):
     :param context:
     :return: Response or None
     """
-    message = traceback.format_exc()
     response = rest_exception_handler(exc, context)
 
     if response is not None and isinstance(exc, BaseAPIBusinessError):
-        logger.warning(message)
         response.data['error_code'] = response.data['detail'].code
+        error_counters.increment(response.data['error_code'])
+        log_exception(logging.WARNING, exc, response.data['error_code'])
         return response
 
     if response is not None and isinstance(exc, BaseAPISystemError):
-        logger.error(message)
         response.data['error_code'] = response.data['detail'].code
+        error_counters.increment(response.data['error_code'])
+        log_exception(logging.ERROR, exc, response.data['error_code'])
         return response
 
     if response is not None:
         return response
 
-    logger.error(message)
+    error_counters.increment(BaseAPISystemError.default_code)
+    log_exception(logging.ERROR, exc, BaseAPISystemError.default_code)
     return Response({
         'error_code': BaseAPISystemError.default_code,
         'detail': BaseAPISystemError.default_detail,
@@ -145,6 +165,11 @@ class OptimisticConcurrencyControlFailed(BaseAPISystemError):
     default_detail = 'Optimistic Concurrency Control failed.'
     default_code = 10
 
+    def __init__(self, detail=None, code=None, conflicting_ids=()):
+        super(OptimisticConcurrencyControlFailed, self).__init__(detail=detail, code=code)
+        # ids of the rows which were changed by someone else
+        self.conflicting_ids = list(conflicting_ids)
+
 
 @six.add_metaclass(APIExceptionMeta)
 class StubHTTPError(BaseAPISystemError):
@@ -165,6 +190,15 @@ class LoginFailed(BaseAPIBusinessError, NotAuthenticated):
     default_code = 30
 
 
+@six.add_metaclass(APIExceptionMeta)
+class AsyncTaskRejected(BaseAPISystemError):
+    """
+    The executor of asynchronous tasks is full.
+    """
+    default_detail = _('Too many pending tasks.')
+    default_code = 40
+
+
 @six.add_metaclass(APIExceptionMeta)
 class InvalidParameters(BaseAPIBusinessError):
     status_code = status.HTTP_400_BAD_REQUEST
@@ -176,3 +210,9 @@ class InvalidParameters(BaseAPIBusinessError):
 class ObjectNotFound(BaseAPIBusinessError):
     default_detail = _('Object not found.')
     default_code = 10001
+
+
+@six.add_metaclass(APIExceptionMeta)
+class FileTooLarge(BaseAPIBusinessError):
+    default_detail = _('File too large.')
+    default_code = 10002
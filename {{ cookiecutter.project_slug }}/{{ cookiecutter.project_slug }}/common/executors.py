@@ -0,0 +1,326 @@
+import atexit
+import importlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import gevent
+from django.conf import settings
+from django.db import connections
+from gevent import monkey
+from gevent.queue import Queue, Full
+
+from common.exceptions import AsyncTaskRejected
+from common.metrics import ASYNC_TASKS_IN_FLIGHT
+
+FULL_POLICY_BLOCK = 'block'
+FULL_POLICY_INLINE = 'inline'
+FULL_POLICY_REJECT = 'reject'
+FULL_POLICIES = (FULL_POLICY_BLOCK, FULL_POLICY_INLINE, FULL_POLICY_REJECT)
+
+MODE_GREENLET = 'greenlet'
+MODE_PROCESS = 'process'
+
+DEFAULT_EXECUTOR = 'default'
+
+logger = logging.getLogger('main')
+
+
+def close_task_connections():
+    """
+    Give the database connections of a finished task greenlet back to the pool, as at the end of a request. Without
+    the gevent patch of threading, the greenlets of a thread share its connections: they belong to the caller, which
+    may still use them. A connection inside an atomic block is never closed.
+    """
+    if not monkey.is_module_patched('threading'):
+        return
+    for connection in connections.all():
+        if not connection.in_atomic_block:
+            connection.close()
+
+
+class BaseExecutor:
+    """
+    Run tasks in the background with at most `queue_size` pending tasks.
+
+    When the queue is full, `full_policy` decides:
+        - block: wait up to `block_timeout` seconds for room, then reject
+        - inline: run the task in the caller
+        - reject: raise AsyncTaskRejected
+    """
+
+    def __init__(self, name, queue_size=1000, full_policy=FULL_POLICY_BLOCK, block_timeout=None):
+        if full_policy not in FULL_POLICIES:
+            raise ValueError('full_policy must be one of %s' % ', '.join(FULL_POLICIES))
+        self.name = name
+        self.queue_size = queue_size
+        self.full_policy = full_policy
+        self.block_timeout = block_timeout
+        self.shutting_down = False
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.inlined = 0
+        self.in_flight = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _reject(self, func):
+        self.rejected += 1
+        logger.warning('executor|rejected|name=%s,task=%s.%s', self.name, func.__module__, func.__name__)
+        raise AsyncTaskRejected()
+
+    def _run_inline(self, func, *args, **kwargs):
+        self.inlined += 1
+        func(*args, **kwargs)
+
+    def _record_wait(self, enqueued_at):
+        wait = time.time() - enqueued_at
+        self.wait_total += wait
+        if wait > self.wait_max:
+            self.wait_max = wait
+
+    def _start_task(self):
+        self.in_flight += 1
+        ASYNC_TASKS_IN_FLIGHT.inc(self.name)
+
+    def _finish_task(self):
+        self.in_flight -= 1
+        ASYNC_TASKS_IN_FLIGHT.dec(self.name)
+
+    def get_queue_depth(self):
+        raise NotImplementedError
+
+    def stats(self):
+        started = self.completed + self.in_flight
+        return {
+            'queue_depth': self.get_queue_depth(),
+            'in_flight': self.in_flight,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'inlined': self.inlined,
+            'wait_avg_ms': int(self.wait_total / started * 1000) if started else 0,
+            'wait_max_ms': int(self.wait_max * 1000),
+        }
+
+    def submit(self, func, *args, **kwargs):
+        raise NotImplementedError
+
+    def shutdown(self, timeout=None):
+        raise NotImplementedError
+
+
+class GreenletExecutor(BaseExecutor):
+    """
+    Run tasks in at most `pool_size` greenlets, spawned on demand.
+    """
+
+    def __init__(self, name, pool_size=100, **kwargs):
+        super(GreenletExecutor, self).__init__(name, **kwargs)
+        self.pool_size = pool_size
+        self._queue = Queue(maxsize=self.queue_size)
+        self._workers = set()
+        self._idle = 0
+
+    def get_queue_depth(self):
+        return self._queue.qsize()
+
+    def submit(self, func, *args, **kwargs):
+        if self.shutting_down:
+            self._reject(func)
+
+        item = (time.time(), func, args, kwargs)
+        try:
+            self._queue.put_nowait(item)
+        except Full:
+            if self.full_policy == FULL_POLICY_INLINE:
+                return self._run_inline(func, *args, **kwargs)
+            if self.full_policy == FULL_POLICY_REJECT:
+                self._reject(func)
+            try:
+                self._queue.put(item, timeout=self.block_timeout)
+            except Full:
+                self._reject(func)
+
+        self.submitted += 1
+        if not self._idle and len(self._workers) < self.pool_size:
+            self._workers.add(gevent.spawn(self._work))
+
+    def _work(self):
+        try:
+            while True:
+                self._idle += 1
+                try:
+                    item = self._queue.get()
+                finally:
+                    self._idle -= 1
+                enqueued_at, func, args, kwargs = item
+                self._record_wait(enqueued_at)
+                self._start_task()
+                try:
+                    func(*args, **kwargs)
+                except Exception:
+                    self.failed += 1
+                finally:
+                    close_task_connections()
+                    self._finish_task()
+                    self.completed += 1
+        finally:
+            self._workers.discard(gevent.getcurrent())
+
+    def shutdown(self, timeout=None):
+        """
+        Stop accepting tasks and wait up to `timeout` seconds for the pending ones.
+        """
+        self.shutting_down = True
+        deadline = time.time() + (timeout or 0)
+        while (self._queue.qsize() or self.in_flight) and time.time() < deadline:
+            gevent.sleep(0.05)
+        lost = self._queue.qsize() + self.in_flight
+        if lost:
+            logger.error('executor|shutdown|name=%s,lost=%s', self.name, lost)
+        gevent.killall(list(self._workers), block=False)
+
+
+def _call_by_reference(module_name, qualname, args, kwargs):
+    """
+    Functions decorated by `should_asynchronous` are replaced by the decorator in their module, so they can not be
+    pickled. Resolve them by name in the child process instead.
+    """
+    obj = importlib.import_module(module_name)
+    for name in qualname.split('.'):
+        obj = getattr(obj, name)
+    func = getattr(obj, '__wrapped__', obj)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        connections.close_all()
+
+
+class ProcessExecutor(BaseExecutor):
+    """
+    Run CPU bound tasks in a pool of `max_workers` processes. Arguments must be picklable.
+    """
+
+    def __init__(self, name, max_workers=None, **kwargs):
+        super(ProcessExecutor, self).__init__(name, **kwargs)
+        self._pool = ProcessPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        self._room = threading.Condition(self._lock)
+
+    def get_queue_depth(self):
+        return self._pending()
+
+    def _pending(self):
+        return self.submitted - self.completed
+
+    def submit(self, func, *args, **kwargs):
+        if self.shutting_down:
+            self._reject(func)
+
+        with self._room:
+            accepted = self._pending() < self.queue_size
+            if not accepted and self.full_policy == FULL_POLICY_BLOCK:
+                accepted = self._room.wait_for(lambda: self._pending() < self.queue_size, timeout=self.block_timeout)
+            if accepted:
+                self.submitted += 1
+        if not accepted:
+            if self.full_policy == FULL_POLICY_INLINE:
+                return self._run_inline(func, *args, **kwargs)
+            self._reject(func)
+
+        enqueued_at = time.time()
+        self._start_task()
+        try:
+            future = self._pool.submit(_call_by_reference, func.__module__, func.__qualname__, args, kwargs)
+        except Exception:
+            # e.g. BrokenProcessPool: the task never runs, so _done is never called for it
+            self._finish_task()
+            with self._room:
+                self.submitted -= 1
+                self._room.notify()
+            logger.exception('executor|submit_error|name=%s,task=%s.%s', self.name, func.__module__, func.__name__)
+            raise
+        future.add_done_callback(lambda f: self._done(f, func, enqueued_at))
+
+    def _done(self, future, func, enqueued_at):
+        self._record_wait(enqueued_at)
+        self._finish_task()
+        with self._room:
+            self.completed += 1
+            self._room.notify()
+        if future.exception() is not None:
+            self.failed += 1
+            logger.error('error|async|%s.%s|%r', func.__module__, func.__name__, future.exception())
+
+    def shutdown(self, timeout=None):
+        self.shutting_down = True
+        with self._room:
+            self._room.wait_for(lambda: not self._pending(), timeout=timeout)
+            lost = self._pending()
+        if lost:
+            logger.error('executor|shutdown|name=%s,lost=%s', self.name, lost)
+        self._pool.shutdown(wait=False)
+
+
+EXECUTOR_CLASSES = {
+    MODE_GREENLET: GreenletExecutor,
+    MODE_PROCESS: ProcessExecutor,
+}
+
+_executors = {}
+_executors_pid = None
+
+
+def create_executor(name):
+    """
+    Build the executor `name` from settings.ASYNC_EXECUTORS, e.g.
+
+        ASYNC_EXECUTORS = {
+            'default': {'POOL_SIZE': 100, 'QUEUE_SIZE': 1000, 'FULL_POLICY': 'block', 'BLOCK_TIMEOUT': 10},
+            'cpu': {'MODE': 'process', 'MAX_WORKERS': 2, 'QUEUE_SIZE': 100, 'FULL_POLICY': 'inline'},
+        }
+    """
+    options = dict(getattr(settings, 'ASYNC_EXECUTORS', {}).get(name, {}))
+    mode = options.pop('MODE', MODE_GREENLET)
+    kwargs = {key.lower(): value for key, value in options.items()}
+    return EXECUTOR_CLASSES[mode](name, **kwargs)
+
+
+def get_executor(name=DEFAULT_EXECUTOR):
+    global _executors_pid
+    if _executors_pid != os.getpid():
+        # The executors (greenlets, processes) of a parent process can not be used after a fork
+        _executors.clear()
+        _executors_pid = os.getpid()
+    executor = _executors.get(name)
+    if executor is None:
+        executor = _executors[name] = create_executor(name)
+    return executor
+
+
+def get_executors_stats():
+    return {name: executor.stats() for name, executor in _executors.items()}
+
+
+def shutdown_executors(timeout=None):
+    """
+    Wait up to `timeout` seconds (ASYNC_EXECUTORS_SHUTDOWN_TIMEOUT by default) for the pending tasks of every executor.
+    Called by the `worker_exit` hook of gunicorn with its `graceful_timeout`, and at exit.
+    """
+    if _executors_pid != os.getpid():
+        return
+    if timeout is None:
+        timeout = getattr(settings, 'ASYNC_EXECUTORS_SHUTDOWN_TIMEOUT', 10)
+    deadline = time.time() + timeout
+    for executor in list(_executors.values()):
+        if not executor.shutting_down:
+            executor.shutdown(timeout=max(deadline - time.time(), 0))
+
+
+atexit.register(shutdown_executors)
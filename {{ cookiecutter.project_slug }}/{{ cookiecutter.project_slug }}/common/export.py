@@ -0,0 +1,227 @@
+"""
+Streaming exports of big querysets: the rows are read with `iterator()` and serialized chunk by chunk into a
+StreamingHttpResponse, as NDJSON or CSV, gzipped when the client accepts it. A request only holds one chunk of
+instances and its encoded bytes, whatever the number of rows.
+
+    class OrderExportView(ExportAPIView):
+        http_method_get_serializer_class = OrderFilterSerializer
+        export_serializer_class = OrderSerializer
+
+        def get_export_queryset(self, request, serializer):
+            return Order.objects.filter(created_at__gte=serializer.validated_data['since']).order_by('id')
+
+    GET /orders/export?since=...&export_format=csv
+"""
+import csv
+import io
+import logging
+import time
+import zlib
+
+from django.conf import settings
+from django.db.models import prefetch_related_objects
+from django.http import StreamingHttpResponse
+
+from common import json_engine
+from common.exceptions import InvalidParameters
+from common.projection import project
+from common.views import BaseAPIView
+
+logger = logging.getLogger('main')
+
+FORMAT_NDJSON = 'ndjson'
+FORMAT_CSV = 'csv'
+CONTENT_TYPES = {
+    FORMAT_NDJSON: 'application/x-ndjson',
+    FORMAT_CSV: 'text/csv; charset=utf-8',
+}
+DEFAULT_CHUNK_SIZE = 2000
+DEFAULT_GZIP_LEVEL = 6
+
+
+def get_export_setting(name, default=None):
+    return getattr(settings, 'EXPORT', {}).get(name, default)
+
+
+def iter_chunks(queryset, chunk_size):
+    """
+    Yield lists of at most `chunk_size` objects of `queryset`, read with `iterator()`: a server-side cursor on
+    PostgreSQL, fetches of `chunk_size` rows elsewhere. `iterator()` ignores prefetch_related, so the lookups are
+    prefetched for every chunk.
+    """
+    lookups = queryset._prefetch_related_lookups
+    if lookups:
+        queryset = queryset.prefetch_related(None)
+
+    def prepare(chunk):
+        if lookups:
+            prefetch_related_objects(chunk, *lookups)
+        return chunk
+
+    chunk = []
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(obj)
+        if len(chunk) >= chunk_size:
+            yield prepare(chunk)
+            chunk = []
+    if chunk:
+        yield prepare(chunk)
+
+
+def encode_ndjson(rows, field_names):
+    return b''.join(json_engine.dumps_bytes(row) + b'\n' for row in rows)
+
+
+def format_csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        return json_engine.dumps(value)
+    return value
+
+
+def encode_csv(rows, field_names):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([format_csv_value(row.get(name)) for name in field_names] for row in rows)
+    return buffer.getvalue().encode('utf-8')
+
+
+def encode_csv_header(field_names):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(field_names)
+    return buffer.getvalue().encode('utf-8')
+
+
+ENCODERS = {
+    FORMAT_NDJSON: encode_ndjson,
+    FORMAT_CSV: encode_csv,
+}
+
+
+def gzip_pieces(pieces, level=DEFAULT_GZIP_LEVEL):
+    """
+    Gzip a stream of bytes. Every piece is flushed, so the client receives the rows of a chunk without waiting for the
+    next ones.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for piece in pieces:
+        data = compressor.compress(piece) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def accepts_gzip(request):
+    for encoding in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, _, params = encoding.partition(';')
+        if name.strip().lower() != 'gzip':
+            continue
+        params = params.replace(' ', '')
+        if not params.startswith('q='):
+            return True
+        # gzip;q=0 refuses it
+        try:
+            return float(params[2:]) > 0
+        except ValueError:
+            return False
+    return False
+
+
+class ExportAPIView(BaseAPIView):
+    """
+    GET validates the query params with `http_method_get_serializer_class`, then streams the rows of
+    `get_export_queryset`, serialized by `export_serializer_class` with many=True one chunk at a time:
+
+        - export_formats: the formats allowed in the `export_format_param` query param, the first one by default
+        - export_chunk_size: rows per chunk, None for settings.EXPORT['CHUNK_SIZE']
+        - export_gzip: whether the response is gzipped when the client accepts it
+        - export_filename: of the Content-Disposition header, without the extension; None for the view name
+
+    The queryset is projected on the fields of the serializer, see common.projection. The access log line is written
+    when the streaming starts; an `export` line with the number of rows and bytes when it ends. An error in the middle
+    of the stream is logged and aborts the response, so a client never takes a truncated export for a complete one.
+    """
+    export_serializer_class = None
+    export_formats = (FORMAT_NDJSON, FORMAT_CSV)
+    export_format_param = 'export_format'
+    export_chunk_size = None
+    export_gzip = True
+    export_filename = None
+
+    def get_export_queryset(self, request, serializer):
+        """
+        :param serializer: the validated serializer of the query params, None without a serializer class
+        :return: an ordered queryset
+        """
+        raise NotImplementedError('ExportAPIView subclasses must implement get_export_queryset.')
+
+    def get_export_serializer_context(self):
+        return {'request': self.request, 'view': self}
+
+    def get_export_format(self, request):
+        export_format = request.query_params.get(self.export_format_param, self.export_formats[0])
+        if export_format not in self.export_formats:
+            raise InvalidParameters(detail='%s: must be one of %s' % (self.export_format_param,
+                                                                      ', '.join(self.export_formats)))
+        return export_format
+
+    def get_export_filename(self, export_format):
+        name = self.export_filename or self.get_view_name().lower().replace(' ', '_')
+        return '%s.%s' % (name, export_format)
+
+    def get_export_field_names(self):
+        return [field.field_name for field in self.export_serializer_class()._readable_fields]
+
+    def iter_export(self, queryset, export_format, chunk_size, stats):
+        """
+        Yield the encoded bytes of `queryset`, one piece per chunk.
+
+        :param stats: {'rows': number of rows}, updated after every chunk
+        """
+        # one serializer for all the chunks, without `.data`: the ReturnList of `.data` and the serializer reference
+        # each other, so every chunk would stay in memory until a full garbage collection
+        serializer = self.export_serializer_class(many=True, context=self.get_export_serializer_context())
+        field_names = self.get_export_field_names()
+        encode = ENCODERS[export_format]
+        if export_format == FORMAT_CSV:
+            yield encode_csv_header(field_names)
+        for chunk in iter_chunks(queryset, chunk_size):
+            stats['rows'] += len(chunk)
+            yield encode(serializer.to_representation(chunk), field_names)
+
+    def log_export(self, pieces, export_format, stats):
+        """
+        Pass `pieces` through, and log the export when it ends.
+        """
+        start = time.time()
+        size = 0
+        try:
+            for piece in pieces:
+                size += len(piece)
+                yield piece
+        except Exception:
+            logger.exception('export|error|view=%s,format=%s,rows=%s,bytes=%s,duration_ms=%s', self.get_view_name(),
+                             export_format, stats['rows'], size, int((time.time() - start) * 1000))
+            raise
+        logger.info('export|done|view=%s,format=%s,rows=%s,bytes=%s,duration_ms=%s', self.get_view_name(),
+                    export_format, stats['rows'], size, int((time.time() - start) * 1000))
+
+    def get(self, request, serializer):
+        export_format = self.get_export_format(request)
+        queryset = project(self.get_export_queryset(request, serializer), self.export_serializer_class, values=True)
+        chunk_size = self.export_chunk_size or get_export_setting('CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+
+        stats = {'rows': 0}
+        pieces = self.log_export(self.iter_export(queryset, export_format, chunk_size, stats), export_format, stats)
+        gzipped = self.export_gzip and accepts_gzip(request)
+        if gzipped:
+            pieces = gzip_pieces(pieces, get_export_setting('GZIP_LEVEL', DEFAULT_GZIP_LEVEL))
+
+        response = StreamingHttpResponse(pieces, content_type=CONTENT_TYPES[export_format])
+        response['Content-Disposition'] = 'attachment; filename="%s"' % self.get_export_filename(export_format)
+        response['Vary'] = 'Accept-Encoding'
+        if gzipped:
+            response['Content-Encoding'] = 'gzip'
+        # nginx passes the chunks on instead of spooling the whole export to a temporary file
+        response['X-Accel-Buffering'] = 'no'
+        return response
@@ -0,0 +1,79 @@
+from operator import attrgetter
+
+from django.db.models.fields.files import FileField, FieldFile
+
+_field_plans = {}
+
+
+class FieldPlan:
+    """
+    What the diff helpers need to know about the fields of a model, computed once per model:
+
+        - field_names: the names of `_meta.get_fields()`, in order
+        - file_fields: the names of the file fields
+        - getters: {name: getter} for the concrete fields
+        - attnames: the column attribute names of the concrete fields which differ from their name, e.g. `author_id`
+    """
+
+    def __init__(self, model_cls):
+        # `_meta.get_fields()` is cached by Django and recomputed when the app registry expires its caches, the plan
+        # is rebuilt when it is not the same object anymore.
+        self.fields = model_cls._meta.get_fields()
+        self.field_names = tuple(f.name for f in self.fields)
+        self.file_fields = frozenset(f.name for f in self.fields if isinstance(f, FileField))
+        self.getters = {f.name: attrgetter(f.name) for f in self.fields if f.concrete}
+        self.attnames = frozenset(f.attname for f in self.fields if f.concrete and f.attname != f.name)
+
+
+def get_field_plan(model_cls):
+    plan = _field_plans.get(model_cls)
+    if plan is None or plan.fields is not model_cls._meta.get_fields():
+        plan = _field_plans[model_cls] = FieldPlan(model_cls)
+    return plan
+
+
+def compare_data(instance_field, input_data):
+    if isinstance(instance_field, FieldFile):
+        if instance_field.name != input_data:
+            return instance_field.name, input_data
+
+    return instance_field, input_data
+
+
+def compute_changes(instance, input_data):
+    """
+    Compare `input_data` with the attributes of `instance`, in one pass.
+    Keys which are not attributes of `instance` are ignored, files are compared by name.
+
+    :param instance:
+    :param input_data: {attribute name: new value}
+    :return: (from_data, to_data, changes) where changes is {name: {'from': value, 'to': value}}
+    """
+    plan = get_field_plan(type(instance))
+    getters = plan.getters
+    file_fields = plan.file_fields
+    from_data = {}
+    to_data = {}
+    changes = {}
+    for name, value in input_data.items():
+        getter = getters.get(name)
+        try:
+            current = getter(instance) if getter is not None else getattr(instance, name)
+        except AttributeError:
+            continue
+        if not value != current:
+            continue
+
+        if getter is None or name in file_fields:
+            _from, _to = compare_data(current, value)
+            if _from == _to:
+                continue
+        else:
+            _from, _to = current, value
+        changes[name] = {
+            'from': _from,
+            'to': _to,
+        }
+        from_data[name] = _from
+        to_data[name] = _to
+    return from_data, to_data, changes
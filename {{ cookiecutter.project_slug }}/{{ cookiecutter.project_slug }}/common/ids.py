@@ -0,0 +1,239 @@
+"""
+Random tokens and time-sortable ids.
+
+Tokens (OTPs, secrets, random keys) come from `secrets`. The random bytes are drawn in bulk and mapped to the alphabet
+by `bytes.translate`; the bytes above the largest multiple of the alphabet size are dropped, so every character is
+equally likely.
+
+Sortable ids are positive 63-bit integers: the milliseconds since IDS['EPOCH_MS'] (41 bits, about 69 years), a worker
+id (10 bits) and a counter (12 bits). The ids of a process are strictly increasing and the ids of all the processes are
+ordered by time, so they fit a BIGINT primary key (inserts at the end of the index), the public ids of common.storage,
+and keyset cursors on the primary key (`-pk` is the creation order). `encode_base62` gives them as fixed length strings
+in the same order.
+
+The ids are only unique if no two running processes share a worker id. It is, in order:
+
+    - IDS['WORKER_ID'], for a single process
+    - the IDS_WORKER_ID environment variable, when IDS_WORKER_PID is unset or the pid of the process: the post_fork
+      hook of gunicorn sets both from the index of the host and the slot of the worker. Other processes which
+      generate ids in production (cron jobs, scripts) must set IDS_WORKER_ID to an id no worker uses.
+    - otherwise, with IDS['REQUIRE_WORKER_ID'] (live settings), ImproperlyConfigured is raised
+    - otherwise, a hash of the host name and the pid, for development: two processes may get the same worker id.
+      The counter of a new millisecond starts at a random value, which makes a collision unlikely, not impossible.
+"""
+import datetime
+import os
+import random
+import secrets
+import socket
+import threading
+import time
+import zlib
+
+import pytz
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+
+ALPHANUMERIC = '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+DIGITS = '0123456789'
+# in ASCII order, so the fixed length strings sort like the numbers
+BASE62 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+BASE62_INDEX = {char: index for index, char in enumerate(BASE62)}
+# 62 ** 11 > 2 ** 64
+BASE62_LENGTH = 11
+
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+# set by the post_fork hook of gunicorn, see get_worker_id
+WORKER_ID_ENVIRON = 'IDS_WORKER_ID'
+WORKER_PID_ENVIRON = 'IDS_WORKER_PID'
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+# 2020-01-01T00:00:00Z
+DEFAULT_EPOCH_MS = 1577836800000
+
+# {alphabet: (translation table, deleted bytes, number of accepted bytes), or None when bytes can not be mapped}
+_translations = {}
+
+
+def get_ids_setting(name, default=None):
+    return getattr(settings, 'IDS', {}).get(name, default)
+
+
+def get_translation(alphabet):
+    try:
+        return _translations[alphabet]
+    except KeyError:
+        pass
+    size = len(alphabet)
+    if 0 < size <= 256 and all(ord(char) < 128 for char in alphabet):
+        # byte b < limit gives alphabet[b % size]: limit is a multiple of size, so every character has the same odds
+        limit = 256 - 256 % size
+        table = bytes(ord(alphabet[b % size]) for b in range(limit)) + bytes(256 - limit)
+        translation = (table, bytes(range(limit, 256)), limit)
+    else:
+        translation = None
+    _translations[alphabet] = translation
+    return translation
+
+
+def random_tokens(count, length, alphabet=ALPHANUMERIC):
+    """
+    :return: list of `count` random strings of `length` characters of `alphabet`, from a single draw of random bytes
+    """
+    translation = get_translation(alphabet)
+    if translation is None:
+        return [''.join(secrets.choice(alphabet) for _ in range(length)) for _ in range(count)]
+    table, deleted, limit = translation
+    needed = count * length
+    chars = b''
+    while len(chars) < needed:
+        # a few more bytes than the expected need, a second draw is rare
+        missing = needed - len(chars)
+        chars += secrets.token_bytes(missing * 256 // limit + 16).translate(table, deleted)
+    text = chars[:needed].decode('ascii')
+    return [text[i:i + length] for i in range(0, needed, length)]
+
+
+def random_token(length, alphabet=ALPHANUMERIC):
+    return random_tokens(1, length, alphabet)[0]
+
+
+def encode_base62(number, length=BASE62_LENGTH):
+    chars = []
+    while number:
+        number, remainder = divmod(number, 62)
+        chars.append(BASE62[remainder])
+    return ''.join(reversed(chars)).rjust(length, BASE62[0])
+
+
+def decode_base62(text):
+    number = 0
+    for char in text:
+        number = number * 62 + BASE62_INDEX[char]
+    return number
+
+
+def get_default_worker_id():
+    """
+    :return: a hash of the host name and the pid, which two processes may share
+    """
+    return zlib.crc32(('%s:%s' % (socket.gethostname(), os.getpid())).encode()) & MAX_WORKER_ID
+
+
+def get_worker_id():
+    """
+    :return: the worker id of the process, see the module docstring
+    :raise ImproperlyConfigured: when IDS['REQUIRE_WORKER_ID'] and the process has no worker id
+    """
+    worker_id = get_ids_setting('WORKER_ID')
+    if worker_id is not None:
+        return worker_id
+    value = os.environ.get(WORKER_ID_ENVIRON)
+    # a process forked by a worker (e.g. a ProcessExecutor) inherits its environment, not its worker id
+    if value is not None and os.environ.get(WORKER_PID_ENVIRON, str(os.getpid())) == str(os.getpid()):
+        return int(value)
+    if get_ids_setting('REQUIRE_WORKER_ID', False):
+        message = 'The process %s has no worker id for sortable ids: set IDS[\'WORKER_ID\'] or the %s environment ' \
+                  'variable, unique per running process.' % (os.getpid(), WORKER_ID_ENVIRON)
+        raise ImproperlyConfigured(message)
+    return get_default_worker_id()
+
+
+class SortableIdGenerator:
+    """
+    Thread safe. When the clock goes backwards, or a millisecond runs out of counter values, the ids continue from the
+    last millisecond used instead of waiting.
+    """
+
+    def __init__(self, worker_id, epoch_ms=DEFAULT_EPOCH_MS):
+        if not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError('The worker id must be between 0 and %s.' % MAX_WORKER_ID)
+        self.worker_id = worker_id
+        self.epoch_ms = epoch_ms
+        self._last_ms = -1
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def _next(self):
+        now = int(time.time() * 1000) - self.epoch_ms
+        if now > self._last_ms:
+            self._last_ms = now
+            # in the first half, so the millisecond still has at least 2048 values
+            self._sequence = random.getrandbits(SEQUENCE_BITS - 1)
+        elif self._sequence < MAX_SEQUENCE:
+            self._sequence += 1
+        else:
+            self._last_ms += 1
+            self._sequence = 0
+        return (self._last_ms << (WORKER_BITS + SEQUENCE_BITS)) | (self.worker_id << SEQUENCE_BITS) | self._sequence
+
+    def next_id(self):
+        with self._lock:
+            return self._next()
+
+    def next_ids(self, count):
+        with self._lock:
+            return [self._next() for _ in range(count)]
+
+    def get_datetime(self, sortable_id):
+        """
+        :return: the UTC datetime when `sortable_id` was generated, to the millisecond
+        """
+        ms = (sortable_id >> (WORKER_BITS + SEQUENCE_BITS)) + self.epoch_ms
+        return datetime.datetime.fromtimestamp(ms / 1000, tz=pytz.utc)
+
+
+_generator = None
+_generator_pid = None
+
+
+def get_generator():
+    """
+    :return: the SortableIdGenerator of the process, a forked process gets its own worker id and counter
+    """
+    global _generator, _generator_pid
+    pid = os.getpid()
+    if _generator is None or _generator_pid != pid:
+        _generator = SortableIdGenerator(get_worker_id(), get_ids_setting('EPOCH_MS', DEFAULT_EPOCH_MS))
+        _generator_pid = pid
+    return _generator
+
+
+def next_id():
+    return get_generator().next_id()
+
+
+def next_ids(count):
+    return get_generator().next_ids(count)
+
+
+def next_id_string():
+    """
+    :return: a sortable id as 11 base62 characters, e.g. a public id of common.storage.Storage
+    """
+    return encode_base62(get_generator().next_id())
+
+
+def get_id_datetime(sortable_id):
+    return get_generator().get_datetime(sortable_id)
+
+
+class SortableIdField(models.BigIntegerField):
+    """
+    A BIGINT filled by `next_id` on creation, e.g. `id = SortableIdField(primary_key=True)`.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('default', next_id)
+        kwargs.setdefault('editable', False)
+        super(SortableIdField, self).__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super(SortableIdField, self).deconstruct()
+        if kwargs.get('default') is next_id:
+            del kwargs['default']
+        if kwargs.get('editable') is False:
+            del kwargs['editable']
+        return name, path, args, kwargs
@@ -0,0 +1,107 @@
+import logging
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+
+MODEL_GENERATION_CACHE_KEY_FORMAT = 'model_generation:%s'
+
+logger = logging.getLogger('main')
+_watched_models = set()
+
+
+def get_invalidation_cache():
+    return caches[getattr(settings, 'INVALIDATION_CACHE_ALIAS', 'default')]
+
+
+def get_model_label(model_cls):
+    return model_cls._meta.label_lower
+
+
+def bump_model_generation(model_cls):
+    """
+    Mark every cached value derived from `model_cls` as stale.
+
+    The generation is the timestamp of the last change, so it can also be used as a Last-Modified value.
+    """
+    get_invalidation_cache().set(MODEL_GENERATION_CACHE_KEY_FORMAT % get_model_label(model_cls), time.time(), None)
+
+
+def bump_model_generation_on_commit(model_cls, using=None):
+    """
+    Bump the generation of `model_cls` when the transaction of `using` commits, at once outside a transaction: the
+    cache write does not run (or lock anything) inside the transaction, and a rolled back change does not bump.
+    """
+    transaction.on_commit(lambda: bump_model_generation(model_cls), using=using)
+
+
+def _on_model_changed(sender, using=None, **kwargs):
+    bump_model_generation_on_commit(sender, using)
+
+
+def watch_model(model_cls):
+    """
+    Bump the generation of `model_cls` on post_save and post_delete.
+
+    .. note::
+        `QuerySet.update`, `bulk_create` and raw SQL do not send these signals. Values cached against a generation
+        must also have a TTL.
+
+    .. note::
+        A process only bumps the generations of the models it watches, so the models must be watched when the process
+        starts, before it saves anything. The views watch their `response_cache_models` when their class is created;
+        the models whose counts are cached are listed in settings.INVALIDATION_WATCHED_MODELS, see `watch_models`.
+    """
+    label = get_model_label(model_cls)
+    if label in _watched_models:
+        return
+    _watched_models.add(label)
+    dispatch_uid = MODEL_GENERATION_CACHE_KEY_FORMAT % label
+    post_save.connect(_on_model_changed, sender=model_cls, weak=False, dispatch_uid=dispatch_uid)
+    post_delete.connect(_on_model_changed, sender=model_cls, weak=False, dispatch_uid=dispatch_uid)
+    logger.debug('watch_model|model=%s', label)
+
+
+def watch_models():
+    """
+    Watch the models of settings.INVALIDATION_WATCHED_MODELS ('app_label.ModelName'), called by
+    `common.apps.CommonConfig.ready`. Every watched model costs a cache write per saved or deleted instance, so only
+    the models whose cached values depend on them are watched.
+    """
+    for label in getattr(settings, 'INVALIDATION_WATCHED_MODELS', ()):
+        watch_model(apps.get_model(label))
+
+
+def check_invalidation_cache():
+    """
+    Warn when the generations are kept in the memory of the process: a change is then only seen by the process which
+    made it, the other processes serve stale values until their timeout. Use a cache shared by all the processes which
+    share the database, e.g. memcached, with settings.INVALIDATION_CACHE_ALIAS.
+
+    :return: whether the cache is shared
+    """
+    cache = get_invalidation_cache()
+    if not isinstance(cache, LocMemCache):
+        return True
+    if not settings.DEBUG:
+        logger.warning('invalidation|process_local_cache|alias=%s|cached counts and responses are not invalidated '
+                       'across processes', getattr(settings, 'INVALIDATION_CACHE_ALIAS', 'default'))
+    return False
+
+
+def get_model_generations(*model_classes):
+    """
+    :param model_classes:
+    :return: dict of model label -> generation, 0 for models which have not changed since the cache was cleared
+    """
+    keys = {MODEL_GENERATION_CACHE_KEY_FORMAT % get_model_label(m): get_model_label(m) for m in model_classes}
+    values = get_invalidation_cache().get_many(list(keys))
+    return {label: values.get(key, 0) for key, label in keys.items()}
+
+
+def get_model_generation(model_cls):
+    return get_model_generations(model_cls)[get_model_label(model_cls)]
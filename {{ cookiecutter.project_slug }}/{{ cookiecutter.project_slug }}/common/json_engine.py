@@ -0,0 +1,100 @@
+"""
+JSON encoding with orjson when it is installed (`pip install orjson`), the standard library otherwise.
+
+Both engines give the same output: compact separators, non ASCII characters as is, and the types orjson does not
+know (Decimal, lazy strings...) or must not encode itself (datetime, date, time) go through the `default` of the
+encoder, e.g. `DjangoJSONEncoder().default`.
+
+Known differences: orjson encodes NaN and Infinity as `null` and may write floats in another notation (`1e16`
+instead of `1e+16`); integers beyond 64 bits fall back to the standard library. orjson decodes these integers as
+floats, so a document with a number of 19 digits or more, or one orjson rejects (NaN, Infinity...), is decoded by
+the standard library.
+
+Set JSON_ENGINE = 'json' in the settings to disable orjson.
+"""
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ENGINE_ORJSON = 'orjson'
+ENGINE_JSON = 'json'
+
+SEPARATORS = (',', ':')
+
+# the digits as '0', the dots kept, any other byte as a space, see has_long_integer
+DIGITS_TABLE = bytes(48 if 48 <= i <= 57 else 46 if i == 46 else 32 for i in range(256))
+LONG_DIGITS = b'0' * 19
+
+if orjson is not None:
+    ORJSON_OPTIONS = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS |
+                      orjson.OPT_NON_STR_KEYS)
+
+_default_encoder = DjangoJSONEncoder()
+
+
+def get_engine():
+    if orjson is not None and getattr(settings, 'JSON_ENGINE', ENGINE_ORJSON) == ENGINE_ORJSON:
+        return ENGINE_ORJSON
+    return ENGINE_JSON
+
+
+def dumps_bytes(obj, default=None, engine=None):
+    """
+    :param obj:
+    :param default: called with the objects the engine can not encode, `DjangoJSONEncoder().default` by default
+    :param engine: ENGINE_ORJSON or ENGINE_JSON, `get_engine()` by default
+    :return: the UTF-8 encoded JSON of `obj`
+    """
+    default = default or _default_encoder.default
+    if (engine or get_engine()) == ENGINE_ORJSON:
+        try:
+            return orjson.dumps(obj, default=default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bits, the standard library raises the errors of `default`
+            pass
+    return json.dumps(obj, default=default, separators=SEPARATORS, ensure_ascii=False).encode('utf-8')
+
+
+def dumps(obj, default=None, engine=None):
+    """
+    Same as `dumps_bytes`, return a str.
+    """
+    return dumps_bytes(obj, default=default, engine=engine).decode('utf-8')
+
+
+def has_long_integer(data):
+    """
+    :param data: a JSON document, str or bytes
+    :return: whether it may contain an integer of 19 digits or more (which may not fit in 64 bits): a run of 19 digits
+        which does not follow a dot, the fraction of a float or of a decimal string
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    digits = bytes(data).translate(DIGITS_TABLE)
+    index = digits.find(LONG_DIGITS)
+    while index != -1:
+        if index == 0 or digits[index - 1] == 32:
+            return True
+        index = digits.find(LONG_DIGITS, index + len(LONG_DIGITS))
+    return False
+
+
+def loads(data, engine=None, **kwargs):
+    """
+    :param data: str or bytes
+    :param kwargs: of `json.loads`, when the standard library decodes `data`, e.g. parse_constant
+    """
+    if (engine or get_engine()) == ENGINE_ORJSON:
+        if not has_long_integer(data):
+            try:
+                return orjson.loads(data)
+            except orjson.JSONDecodeError:
+                # the standard library raises its own error if the document is invalid
+                pass
+    return json.loads(data, **kwargs)
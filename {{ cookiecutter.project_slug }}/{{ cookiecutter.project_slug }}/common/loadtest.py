@@ -0,0 +1,92 @@
+"""
+Sample endpoints driven by the `loadtest` management command, routed under /loadtest/ only in the gunicorn servers it
+starts (LOADTEST_ENDPOINTS environment variable):
+
+    - ping: readiness check
+    - cpu: hashes in a loop, the worker is busy for the whole request
+    - db: 2 queries (a COUNT and a page of content types), the database must be migrated
+    - io: waits for a remote service, and schedules a task with should_asynchronous
+"""
+import hashlib
+import time
+
+from django.contrib.contenttypes.models import ContentType
+from django.urls import path
+from rest_framework import serializers
+from rest_framework.response import Response
+
+from common.utils import should_asynchronous
+from common.views import BaseAPIView
+
+LOADTEST_ENDPOINTS_ENV = 'LOADTEST_ENDPOINTS'
+ENDPOINT_CPU = 'cpu'
+ENDPOINT_DB = 'db'
+ENDPOINT_IO = 'io'
+ENDPOINTS = (ENDPOINT_CPU, ENDPOINT_DB, ENDPOINT_IO)
+
+
+@should_asynchronous
+def notify(delay):
+    # e.g. sending an email
+    time.sleep(delay)
+
+
+class PingView(BaseAPIView):
+    http_method_get_serializer_class = None
+    access_log_sample_rate = 0
+
+    def get(self, request, serializer):
+        return Response({'ping': 'pong'})
+
+
+class CpuSerializer(serializers.Serializer):
+    iterations = serializers.IntegerField(min_value=1, max_value=1000000, default=20000)
+
+
+class CpuView(BaseAPIView):
+    http_method_get_serializer_class = CpuSerializer
+
+    def get(self, request, serializer):
+        digest = b''
+        for _ in range(serializer.validated_data['iterations']):
+            digest = hashlib.sha256(digest).digest()
+        return Response({'digest': digest.hex()})
+
+
+class DbSerializer(serializers.Serializer):
+    limit = serializers.IntegerField(min_value=1, max_value=1000, default=20)
+
+
+class DbView(BaseAPIView):
+    http_method_get_serializer_class = DbSerializer
+
+    def get(self, request, serializer):
+        queryset = ContentType.objects.order_by('pk')
+        return Response({
+            'count': queryset.count(),
+            'results': list(queryset.values('id', 'app_label', 'model')[:serializer.validated_data['limit']]),
+        })
+
+
+class IoSerializer(serializers.Serializer):
+    # milliseconds
+    delay = serializers.IntegerField(min_value=0, max_value=10000, default=50)
+    async_delay = serializers.IntegerField(min_value=0, max_value=10000, default=50)
+
+
+class IoView(BaseAPIView):
+    http_method_get_serializer_class = IoSerializer
+
+    def get(self, request, serializer):
+        # e.g. calling a remote service: blocks a sync worker, yields to the others under gevent
+        time.sleep(serializer.validated_data['delay'] / 1000)
+        notify(serializer.validated_data['async_delay'] / 1000)
+        return Response({'ok': True})
+
+
+urlpatterns = [
+    path('ping', PingView.as_view()),
+    path(ENDPOINT_CPU, CpuView.as_view()),
+    path(ENDPOINT_DB, DbView.as_view()),
+    path(ENDPOINT_IO, IoView.as_view()),
+]
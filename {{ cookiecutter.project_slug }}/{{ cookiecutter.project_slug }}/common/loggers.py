@@ -1,12 +1,40 @@
+import datetime
 import logging
 import os
+import queue
+import threading
+import time
 
 from django.utils import timezone
 
+OVERFLOW_POLICY_BLOCK = 'block'
+OVERFLOW_POLICY_DROP = 'drop'
+OVERFLOW_POLICY_SAMPLE = 'sample'
+OVERFLOW_POLICIES = (OVERFLOW_POLICY_BLOCK, OVERFLOW_POLICY_DROP, OVERFLOW_POLICY_SAMPLE)
+
+_STOP = object()
+
+
+def get_rollover(now=None):
+    """
+    :return: (current local day, timestamp of the next local midnight)
+    """
+    local_now = timezone.localtime(now or timezone.now())
+    midnight = datetime.datetime.combine(local_now.date() + datetime.timedelta(days=1), datetime.time.min)
+    return local_now.date(), timezone.make_aware(midnight, timezone.get_current_timezone(), is_dst=False).timestamp()
+
+
+def is_gevent_patched():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
 
 class DailyFileHandler(logging.FileHandler):
     def __init__(self, filename, *args, **kwargs):
-        self._day = timezone.localtime(timezone.now()).date()
+        self._day, self._rollover_at = get_rollover()
         self._filename = filename
         self.try_mkdir_for_file(filename)
         filename = '%s.%s' % (self._filename, self._day)
@@ -18,10 +46,180 @@ class DailyFileHandler(logging.FileHandler):
         if not os.path.exists(folder):
             os.makedirs(folder)
 
+    def do_rollover(self):
+        self._day, self._rollover_at = get_rollover()
+        self.close()
+        self.baseFilename = '%s.%s' % (self._filename, self._day)
+
     def emit(self, record):
-        day = timezone.localtime(timezone.now()).date()
-        if self._day != day:
-            self._day = day
-            self.close()
-            self.baseFilename = '%s.%s' % (self._filename, self._day)
+        # Compare with a precomputed timestamp, instead of converting the current time to the local timezone
+        if record.created >= self._rollover_at:
+            self.do_rollover()
         super(DailyFileHandler, self).emit(record)
+
+
+class QueuedDailyFileHandler(DailyFileHandler):
+    """
+    A DailyFileHandler which does not write in the caller.
+
+    Records are formatted in the caller and put into a bounded queue. A single writer (a thread, or a greenlet when
+    gevent has patched threading) takes them in batches of `batch_size`, writes each batch at once and flushes the
+    file every `flush_interval` seconds. Under gevent, the write itself runs in the hub's threadpool so the other
+    greenlets keep running during disk I/O.
+
+    When the queue is full, `overflow_policy` decides:
+        - block: wait up to `block_timeout` seconds for room, then drop the record
+        - drop: drop the record
+        - sample: once the queue is half full keep 1 of every `sample_rate` records, drop the others
+
+    Dropped records are counted and reported in the file. Pending records are written when the handler is closed,
+    i.e. on `logging.shutdown()` at exit (see the `worker_exit` hook in the gunicorn config).
+    """
+
+    def __init__(self, filename, queue_size=10000, batch_size=500, flush_interval=1.0,
+                 overflow_policy=OVERFLOW_POLICY_DROP, sample_rate=10, block_timeout=1.0, shutdown_timeout=5.0,
+                 *args, **kwargs):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError('overflow_policy must be one of %s' % ', '.join(OVERFLOW_POLICIES))
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.sample_rate = max(int(sample_rate), 1)
+        self.block_timeout = block_timeout
+        self.shutdown_timeout = shutdown_timeout
+        self.dropped = 0
+        self._sampled = 0
+        self._queue = None
+        self._writer = None
+        self._writer_pid = None
+        self._write_lock = threading.RLock()
+        kwargs['delay'] = True
+        super(QueuedDailyFileHandler, self).__init__(filename, *args, **kwargs)
+
+    def _start_writer(self):
+        # Also called after a fork: the writer of the parent process does not exist in the child.
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._writer = threading.Thread(target=self._run, args=(self._queue,), name='QueuedDailyFileHandler')
+        self._writer.daemon = True
+        self._writer_pid = os.getpid()
+        self._writer.start()
+
+    def emit(self, record):
+        try:
+            item = (record.created, self.format(record))
+        except Exception:
+            self.handleError(record)
+            return
+
+        if self._writer_pid != os.getpid():
+            self._start_writer()
+
+        try:
+            if self.overflow_policy == OVERFLOW_POLICY_BLOCK:
+                self._queue.put(item, timeout=self.block_timeout)
+                return
+            if self.overflow_policy == OVERFLOW_POLICY_SAMPLE and self._queue.qsize() * 2 >= self.queue_size:
+                self._sampled += 1
+                if self._sampled % self.sample_rate:
+                    self.dropped += 1
+                    return
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self, q):
+        last_flush = time.time()
+        stopping = False
+        while not stopping:
+            try:
+                item = q.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = None
+
+            batch = []
+            while item is not None:
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = q.get_nowait()
+                except queue.Empty:
+                    item = None
+
+            should_flush = stopping or time.time() - last_flush >= self.flush_interval
+            if batch or should_flush:
+                self._write(batch, should_flush)
+            if should_flush:
+                last_flush = time.time()
+
+    def _write(self, batch, flush):
+        with self._write_lock:
+            if is_gevent_patched():
+                from gevent import get_hub
+                get_hub().threadpool.apply(self._write_batch, (batch, flush))
+            else:
+                self._write_batch(batch, flush)
+
+    def _dropped_message(self):
+        dropped, self.dropped = self.dropped, 0
+        record = logging.makeLogRecord({
+            'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+            'msg': 'QueuedDailyFileHandler|dropped=%s', 'args': (dropped,),
+        })
+        return self.format(record) + self.terminator
+
+    def _write_batch(self, batch, flush):
+        try:
+            chunk = []
+            for created, message in batch:
+                if created >= self._rollover_at:
+                    self._write_chunk(chunk)
+                    chunk = []
+                    self._day, self._rollover_at = get_rollover()
+                    self._close_stream()
+                    self.baseFilename = '%s.%s' % (self._filename, self._day)
+                chunk.append(message + self.terminator)
+            if self.dropped:
+                chunk.append(self._dropped_message())
+            self._write_chunk(chunk)
+            if flush and self.stream:
+                self.stream.flush()
+        except Exception:
+            # Same as logging.Handler.handleError, without a record to report
+            if logging.raiseExceptions:
+                import traceback
+                traceback.print_exc()
+
+    def _write_chunk(self, chunk):
+        if not chunk:
+            return
+        if self.stream is None:
+            self.stream = self._open()
+        self.stream.write(''.join(chunk))
+
+    def _close_stream(self):
+        if self.stream:
+            self.stream.flush()
+            self.stream.close()
+            self.stream = None
+
+    def flush(self):
+        # The writer flushes every `flush_interval`, and on close.
+        pass
+
+    def close(self):
+        writer, self._writer = self._writer, None
+        if writer is not None and self._writer_pid == os.getpid() and writer.is_alive():
+            try:
+                self._queue.put(_STOP, timeout=self.shutdown_timeout)
+            except queue.Full:
+                pass
+            writer.join(self.shutdown_timeout)
+        self._writer_pid = None
+        with self._write_lock:
+            self._close_stream()
+        logging.Handler.close(self)
@@ -0,0 +1,263 @@
+import http.client
+import json
+import math
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from common.loadtest import ENDPOINTS, LOADTEST_ENDPOINTS_ENV
+
+WORKER_CLASSES = ('sync', 'gthread', 'gevent')
+HOST = '127.0.0.1'
+READY_TIMEOUT = 30
+PERCENTILES = (50, 95, 99)
+
+
+def get_free_port():
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+def percentile(sorted_values, p):
+    """
+    :return: the nearest-rank percentile `p` of `sorted_values`
+    """
+    if not sorted_values:
+        return None
+    rank = math.ceil(p / 100 * len(sorted_values))
+    return sorted_values[max(rank - 1, 0)]
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    result = {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': round(len(latencies) / elapsed, 1) if elapsed else 0,
+    }
+    for p in PERCENTILES:
+        value = percentile(latencies, p)
+        result['p%s_ms' % p] = round(value * 1000, 2) if value is not None else None
+    result['max_ms'] = round(latencies[-1] * 1000, 2) if latencies else None
+    return result
+
+
+class Client(threading.Thread):
+    """
+    Send requests to `path` one after the other, on a keep-alive connection when the server allows it, until
+    `deadline`. The latencies of the requests completed after `record_from` are recorded.
+    """
+
+    def __init__(self, port, path, record_from, deadline):
+        super(Client, self).__init__(daemon=True)
+        self.port = port
+        self.path = path
+        self.record_from = record_from
+        self.deadline = deadline
+        self.latencies = []
+        self.errors = 0
+
+    def run(self):
+        connection = http.client.HTTPConnection(HOST, self.port, timeout=60)
+        while True:
+            start = time.perf_counter()
+            if start >= self.deadline:
+                break
+            try:
+                connection.request('GET', self.path)
+                response = connection.getresponse()
+                response.read()
+                ok = response.status == 200
+                if response.will_close:
+                    connection.close()
+            except (OSError, http.client.HTTPException):
+                ok = False
+                connection.close()
+            end = time.perf_counter()
+            if end < self.record_from:
+                continue
+            if ok:
+                self.latencies.append(end - start)
+            else:
+                self.errors += 1
+        connection.close()
+
+
+class Server:
+    """
+    gunicorn serving the WSGI application of settings.WSGI_APPLICATION, with the sample endpoints of common.loadtest.
+    """
+
+    def __init__(self, worker_class, workers, threads, worker_connections):
+        self.worker_class = worker_class
+        self.workers = workers
+        self.threads = threads
+        self.worker_connections = worker_connections
+        self.port = get_free_port()
+        self.process = None
+        self.log = None
+
+    def get_command(self):
+        module, _, name = settings.WSGI_APPLICATION.rpartition('.')
+        command = [
+            sys.executable, '-m', 'gunicorn', '%s:%s' % (module, name),
+            '--bind', '%s:%s' % (HOST, self.port),
+            '--worker-class', self.worker_class,
+            '--workers', str(self.workers),
+            '--chdir', settings.BASE_DIR,
+            '--log-level', 'warning',
+        ]
+        if self.worker_class == 'gthread':
+            command += ['--threads', str(self.threads)]
+        if self.worker_class == 'gevent':
+            command += ['--worker-connections', str(self.worker_connections)]
+        return command
+
+    def start(self):
+        self.log = tempfile.TemporaryFile(mode='w+')
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        env[LOADTEST_ENDPOINTS_ENV] = '1'
+        self.process = subprocess.Popen(self.get_command(), env=env, stdout=self.log, stderr=subprocess.STDOUT)
+        deadline = time.time() + READY_TIMEOUT
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise CommandError('gunicorn %s exited:\n%s' % (self.worker_class, self.read_log()))
+            try:
+                connection = http.client.HTTPConnection(HOST, self.port, timeout=1)
+                connection.request('GET', '/loadtest/ping')
+                if connection.getresponse().status == 200:
+                    return
+            except (OSError, http.client.HTTPException):
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise CommandError('gunicorn %s is not ready after %ss:\n%s' % (self.worker_class, READY_TIMEOUT,
+                                                                        self.read_log()))
+
+    def read_log(self, max_length=5000):
+        self.log.seek(0)
+        return self.log.read()[-max_length:]
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if self.log is not None:
+            self.log.close()
+
+
+class Command(BaseCommand):
+    help = (
+        'Start gunicorn with every worker class, load the sample endpoints of common.loadtest (CPU, database and '
+        'I/O bound), and report the throughput and latency percentiles. The database must be migrated.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--worker-classes', default=','.join(WORKER_CLASSES),
+                            help='comma separated, among %s' % ', '.join(WORKER_CLASSES))
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS),
+                            help='comma separated, among %s' % ', '.join(ENDPOINTS))
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--threads', type=int, default=8, help='threads per gthread worker')
+        parser.add_argument('--worker-connections', type=int, default=1000, help='greenlets per gevent worker')
+        parser.add_argument('--concurrency', type=int, default=20, help='concurrent clients')
+        parser.add_argument('--duration', type=float, default=10, help='seconds per endpoint')
+        parser.add_argument('--warmup', type=float, default=1, help='seconds not recorded, before the duration')
+        parser.add_argument('--query', action='append', default=[], metavar='ENDPOINT:QUERY',
+                            help='query string of an endpoint, e.g. io:delay=100&async_delay=0')
+        parser.add_argument('--output', help='save the results as JSON')
+        parser.add_argument('--baseline', help='compare with results saved by --output')
+
+    def parse_list(self, value, choices, name):
+        items = [item.strip() for item in value.split(',') if item.strip()]
+        unknown = set(items) - set(choices)
+        if unknown:
+            raise CommandError('unknown %s: %s' % (name, ', '.join(sorted(unknown))))
+        return items
+
+    def run_endpoint(self, port, path, options):
+        start = time.perf_counter()
+        record_from = start + options['warmup']
+        deadline = record_from + options['duration']
+        clients = [Client(port, path, record_from, deadline) for _ in range(options['concurrency'])]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        elapsed = time.perf_counter() - record_from
+        return summarize([latency for client in clients for latency in client.latencies],
+                         sum(client.errors for client in clients), elapsed)
+
+    def handle(self, *args, **options):
+        worker_classes = self.parse_list(options['worker_classes'], WORKER_CLASSES, 'worker classes')
+        endpoints = self.parse_list(options['endpoints'], ENDPOINTS, 'endpoints')
+        queries = dict(query.split(':', 1) for query in options['query'])
+
+        results = {}
+        for worker_class in worker_classes:
+            server = Server(worker_class, options['workers'], options['threads'], options['worker_connections'])
+            server.start()
+            try:
+                for endpoint in endpoints:
+                    path = '/loadtest/%s' % endpoint
+                    if queries.get(endpoint):
+                        path += '?' + queries[endpoint]
+                    self.stdout.write('%s %s...' % (worker_class, path))
+                    results['%s.%s' % (worker_class, endpoint)] = self.run_endpoint(server.port, path, options)
+            finally:
+                server.stop()
+
+        self.write_results(results, self.load_baseline(options['baseline']))
+        if options['output']:
+            self.save_results(options['output'], results, options)
+
+    def load_baseline(self, filename):
+        if not filename:
+            return {}
+        with open(filename) as f:
+            return json.load(f)['results']
+
+    def save_results(self, filename, results, options):
+        data = {
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+            },
+            'options': {name: options[name] for name in (
+                'workers', 'threads', 'worker_connections', 'concurrency', 'duration', 'warmup', 'query')},
+            'results': results,
+        }
+        with open(filename, 'w') as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+        self.stdout.write('Saved to %s' % filename)
+
+    def write_results(self, results, baseline):
+        columns = ['requests', 'errors', 'throughput'] + ['p%s_ms' % p for p in PERCENTILES] + ['max_ms']
+        self.stdout.write('%-20s' % 'case' + ''.join('%12s' % column for column in columns) +
+                          ('%12s%12s' % ('throughput%', 'p95%') if baseline else ''))
+        for name, result in results.items():
+            line = '%-20s' % name + ''.join('%12s' % result[column] for column in columns)
+            previous = baseline.get(name)
+            if previous:
+                line += '%12s%12s' % (self.format_change(previous['throughput'], result['throughput']),
+                                      self.format_change(previous['p95_ms'], result['p95_ms']))
+            self.stdout.write(line)
+
+    def format_change(self, previous, current):
+        if not previous or current is None:
+            return '-'
+        return '%+.1f' % ((current - previous) / previous * 100)
@@ -0,0 +1,385 @@
+"""
+Metrics of the workers, exposed in the Prometheus text format by `metrics_view`.
+
+Every process writes its values in its own memory-mapped files in METRICS['DIRECTORY'] (`<kind>_<pid>.db`), so
+recording a value is a write in memory, without a lock between the processes nor a network service. `collect` reads
+the files of all the processes and adds them up.
+
+The gauges of a process are removed when it exits (`mark_process_dead`, called by the `child_exit` hook of gunicorn).
+Its counters and histograms are kept, so the totals do not drop when a worker is recycled, until the directory is
+cleared when gunicorn starts (`clear_directory`, `on_starting` hook).
+
+Without METRICS['DIRECTORY'], e.g. in development, the values are kept in the memory of the process.
+"""
+import glob
+import ipaddress
+import json
+import mmap
+import os
+import struct
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+KIND_COUNTER = 'counter'
+KIND_GAUGE = 'gauge'
+KIND_HISTOGRAM = 'histogram'
+
+# in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+INF = '+Inf'
+SUFFIX_SUM = 'sum'
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_INITIAL_SIZE = 16 * 1024
+_USED = struct.Struct('<I')
+_HEADER_SIZE = 8
+_VALUE = struct.Struct('<d')
+
+
+def get_metrics_setting(name, default=None):
+    return getattr(settings, 'METRICS', {}).get(name, default)
+
+
+def read_values(data):
+    """
+    :param data: the content of a values file: the used size, then entries of (key length, key padded to 8 bytes,
+        double)
+    :return: [(key, value, position of the value)]
+    """
+    used = _USED.unpack_from(data, 0)[0] if len(data) >= _HEADER_SIZE else 0
+    values = []
+    position = _HEADER_SIZE
+    while position < used:
+        length = _USED.unpack_from(data, position)[0]
+        position += 4
+        key = bytes(data[position:position + length]).decode('utf-8')
+        position += length + (-(length + 4) % 8)
+        values.append((key, _VALUE.unpack_from(data, position)[0], position))
+        position += 8
+    return values
+
+
+class MmapedValues:
+    """
+    {key: float} stored in a memory-mapped file, written by one process only.
+    An entry is fully written before the used size is updated, so the file can be read by other processes anytime.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = open(filename, 'a+b')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < _INITIAL_SIZE:
+            self._file.truncate(_INITIAL_SIZE)
+            size = _INITIAL_SIZE
+        self._capacity = size
+        self._mmap = mmap.mmap(self._file.fileno(), self._capacity)
+        self._positions = {key: position for key, _, position in read_values(self._mmap)}
+        self._used = max(_USED.unpack_from(self._mmap, 0)[0], _HEADER_SIZE)
+        _USED.pack_into(self._mmap, 0, self._used)
+
+    def _get_position(self, key):
+        position = self._positions.get(key)
+        if position is not None:
+            return position
+        encoded = key.encode('utf-8')
+        entry = _USED.pack(len(encoded)) + encoded + b' ' * (-(len(encoded) + 4) % 8) + _VALUE.pack(0.0)
+        while self._used + len(entry) > self._capacity:
+            self._capacity *= 2
+            self._file.truncate(self._capacity)
+            self._mmap.close()
+            self._mmap = mmap.mmap(self._file.fileno(), self._capacity)
+        self._mmap[self._used:self._used + len(entry)] = entry
+        self._used += len(entry)
+        _USED.pack_into(self._mmap, 0, self._used)
+        position = self._positions[key] = self._used - 8
+        return position
+
+    def add(self, key, amount):
+        position = self._get_position(key)
+        _VALUE.pack_into(self._mmap, position, _VALUE.unpack_from(self._mmap, position)[0] + amount)
+
+    def set(self, key, value):
+        _VALUE.pack_into(self._mmap, self._get_position(key), value)
+
+    def items(self):
+        return [(key, value) for key, value, _ in read_values(self._mmap)]
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+
+class MemoryValues:
+    """
+    {key: float} kept in the memory of the process.
+    """
+
+    def __init__(self):
+        self._values = {}
+
+    def add(self, key, amount):
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set(self, key, value):
+        self._values[key] = value
+
+    def items(self):
+        return list(self._values.items())
+
+    def close(self):
+        pass
+
+
+_stores = {}
+_stores_pid = None
+_lock = threading.Lock()
+
+
+def get_store(kind):
+    """
+    :return: the values of `kind` of the current process, in a file of METRICS['DIRECTORY'] if it is set
+    """
+    global _stores_pid
+    if _stores_pid != os.getpid():
+        # The files of a parent process are its own, a forked process writes its values in new files
+        _stores.clear()
+        _stores_pid = os.getpid()
+    store = _stores.get(kind)
+    if store is None:
+        directory = get_metrics_setting('DIRECTORY')
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            store = MmapedValues(os.path.join(directory, '%s_%s.db' % (kind, os.getpid())))
+        else:
+            store = MemoryValues()
+        _stores[kind] = store
+    return store
+
+
+def clear_directory(directory):
+    """
+    Remove the files of the previous processes. Called by the `on_starting` hook of gunicorn.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for filename in glob.glob(os.path.join(directory, '*.db')):
+        os.remove(filename)
+
+
+def mark_process_dead(pid, directory):
+    """
+    Remove the gauges of the process `pid`. Called by the `child_exit` hook of gunicorn.
+    """
+    filename = os.path.join(directory, '%s_%s.db' % (KIND_GAUGE, pid))
+    if os.path.exists(filename):
+        os.remove(filename)
+
+
+_registry = {}
+
+
+class Metric:
+    kind = None
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=(), get_default_labelvalues=None):
+        """
+        :param name:
+        :param documentation:
+        :param labelnames:
+        :param get_default_labelvalues: called when collecting, return the label values which are exposed even if
+            they were never recorded
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.get_default_labelvalues = get_default_labelvalues
+        # label values: keys of the values, so json is not encoded on every record
+        self._keys = {}
+        _registry[name] = self
+
+    def get_key(self, labelvalues, suffix=''):
+        return json.dumps([self.name, suffix, [str(value) for value in labelvalues]])
+
+    def _get_key(self, labelvalues):
+        key = self._keys.get(labelvalues)
+        if key is None:
+            key = self._keys[labelvalues] = self.get_key(labelvalues)
+        return key
+
+
+class Counter(Metric):
+    kind = KIND_COUNTER
+    type_name = 'counter'
+
+    def inc(self, *labelvalues, amount=1):
+        key = self._get_key(labelvalues)
+        with _lock:
+            get_store(self.kind).add(key, amount)
+
+
+class Gauge(Metric):
+    """
+    A value per process, the exposed value is the sum over the running processes.
+    """
+    kind = KIND_GAUGE
+    type_name = 'gauge'
+
+    def inc(self, *labelvalues, amount=1):
+        key = self._get_key(labelvalues)
+        with _lock:
+            get_store(self.kind).add(key, amount)
+
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def set(self, *labelvalues, value):
+        key = self._get_key(labelvalues)
+        with _lock:
+            get_store(self.kind).set(key, value)
+
+
+class Histogram(Metric):
+    kind = KIND_HISTOGRAM
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, **kwargs):
+        super(Histogram, self).__init__(name, documentation, labelnames, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        self.bucket_labels = tuple(format_value(bucket) for bucket in self.buckets) + (INF,)
+
+    def _get_key(self, labelvalues):
+        keys = self._keys.get(labelvalues)
+        if keys is None:
+            keys = self._keys[labelvalues] = (
+                [self.get_key(labelvalues, le) for le in self.bucket_labels], self.get_key(labelvalues, SUFFIX_SUM))
+        return keys
+
+    def observe(self, value, *labelvalues):
+        bucket_keys, sum_key = self._get_key(labelvalues)
+        # the buckets are not cumulative in the store, `generate_latest` adds them up
+        bucket_key = bucket_keys[bisect_left(self.buckets, value)]
+        with _lock:
+            store = get_store(self.kind)
+            store.add(bucket_key, 1)
+            store.add(sum_key, value)
+
+
+def collect(directory=None):
+    """
+    :param directory: METRICS['DIRECTORY'] by default
+    :return: {key: value}, summed over the processes
+    """
+    directory = directory or get_metrics_setting('DIRECTORY')
+    totals = defaultdict(float)
+    if directory:
+        for filename in glob.glob(os.path.join(directory, '*.db')):
+            try:
+                with open(filename, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                # the process exited meanwhile
+                continue
+            for key, value, _ in read_values(data):
+                totals[key] += value
+    else:
+        with _lock:
+            items = [item for store in _stores.values() for item in store.items()] if _stores_pid == os.getpid() else []
+        for key, value in items:
+            totals[key] += value
+    return totals
+
+
+def format_value(value):
+    if value == float('inf'):
+        return INF
+    return repr(float(value)) if not float(value).is_integer() else '%.1f' % value
+
+
+def escape_label_value(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('%s="%s"' % (name, escape_label_value(value)) for name, value in pairs) + '}'
+
+
+def generate_latest(directory=None):
+    """
+    :return: the metrics in the Prometheus text format
+    """
+    # metric name: {label values: {suffix: value}}
+    samples = defaultdict(lambda: defaultdict(dict))
+    for key, value in collect(directory).items():
+        name, suffix, labelvalues = json.loads(key)
+        samples[name][tuple(labelvalues)][suffix] = value
+
+    lines = []
+    for name in sorted(_registry):
+        metric = _registry[name]
+        series = samples.get(name, {})
+        if metric.get_default_labelvalues is not None:
+            for labelvalues in metric.get_default_labelvalues():
+                series.setdefault(tuple(str(value) for value in labelvalues), {})
+        lines.append('# HELP %s %s' % (name, metric.documentation))
+        lines.append('# TYPE %s %s' % (name, metric.type_name))
+        for labelvalues in sorted(series):
+            values = series[labelvalues]
+            if metric.kind != KIND_HISTOGRAM:
+                lines.append('%s%s %s' % (name, format_labels(metric.labelnames, labelvalues),
+                                          format_value(values.get('', 0.0))))
+                continue
+            count = 0.0
+            for le in metric.bucket_labels:
+                count += values.get(le, 0.0)
+                lines.append('%s_bucket%s %s' % (name, format_labels(metric.labelnames, labelvalues, [('le', le)]),
+                                                 format_value(count)))
+            labels = format_labels(metric.labelnames, labelvalues)
+            lines.append('%s_sum%s %s' % (name, labels, format_value(values.get(SUFFIX_SUM, 0.0))))
+            lines.append('%s_count%s %s' % (name, labels, format_value(count)))
+    return '\n'.join(lines) + '\n'
+
+
+def is_allowed(address):
+    """
+    :return: whether `address` is in METRICS['ALLOWED_NETWORKS']
+    """
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    networks = get_metrics_setting('ALLOWED_NETWORKS', ('127.0.0.0/8', '::1/128'))
+    return any(address in ipaddress.ip_network(network) for network in networks)
+
+
+def metrics_view(request):
+    """
+    The metrics of all the workers, for the hosts of METRICS['ALLOWED_NETWORKS'] only.
+    """
+    if not is_allowed(request.META.get('REMOTE_ADDR', '')):
+        raise Http404()
+    return HttpResponse(generate_latest(), content_type=CONTENT_TYPE)
+
+
+def get_error_codes():
+    from common.exceptions import APIExceptionMeta
+
+    return [(error_code,) for error_code in APIExceptionMeta.error_codes]
+
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Duration of the requests of BaseAPIView, per view, method and status.',
+    ('view', 'method', 'status'))
+API_ERRORS = Counter(
+    'api_errors_total', 'Exceptions handled by common.exceptions.exception_handler, per error code.',
+    ('error_code',), get_default_labelvalues=get_error_codes)
+ASYNC_TASKS_IN_FLIGHT = Gauge(
+    'async_tasks_in_flight', 'Tasks of should_asynchronous being run, per executor.', ('executor',))
@@ -0,0 +1,182 @@
+import base64
+import binascii
+import datetime
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from common.exceptions import InvalidParameters
+
+CURSOR_DIRECTION_NEXT = 'n'
+CURSOR_DIRECTION_PREVIOUS = 'p'
+DEFAULT_ORDERING = ('-id',)
+UNIQUE_ORDERING_FIELDS = ('id', 'pk')
+
+
+class CursorJSONEncoder(DjangoJSONEncoder):
+    """
+    DjangoJSONEncoder truncates datetime values to milliseconds, which is not precise enough to seek on.
+    Keep the full precision for the values stored in a cursor.
+    """
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super(CursorJSONEncoder, self).default(o)
+
+
+def normalize_ordering(sort_options=(), tie_breaker='id'):
+    """
+    Turn `sort_options` into a list of `(field_name, descending)` that always ends with a unique key,
+    so every row has a distinct position in the ordering.
+
+    :param sort_options: field names accepted by `QuerySet.order_by`, e.g. ('-created_at', 'name')
+    :param tie_breaker: a unique field used to break ties, added with the direction of the last sort key
+    :return: list of (field_name, descending)
+    """
+    ordering = []
+    for option in sort_options or DEFAULT_ORDERING:
+        if not isinstance(option, str) or not option or option == '?':
+            raise InvalidParameters(detail='Invalid sort option: %s' % option)
+        if option.startswith('-'):
+            ordering.append((option[1:], True))
+        else:
+            ordering.append((option.lstrip('+'), False))
+
+    names = [name for name, _ in ordering]
+    if tie_breaker not in names and not set(names).intersection(UNIQUE_ORDERING_FIELDS):
+        ordering.append((tie_breaker, ordering[-1][1]))
+    return ordering
+
+
+def get_ordering_value(obj, name):
+    """
+    Resolve a (possibly related, e.g. `author__name`) ordering field name on a model instance.
+    """
+    for attr in name.split('__'):
+        if obj is None:
+            return None
+        obj = getattr(obj, attr)
+    return obj
+
+
+class KeysetPage:
+    def __init__(self, object_list, has_next, has_previous, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset by seeking on its sort keys instead of using OFFSET.
+
+    The ordering is composite: rows are compared on every sort key in turn, ties are broken by the unique
+    `tie_breaker` field. Each page is fetched with a single query of `page_size + 1` rows; the extra row tells
+    whether there is another page, so no COUNT query is needed.
+
+    Cursors are opaque url-safe strings which encode the direction, the ordering and the sort key values of the
+    first/last row of a page. A cursor is only valid for the ordering it was created with.
+
+    .. note::
+        Sort keys should not be nullable: NULL values can not be compared, so rows with a NULL sort key are skipped
+        once the paginator has to seek past them.
+    """
+
+    def __init__(self, queryset, page_size, ordering=(), tie_breaker='id'):
+        self.queryset = queryset
+        self.page_size = int(page_size)
+        self.ordering = normalize_ordering(ordering, tie_breaker=tie_breaker)
+        self._ordering_signature = [('-' if desc else '') + name for name, desc in self.ordering]
+
+    def _order_by(self, reverse=False):
+        return [('-' if desc != reverse else '') + name for name, desc in self.ordering]
+
+    def _seek_filter(self, values, reverse=False):
+        """
+        Build `(k1 > v1) OR (k1 = v1 AND k2 > v2) OR ...` with the comparison flipped for descending keys.
+        The leading `k1 >= v1` is redundant but lets the database use a range scan on the first key's index.
+        """
+        conditions = None
+        equal = {}
+        for (name, desc), value in zip(self.ordering, values):
+            lookup = 'gt' if desc == reverse else 'lt'
+            clause = Q(**equal) & Q(**{'%s__%s' % (name, lookup): value})
+            conditions = clause if conditions is None else conditions | clause
+            equal[name] = value
+
+        first_name, first_desc = self.ordering[0]
+        first_lookup = 'gte' if first_desc == reverse else 'lte'
+        return Q(**{'%s__%s' % (first_name, first_lookup): values[0]}) & conditions
+
+    def encode_cursor(self, obj, direction):
+        payload = {
+            'd': direction,
+            'o': self._ordering_signature,
+            'v': [get_ordering_value(obj, name) for name, _ in self.ordering],
+        }
+        data = json.dumps(payload, cls=CursorJSONEncoder, separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+    def decode_cursor(self, cursor):
+        """
+        :param cursor:
+        :return: (direction, values)
+        :raise InvalidParameters: if the cursor is malformed or was created for another ordering
+        """
+        try:
+            data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            payload = json.loads(data.decode('utf-8'))
+            direction, ordering, values = payload['d'], payload['o'], payload['v']
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise InvalidParameters(detail='Invalid cursor.')
+
+        if direction not in (CURSOR_DIRECTION_NEXT, CURSOR_DIRECTION_PREVIOUS) \
+                or ordering != self._ordering_signature or len(values) != len(self.ordering):
+            raise InvalidParameters(detail='Invalid cursor.')
+        return direction, values
+
+    def get_page(self, cursor=None, offset=0):
+        """
+        Return the page after (or before, for a previous-page cursor) the row encoded in `cursor`.
+
+        :param cursor: a cursor returned as `next_cursor` or `previous_cursor` of another page
+        :param offset: only used without cursor, to keep supporting page numbers for shallow pages
+        :return: KeysetPage
+        """
+        direction, values = CURSOR_DIRECTION_NEXT, None
+        if cursor:
+            direction, values = self.decode_cursor(cursor)
+            offset = 0
+        backward = direction == CURSOR_DIRECTION_PREVIOUS
+
+        qs = self.queryset.order_by(*self._order_by(reverse=backward))
+        if values is not None:
+            qs = qs.filter(self._seek_filter(values, reverse=backward))
+
+        rows = list(qs[offset:offset + self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if backward:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, values is not None or offset > 0
+
+        return KeysetPage(
+            object_list=rows,
+            has_next=has_next,
+            has_previous=has_previous,
+            next_cursor=self.encode_cursor(rows[-1], CURSOR_DIRECTION_NEXT) if rows and has_next else None,
+            previous_cursor=self.encode_cursor(rows[0], CURSOR_DIRECTION_PREVIOUS) if rows and has_previous else None,
+        )
@@ -0,0 +1,24 @@
+from django.conf import settings
+from rest_framework import parsers
+from rest_framework.exceptions import ParseError
+from rest_framework.utils import json
+
+from common import json_engine
+
+
+class JSONParser(parsers.JSONParser):
+    """
+    REST framework's JSONParser, decoding UTF-8 bodies with `common.json_engine`.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if json_engine.get_engine() != json_engine.ENGINE_ORJSON or not self.strict \
+                or encoding.lower().replace('-', '') != 'utf8':
+            return super(JSONParser, self).parse(stream, media_type, parser_context)
+
+        try:
+            # NaN and Infinity are rejected like by REST framework's strict parser
+            return json_engine.loads(stream.read(), parse_constant=json.strict_constant)
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
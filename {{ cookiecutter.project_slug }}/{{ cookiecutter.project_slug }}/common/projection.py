@@ -0,0 +1,330 @@
+"""
+Queryset projection of the paginator helpers: the columns and relations a serializer reads, computed once per
+serializer and model, are applied to the queryset before it is paginated:
+
+    - `only()` of the columns of the fields, or `values()` when every field is a plain column
+    - `select_related` of the foreign keys and one-to-one relations read by nested serializers and dotted sources
+    - `prefetch_related` of the reverse and many-to-many relations, with the projection of their nested serializer
+
+A field whose source is not a model field (a SerializerMethodField, a property, source='*') may read any attribute, so
+all the columns of its model are loaded. The serializers override the plan with Meta.projection:
+
+    class Meta:
+        # the queryset is not changed
+        projection = False
+        # or: the columns read by the method fields and properties, their model is projected anyway
+        projection = {
+            'only': ('first_name', 'last_name'),
+            'select_related': ('company',),
+            'prefetch_related': ('groups',),
+            'values': False,
+        }
+
+`get_projection_plan(serializer_cls, queryset).report()` describes the plan, it is also logged at the DEBUG level when
+it is computed.
+"""
+import logging
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from django.db.models.query import ModelIterable
+from rest_framework import serializers
+
+from common import serializers as common_serializers
+
+logger = logging.getLogger('main')
+
+# fields which serialize a column as stored: the rows of values() give the same output as the instances
+VALUE_FIELDS = (
+    serializers.BooleanField, serializers.CharField, serializers.IntegerField,
+    serializers.FloatField, serializers.DecimalField, serializers.DateTimeField, serializers.DateField,
+    serializers.TimeField, serializers.DurationField, serializers.ChoiceField, serializers.UUIDField,
+    serializers.JSONField,
+)
+
+_plans = {}
+
+
+def get_projection_setting(name, default=None):
+    return getattr(settings, 'PROJECTION', {}).get(name, default)
+
+
+def is_value_field(field):
+    # common.serializers imports common.utils, which imports this module: TimestampField is resolved on use
+    return isinstance(field, VALUE_FIELDS) or isinstance(field, common_serializers.TimestampField)
+
+
+def get_label(serializer):
+    return type(serializer).__name__
+
+
+class ProjectionPlan:
+    """
+    What a serializer reads from the instances of `model`:
+
+        - columns: field paths for `only()`, e.g. 'name', 'author' (the author_id column), 'author__name'
+        - full: relation path prefixes whose model is loaded with all its columns, '' for `model` itself
+        - select_related: relation paths
+        - prefetches: {relation path: ProjectionPlan of the related model}
+        - prefetch_lookups: relation paths prefetched without projection, from Meta.projection
+        - values: the field names for `values()`, None when the serializer needs instances
+        - enabled: False when the serializer opted out (Meta.projection = False)
+        - notes: why, for the report
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.columns = set()
+        self.full = set()
+        self.select_related = set()
+        self.prefetches = {}
+        self.prefetch_lookups = set()
+        self.values = None
+        self.enabled = True
+        self.notes = []
+
+    def set_full(self, path, note):
+        self.full.add(path)
+        self.notes.append(note)
+
+    def add_prefetch(self, path, model):
+        plan = self.prefetches.get(path)
+        if plan is None:
+            plan = self.prefetches[path] = ProjectionPlan(model)
+        return plan
+
+    def get_only(self, extra_columns=()):
+        """
+        :return: the field paths for `only()`, None to load all the columns
+        """
+        full = self.full
+        columns = {column for column in self.columns.union(extra_columns)
+                   if not any(path and column.startswith(path) for path in full)}
+        if '' in full:
+            if not any('__' in column for column in columns):
+                return None
+            # a related model is projected: the columns of `model` must be listed
+            columns.update(field.name for field in self.model._meta.concrete_fields)
+        return sorted(columns)
+
+    def apply(self, queryset, values=False, extra_columns=()):
+        """
+        :param queryset: of `model`, left as is when it is already projected (`values()`, `only()`, `defer()`)
+        :param values: whether rows of values() can replace the instances
+        :param extra_columns: field paths read by the caller, e.g. the ordering of a keyset paginator
+        """
+        if not self.enabled or queryset._iterable_class is not ModelIterable \
+                or queryset.query.deferred_loading != (frozenset(), True):
+            return queryset
+        if values and self.values is not None and not extra_columns:
+            return queryset.values(*self.values)
+
+        select_related = set(self.select_related)
+        for column in extra_columns:
+            # e.g. 'author__name': the keyset paginator reads obj.author.name
+            parts = column.split('__')[:-1]
+            select_related.update('__'.join(parts[:index + 1]) for index in range(len(parts)))
+        if select_related:
+            queryset = queryset.select_related(*sorted(select_related))
+
+        seen = {lookup if isinstance(lookup, str) else lookup.prefetch_to
+                for lookup in queryset._prefetch_related_lookups}
+        prefetches = [Prefetch(path, queryset=plan.apply(plan.model._default_manager.all()))
+                      for path, plan in sorted(self.prefetches.items()) if path not in seen]
+        prefetches += [path for path in sorted(self.prefetch_lookups.difference(self.prefetches)) if path not in seen]
+        if prefetches:
+            queryset = queryset.prefetch_related(*prefetches)
+
+        only = self.get_only(extra_columns)
+        if only is not None:
+            queryset = queryset.only(*only)
+        return queryset
+
+    def describe(self):
+        if not self.enabled:
+            return {'enabled': False}
+        return {
+            'only': self.get_only(),
+            'values': self.values,
+            'select_related': sorted(self.select_related),
+            'prefetch_related': dict({path: None for path in self.prefetch_lookups},
+                                     **{path: plan.describe() for path, plan in self.prefetches.items()}),
+            'notes': self.notes,
+        }
+
+    def report(self, indent=''):
+        lines = ['%s%s' % (indent, self.model._meta.label)]
+        if not self.enabled:
+            return '\n'.join(lines + ['%s  projection disabled by Meta.projection' % indent])
+        only = self.get_only()
+        lines.append('%s  only: %s' % (indent, ', '.join(only) if only is not None else 'all the columns'))
+        if self.values is not None:
+            lines.append('%s  values: %s' % (indent, ', '.join(self.values)))
+        if self.select_related:
+            lines.append('%s  select_related: %s' % (indent, ', '.join(sorted(self.select_related))))
+        for path, plan in sorted(self.prefetches.items()):
+            lines.append('%s  prefetch_related: %s' % (indent, path))
+            lines.append(plan.report(indent + '    '))
+        for path in sorted(self.prefetch_lookups.difference(self.prefetches)):
+            lines.append('%s  prefetch_related: %s, not projected' % (indent, path))
+        lines.extend('%s  - %s' % (indent, note) for note in self.notes)
+        return '\n'.join(lines)
+
+
+def get_options(serializer):
+    return getattr(getattr(serializer, 'Meta', None), 'projection', None)
+
+
+def add_serializer(plan, serializer, model, prefix='', annotations=()):
+    """
+    Add what `serializer` reads from the instances of `model`, reached from the instances of `plan.model` by the
+    relation path `prefix`, e.g. 'author__'.
+    """
+    options = get_options(serializer)
+    if options is False:
+        plan.set_full(prefix, '%s: Meta.projection is False' % get_label(serializer))
+        return
+    options = options or {}
+    vouched = 'only' in options
+    plan.columns.update(prefix + name for name in options.get('only', ()))
+    plan.select_related.update(prefix + path for path in options.get('select_related', ()))
+    plan.prefetch_lookups.update(prefix + path for path in options.get('prefetch_related', ()))
+    for field in serializer._readable_fields:
+        add_field(plan, field, model, prefix, annotations, vouched)
+
+
+def add_field(plan, field, model, prefix, annotations, vouched):
+    label = '%s.%s' % (get_label(field.parent), field.field_name)
+    if field.source == '*':
+        if isinstance(field, serializers.BaseSerializer):
+            add_serializer(plan, field, model, prefix, annotations)
+        elif not vouched:
+            plan.set_full(prefix, '%s reads the instance, all the columns of %s are loaded' % (
+                label, model._meta.label))
+        return
+
+    path = prefix
+    attrs = field.source_attrs
+    for index, attr in enumerate(attrs):
+        last = index == len(attrs) - 1
+        if index == 0 and attr in annotations:
+            return
+        try:
+            model_field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            if not vouched:
+                plan.set_full(path, '%s reads %s, which is not a field of %s: all its columns are loaded' % (
+                    label, attr, model._meta.label))
+            return
+        if not model_field.is_relation:
+            plan.columns.add(path + attr)
+            return
+
+        related_model = model_field.related_model
+        if model_field.many_to_many or model_field.one_to_many:
+            add_many_relation(plan.add_prefetch(path + attr, related_model), field, model_field, label, last)
+            return
+
+        # foreign key or one-to-one
+        if model_field.concrete:
+            plan.columns.add(path + attr)
+        if last and isinstance(field, serializers.RelatedField) and field.use_pk_only_optimization():
+            if not model_field.concrete:
+                plan.select_related.add(path + attr)
+                plan.columns.add(path + attr + '__' + related_model._meta.pk.name)
+            return
+        plan.select_related.add(path + attr)
+        path += attr + '__'
+        model = related_model
+        if not last:
+            continue
+        if isinstance(field, serializers.BaseSerializer):
+            add_serializer(plan, field, model, path)
+        elif isinstance(field, serializers.SlugRelatedField):
+            plan.columns.add(path + field.slug_field)
+        else:
+            plan.set_full(path, '%s reads the %s instance, all its columns are loaded' % (label, model._meta.label))
+
+
+def add_many_relation(plan, field, model_field, label, last):
+    """
+    :param plan: of the prefetched queryset
+    """
+    if model_field.one_to_many:
+        # the foreign key to the parent, to match the prefetched rows
+        plan.columns.add(model_field.field.name)
+    if not last:
+        plan.set_full('', '%s reads through %s, all its columns are loaded' % (label, model_field.name))
+    elif isinstance(field, serializers.ListSerializer):
+        add_serializer(plan, field.child, plan.model)
+    elif isinstance(field, serializers.ManyRelatedField) and field.child_relation.use_pk_only_optimization():
+        pass
+    elif isinstance(field, serializers.ManyRelatedField) \
+            and isinstance(field.child_relation, serializers.SlugRelatedField):
+        plan.columns.add(field.child_relation.slug_field)
+    else:
+        plan.set_full('', '%s reads the %s instances, all their columns are loaded' % (
+            label, plan.model._meta.label))
+
+
+def get_values(serializer, plan, annotations):
+    """
+    :return: the field names for values(), or None when the serializer needs instances
+    """
+    options = get_options(serializer) or {}
+    if not options.get('values', True) or options.get('only') is not None:
+        return None
+    if plan.full or plan.select_related or plan.prefetches or plan.prefetch_lookups:
+        return None
+    # a custom to_representation may read anything from the instance
+    if type(serializer).to_representation is not serializers.Serializer.to_representation:
+        return None
+    names = []
+    for field in serializer._readable_fields:
+        if not is_value_field(field) or len(field.source_attrs) != 1 or field.source == '*':
+            return None
+        name = field.source_attrs[0]
+        if name not in annotations:
+            try:
+                model_field = plan.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                return None
+            if not model_field.concrete or model_field.is_relation:
+                return None
+        names.append(name)
+    return names
+
+
+def get_projection_plan(serializer_cls, queryset):
+    """
+    :return: the ProjectionPlan of `serializer_cls` for `queryset`, cached per serializer, model and annotations
+    """
+    annotations = tuple(sorted(queryset.query.annotations))
+    key = (serializer_cls, queryset.model, annotations)
+    plan = _plans.get(key)
+    if plan is None:
+        serializer = serializer_cls()
+        plan = ProjectionPlan(queryset.model)
+        if get_options(serializer) is False:
+            plan.enabled = False
+        else:
+            add_serializer(plan, serializer, queryset.model, annotations=annotations)
+            if get_projection_setting('VALUES', True):
+                plan.values = get_values(serializer, plan, annotations)
+        _plans[key] = plan
+        logger.debug('projection|serializer=%s|%s', serializer_cls.__name__,
+                     '|'.join(line.strip() for line in plan.report().splitlines()))
+    return plan
+
+
+def project(queryset, serializer_cls, values=False, extra_columns=(), enabled=None):
+    """
+    :param enabled: None for settings.PROJECTION['ENABLED']
+    :return: `queryset` with the projection of `serializer_cls`, see ProjectionPlan.apply
+    """
+    if enabled is None:
+        enabled = get_projection_setting('ENABLED', True)
+    if not enabled:
+        return queryset
+    return get_projection_plan(serializer_cls, queryset).apply(queryset, values=values, extra_columns=extra_columns)
@@ -0,0 +1,26 @@
+from rest_framework import renderers
+
+from common import json_engine
+
+LINE_SEPARATORS = ((b'\xe2\x80\xa8', b'\\u2028'), (b'\xe2\x80\xa9', b'\\u2029'))
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    """
+    REST framework's JSONRenderer, encoding with `common.json_engine`.
+
+    The output is the same as REST framework's for compact, non ASCII escaped responses (the defaults). Indented
+    responses (`Accept: application/json; indent=4`) and the other options use REST framework's renderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if json_engine.get_engine() != json_engine.ENGINE_ORJSON or data is None or not self.compact \
+                or self.ensure_ascii or self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super(JSONRenderer, self).render(data, accepted_media_type, renderer_context)
+
+        ret = json_engine.dumps_bytes(data, default=self.encoder_class().default)
+        # Same as REST framework: U+2028 and U+2029 are valid in JSON but not in javascript
+        for separator, escaped in LINE_SEPARATORS:
+            if separator in ret:
+                ret = ret.replace(separator, escaped)
+        return ret
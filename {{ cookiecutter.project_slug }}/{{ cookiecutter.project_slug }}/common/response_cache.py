@@ -0,0 +1,246 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+from common.counts import normalize_search_options
+from common.invalidation import bump_model_generation, get_model_generations, get_model_label, watch_model
+
+RESPONSE_CACHE_KEY_FORMAT = 'response:%s'
+
+SCOPE_USER = 'user'
+SCOPE_PUBLIC = 'public'
+
+
+def get_response_cache_setting(name, default=None):
+    return getattr(settings, 'RESPONSE_CACHE', {}).get(name, default)
+
+
+class LRUBackend:
+    """
+    Responses kept in the memory of the process, at most `max_entries`, the least recently used are evicted.
+    """
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._entries[key] = (time.time() + timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class DjangoCacheBackend:
+    """
+    Responses stored in a cache of settings.CACHES, shared by the processes if the cache is.
+    """
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+
+    def get(self, key):
+        return caches[self.alias].get(key)
+
+    def set(self, key, value, timeout):
+        caches[self.alias].set(key, value, timeout)
+
+
+class FileBackend:
+    """
+    Responses stored as files in `directory`, shared by the processes of the host.
+    """
+
+    def __init__(self, directory, max_entries=10000):
+        self.cache = FileBasedCache(directory, {'OPTIONS': {'MAX_ENTRIES': max_entries}})
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value, timeout):
+        self.cache.set(key, value, timeout)
+
+
+BACKEND_CLASSES = {
+    'lru': LRUBackend,
+    'django': DjangoCacheBackend,
+    'file': FileBackend,
+}
+
+_backends = {}
+
+
+def get_backend(name=None):
+    """
+    Build the backend `name` (RESPONSE_CACHE['DEFAULT'] by default) from RESPONSE_CACHE['BACKENDS'], e.g.
+
+        RESPONSE_CACHE = {
+            'DEFAULT': 'local',
+            'BACKENDS': {
+                'local': {'BACKEND': 'lru', 'MAX_ENTRIES': 1000},
+                'shared': {'BACKEND': 'django', 'ALIAS': 'default'},
+                'disk': {'BACKEND': 'file', 'DIRECTORY': '/tmp/responses'},
+            },
+        }
+    """
+    name = name or get_response_cache_setting('DEFAULT', 'local')
+    backend = _backends.get(name)
+    if backend is None:
+        options = dict(get_response_cache_setting('BACKENDS', {}).get(name, {'BACKEND': 'lru'}))
+        backend_cls = BACKEND_CLASSES[options.pop('BACKEND', 'lru')]
+        backend = _backends[name] = backend_cls(**{key.lower(): value for key, value in options.items()})
+    return backend
+
+
+def get_plain_data(data):
+    """
+    :return: a plain copy of the ReturnList or ReturnDict of a serializer, which references the serializer, and
+        through it the instances and the context of the request: the cache keeps the data only
+    """
+    if isinstance(data, list):
+        return list(data)
+    if isinstance(data, dict):
+        return dict(data)
+    return data
+
+
+def is_not_modified(request, etag, last_modified):
+    """
+    Evaluate the conditional headers of `request`, If-None-Match first as in RFC 7232.
+    """
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = [e[2:] if e.startswith('W/') else e for e in parse_etags(if_none_match)]
+        return '*' in etags or etag in etags
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE') or '')
+    return bool(last_modified and if_modified_since and int(last_modified) <= if_modified_since)
+
+
+class ResponseCache:
+    """
+    Cache the responses of the GET handler of a view with the attributes of `BaseAPIView`:
+
+        - response_cache_timeout: in seconds, None to disable the cache
+        - response_cache_models: the models the responses are built from
+        - response_cache_scope: SCOPE_USER if the responses depend on the user, SCOPE_PUBLIC otherwise
+        - response_cache_backend: the name of a backend of RESPONSE_CACHE['BACKENDS']
+
+    The key of a response is derived from the view, the validated GET serializer data (or the query params), the
+    user for SCOPE_USER, the generations of `response_cache_models`, which change on their post_save/post_delete
+    (see `common.invalidation`), and the current period of `response_cache_timeout` seconds. So the ETag is known
+    before running the view, and `If-None-Match` or `If-Modified-Since` (against the last change of the models or the
+    start of the period) are answered with 304 Not Modified. The period bounds the staleness of the changes which do
+    not send signals (`QuerySet.update`, raw SQL) for the clients too: their ETag expires with the cached response.
+
+    Only 200 responses are cached.
+    """
+
+    def __init__(self, view_cls):
+        self.name = '%s.%s' % (view_cls.__module__, view_cls.__qualname__)
+        self.timeout = view_cls.response_cache_timeout
+        self.models = tuple(view_cls.response_cache_models or ())
+        self.scope = view_cls.response_cache_scope
+        self.backend_name = view_cls.response_cache_backend
+        # already watched when the view class was created (SerializerValidationMeta)
+        for model_cls in self.models:
+            watch_model(model_cls)
+
+    def get_period_start(self):
+        """
+        :return: the start of the current period of `timeout` seconds, as a unix timestamp
+        """
+        return int(time.time() // self.timeout * self.timeout)
+
+    def get_generations(self):
+        if not self.models:
+            return {}
+        generations = get_model_generations(*self.models)
+        unknown = [m for m in self.models if not generations[get_model_label(m)]]
+        if unknown:
+            # Not changed since the cache was cleared: start from now, so there is a Last-Modified
+            for model_cls in unknown:
+                bump_model_generation(model_cls)
+            generations = get_model_generations(*self.models)
+        return generations
+
+    def get_scope(self, request):
+        if self.scope == SCOPE_PUBLIC:
+            return ''
+        user = request.user
+        return str(user.pk) if user and user.is_authenticated else 'anonymous'
+
+    def get_key(self, request, serializer, generations, period_start):
+        """
+        :return: the digest of the response, or None if the request data can not be part of a key
+        """
+        params = serializer.validated_data if serializer is not None else request.query_params.lists()
+        normalized = normalize_search_options({
+            'view': self.name,
+            'scope': self.get_scope(request),
+            'params': dict(params),
+            'generations': generations,
+            'period': period_start,
+        })
+        if normalized is None:
+            return None
+        return hashlib.md5(normalized.encode('utf-8')).hexdigest()
+
+    def set_headers(self, response, etag, last_modified):
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = '%s, no-cache' % ('public' if self.scope == SCOPE_PUBLIC else 'private')
+        return response
+
+    def respond(self, request, serializer, handler):
+        """
+        :param request: the REST framework request
+        :param serializer: the validated serializer, or None
+        :param handler: called without arguments to build the response on a miss
+        :return: Response
+        """
+        generations = self.get_generations()
+        period_start = self.get_period_start()
+        digest = self.get_key(request, serializer, generations, period_start)
+        if digest is None:
+            return handler()
+
+        etag = '"%s"' % digest
+        last_modified = max(list(generations.values()) + [period_start])
+        if is_not_modified(request, etag, last_modified):
+            return self.set_headers(Response(status=status.HTTP_304_NOT_MODIFIED), etag, last_modified)
+
+        backend = get_backend(self.backend_name)
+        key = RESPONSE_CACHE_KEY_FORMAT % digest
+        data = backend.get(key)
+        if data is not None:
+            return self.set_headers(Response(data), etag, last_modified)
+
+        response = handler()
+        if response.status_code == status.HTTP_200_OK and getattr(response, 'data', None) is not None:
+            # the key is not used after the period
+            backend.set(key, get_plain_data(response.data), max(period_start + self.timeout - time.time(), 1))
+            self.set_headers(response, etag, last_modified)
+        return response
@@ -0,0 +1,51 @@
+"""
+Serializer fields of unix timestamps, backed by the datetime helpers of common.utils:
+
+    class EventSerializer(serializers.ModelSerializer):
+        created_at = TimestampField()
+        updated_at = TimestampSecondsField(read_only=True)
+
+        class Meta:
+            model = Event
+            fields = ('id', 'created_at', 'updated_at')
+"""
+from django.utils.translation import gettext_lazy as _
+from rest_framework import serializers
+
+from common import utils
+
+
+class TimestampField(serializers.Field):
+    """
+    A datetime as unix milliseconds: datetime_to_utc_unix_ms to represent it, utc_unix_to_current_datetime to parse it.
+    """
+    default_error_messages = {
+        'invalid': _('A valid integer is required.'),
+    }
+    # the input is multiplied by this to get milliseconds
+    input_multiplier = 1
+
+    def to_unix(self, value):
+        return utils.datetime_to_utc_unix_ms(value)
+
+    def to_representation(self, value):
+        return self.to_unix(value)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('invalid')
+        try:
+            value = int(data)
+        except (TypeError, ValueError):
+            self.fail('invalid')
+        return utils.utc_unix_to_current_datetime(value * self.input_multiplier)
+
+
+class TimestampSecondsField(TimestampField):
+    """
+    A datetime as unix seconds: datetime_to_utc_unix to represent it.
+    """
+    input_multiplier = 1000
+
+    def to_unix(self, value):
+        return utils.datetime_to_utc_unix(value)
@@ -0,0 +1,79 @@
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+
+# `IN (%s, %s, %s)` and `VALUES (%s, %s), (%s, %s)` of different lengths are the same template
+_REPEATED_PLACEHOLDERS = re.compile(r'%s(?:\s*,\s*%s)+')
+_REPEATED_ROWS = re.compile(r'\(%s\)(?:\s*,\s*\(%s\))+')
+SQL_MAX_LENGTH = 200
+
+
+def get_template(sql):
+    return _REPEATED_ROWS.sub('(%s)', _REPEATED_PLACEHOLDERS.sub('%s', sql))
+
+
+def shorten(sql, max_length=SQL_MAX_LENGTH):
+    return sql if len(sql) <= max_length else sql[:max_length - 3] + '...'
+
+
+class QueryRecorder:
+    """
+    An execute wrapper (see `connection.execute_wrapper`) which counts the queries of a request, their total time,
+    the slowest one and how many times every statement ran, whatever the value of DEBUG.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest_duration = 0.0
+        self.slowest_sql = None
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.duration += duration
+            self.statements[sql] += 1
+            if duration > self.slowest_duration:
+                self.slowest_duration = duration
+                self.slowest_sql = sql
+
+    @contextmanager
+    def record(self):
+        """
+        Record the queries of all the databases of the current thread (or greenlet).
+        """
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+    def get_most_repeated(self):
+        """
+        :return: (template, count) of the statement which ran the most times, placeholders lists collapsed, or
+            (None, 0) if there was no query
+        """
+        if not self.statements:
+            return None, 0
+        templates = Counter()
+        for sql, count in self.statements.items():
+            templates[get_template(sql)] += count
+        return templates.most_common(1)[0]
+
+    def get_fields(self):
+        template, repeated = self.get_most_repeated()
+        return {
+            'sql_count': self.count,
+            'sql_ms': round(self.duration * 1000, 2),
+            'sql_slowest_ms': round(self.slowest_duration * 1000, 2),
+            'sql_slowest': shorten(self.slowest_sql) if self.slowest_sql else '',
+            'sql_repeated': repeated,
+            'sql_repeated_template': shorten(template) if repeated > 1 else '',
+        }
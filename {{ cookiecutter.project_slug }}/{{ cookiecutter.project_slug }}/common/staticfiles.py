@@ -0,0 +1,102 @@
+"""
+Storage of collectstatic: the names of the files contain the hash of their content (ManifestStaticFilesStorage), and
+a gzip variant, plus a brotli one when `brotli` is installed (`pip install brotli`), is written next to every hashed
+file, so nginx serves them as is (`gzip_static`) with a far-future cache.
+
+A hashed name changes with the content, so existing variants of a hashed name are up to date: when STATIC_ROOT is kept
+between releases, collectstatic only compresses the files which changed. The variants are deterministic, so rsync
+--checksum does not transfer them again either.
+
+The `static` template tag reads the manifest (staticfiles.json) of STATIC_ROOT and fails without it: every Django
+server runs collectstatic before it is reloaded (setup_django_service), not only the one nginx gets the files from.
+"""
+import gzip
+import io
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+SUFFIX_GZIP = '.gz'
+SUFFIX_BROTLI = '.br'
+
+# fonts as woff/woff2 and images are already compressed
+DEFAULT_EXTENSIONS = ('.css', '.js', '.map', '.json', '.svg', '.txt', '.html', '.xml', '.ico', '.ttf', '.eot', '.otf')
+DEFAULT_MIN_SIZE = 256
+
+
+def get_static_compression_setting(name, default=None):
+    return getattr(settings, 'STATIC_COMPRESSION', {}).get(name, default)
+
+
+def gzip_compress(data):
+    # mtime=0: the same content always gives the same bytes
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=9, mtime=0) as f:
+        f.write(data)
+    return buffer.getvalue()
+
+
+def brotli_compress(data):
+    return brotli.compress(data, quality=11)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Configured by settings.STATIC_COMPRESSION:
+
+        - ENABLED: False to only hash the files
+        - BROTLI: False to skip the brotli variants even if `brotli` is installed
+        - EXTENSIONS: the extensions of the files which are compressed
+        - MIN_SIZE: smaller files are not compressed, in bytes
+    """
+
+    def get_compressors(self):
+        compressors = [(SUFFIX_GZIP, gzip_compress)]
+        if brotli is not None and get_static_compression_setting('BROTLI', True):
+            compressors.append((SUFFIX_BROTLI, brotli_compress))
+        return compressors
+
+    def should_compress(self, name):
+        extensions = get_static_compression_setting('EXTENSIONS', DEFAULT_EXTENSIONS)
+        return os.path.splitext(name)[1].lower() in extensions
+
+    def compress(self, name, compressors):
+        """
+        Write the missing variants of `name`. A variant which is not smaller than the file is not written.
+
+        :return: the names of the written variants
+        """
+        missing = [(suffix, compress) for suffix, compress in compressors if not self.exists(name + suffix)]
+        if not missing:
+            return []
+        with self.open(name) as f:
+            data = f.read()
+        if len(data) < get_static_compression_setting('MIN_SIZE', DEFAULT_MIN_SIZE):
+            return []
+        written = []
+        for suffix, compress in missing:
+            compressed = compress(data)
+            if len(compressed) >= len(data):
+                continue
+            self._save(name + suffix, ContentFile(compressed))
+            written.append(name + suffix)
+        return written
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super(CompressedManifestStaticFilesStorage, self).post_process(paths, dry_run=dry_run, **options)
+        if dry_run or not get_static_compression_setting('ENABLED', True):
+            return
+        compressors = self.get_compressors()
+        # self.hashed_files: {original name: hashed name}, filled by the post processing of ManifestFilesMixin
+        for hashed_name in sorted(set(self.hashed_files.values())):
+            if not self.should_compress(hashed_name):
+                continue
+            for compressed_name in self.compress(hashed_name, compressors):
+                yield hashed_name, compressed_name, True
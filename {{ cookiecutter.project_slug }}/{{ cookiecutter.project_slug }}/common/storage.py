@@ -1,21 +1,137 @@
 import logging
-import urllib.request
+import socket
+import tempfile
+import threading
+import time
+from functools import lru_cache
 
+import urllib3
 from cloudinary import CloudinaryImage
 from cloudinary.uploader import upload
+from django.conf import settings
 from django.core.files import File
-from django.utils.timezone import now
+from gevent.pool import Pool
 
-from common.utils import log_execution_time, datetime_to_utc_unix
+from common.exceptions import FileTooLarge, StubHTTPError
+from common.utils import log_execution_time
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# Downloads bigger than this are spooled to a temporary file instead of memory
+DOWNLOAD_SPOOL_SIZE = 1024 * 1024
 
 logger = logging.getLogger('main')
 
 
+def get_storage_setting(name, default=None):
+    return getattr(settings, 'STORAGE', {}).get(name, default)
+
+
 class Storage:
+    # The function used to upload files, replace it to use another backend (or a fake one)
+    uploader = staticmethod(upload)
+    _http = None
+    _url_builder = None
+
+    @classmethod
+    def get_http(cls):
+        """
+        The connection pool used to download remote files, shared by all the downloads of the process.
+        """
+        if cls._http is None:
+            cls._http = urllib3.PoolManager(
+                num_pools=get_storage_setting('DOWNLOAD_NUM_POOLS', 10),
+                maxsize=get_storage_setting('DOWNLOAD_POOL_SIZE', 10),
+                # connection errors and reads of the headers are retried twice, up to 5 redirects are followed
+                retries=urllib3.Retry(total=None, connect=2, read=2, redirect=5, raise_on_redirect=True),
+            )
+        return cls._http
+
+    @staticmethod
+    def _get_timeout(deadline):
+        """
+        :return: the seconds left before `deadline`
+        """
+        return max(deadline - time.time(), 0.001)
+
+    @staticmethod
+    def _shutdown(response):
+        """
+        Interrupt the reads of `response`: they fail instead of waiting for more data.
+        """
+        sock = getattr(response.connection, 'sock', None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
     @classmethod
-    def _download_url(cls, url: str):
-        result = urllib.request.urlretrieve(url)
-        return result[0]
+    def _download_url(cls, url: str, max_size: int = None, timeout: float = None):
+        """
+        Download `url` into a spooled temporary file (in memory up to DOWNLOAD_SPOOL_SIZE bytes, on disk above), without
+        reading more than `max_size` bytes. The download completes before the upload starts: the uploader gets a
+        seekable file, and the Cloudinary SDK builds the multipart body in memory anyway, so the body is not piped
+        from the response to the upload.
+
+        :param url:
+        :param max_size: in bytes, STORAGE['DOWNLOAD_MAX_SIZE'] by default
+        :param timeout: in seconds, for the whole download, STORAGE['DOWNLOAD_TIMEOUT'] by default
+        :return: a file object positioned at its beginning
+        :raise FileTooLarge:
+        :raise StubHTTPError: if the download fails or takes more than `timeout`
+        """
+        max_size = max_size or get_storage_setting('DOWNLOAD_MAX_SIZE', 20 * 1024 * 1024)
+        deadline = time.time() + (timeout or get_storage_setting('DOWNLOAD_TIMEOUT', 30))
+
+        try:
+            # the connection and the headers must come before the deadline too
+            response = cls.get_http().request('GET', url, preload_content=False, timeout=urllib3.Timeout(
+                total=cls._get_timeout(deadline),
+                connect=get_storage_setting('DOWNLOAD_CONNECT_TIMEOUT', 5),
+                read=get_storage_setting('DOWNLOAD_READ_TIMEOUT', 10),
+            ))
+        except urllib3.exceptions.HTTPError as e:
+            raise StubHTTPError(detail='Can not download %s: %s' % (url, e))
+
+        if response.status >= 400:
+            # the body of an error is small: read it, so the connection can be reused
+            response.drain_conn()
+            response.release_conn()
+            raise StubHTTPError(detail='Can not download %s: HTTP %s' % (url, response.status))
+
+        # a read waits for a whole chunk, across many packets of a slow server: the socket is shut down at the deadline
+        watchdog = threading.Timer(cls._get_timeout(deadline), cls._shutdown, args=(response,))
+        watchdog.daemon = True
+        watchdog.start()
+        buffer = tempfile.SpooledTemporaryFile(max_size=DOWNLOAD_SPOOL_SIZE)
+        try:
+            content_length = response.headers.get('Content-Length')
+            if content_length and content_length.isdigit() and int(content_length) > max_size:
+                raise FileTooLarge()
+
+            size = 0
+            for chunk in response.stream(DOWNLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_size:
+                    raise FileTooLarge()
+                buffer.write(chunk)
+        except urllib3.exceptions.HTTPError as e:
+            buffer.close()
+            response.close()
+            if time.time() >= deadline:
+                raise StubHTTPError(detail='Can not download %s: timeout' % url)
+            raise StubHTTPError(detail='Can not download %s: %s' % (url, e))
+        except Exception:
+            buffer.close()
+            # the rest of the body is not read (too large): the connection is closed instead of reused
+            response.close()
+            raise
+        finally:
+            watchdog.cancel()
+            response.release_conn()
+
+        buffer.seek(0)
+        return buffer
 
     @classmethod
     @log_execution_time
@@ -27,28 +143,72 @@ class Storage:
         if public_id:
             params['public_id'] = public_id
 
-        result = upload(**params)
+        result = cls.uploader(**params)
         return result['public_id'], result['version']
 
     @classmethod
     @log_execution_time
     def _save_file_from_url(cls, url: str, public_id: str = None):
-        return cls._save_file(cls._download_url(url=url), public_id=public_id)
+        with cls._download_url(url=url) as file:
+            return cls._save_file(file, public_id=public_id)
+
+    @staticmethod
+    def _build_download_url(public_id: str, version: int, width: int = None, height: int = None):
+        if not (width and height):
+            return CloudinaryImage(public_id=public_id, version=version).build_url()
+        transformation = {
+            'width': width,
+            'height': height,
+            'crop': "fill",
+        }
+        return CloudinaryImage(public_id=public_id, version=version).build_url(transformation=transformation)
 
     @classmethod
-    def get_download_url(cls, public_id: str, version: int, width: int = None, height: int = None):
-        transformation = {}
-        if width and height:
-            transformation['width'] = width
-            transformation['height'] = height
-            transformation['crop'] = "fill"
+    def get_url_builder(cls):
+        """
+        `_build_download_url` memoized in a bounded LRU cache, of STORAGE['URL_CACHE_SIZE'] urls.
+        """
+        if cls._url_builder is None:
+            cache = lru_cache(maxsize=get_storage_setting('URL_CACHE_SIZE', 10000))
+            cls._url_builder = cache(cls._build_download_url)
+        return cls._url_builder
 
-        current_ts = datetime_to_utc_unix(now())
+    @classmethod
+    def get_download_url(cls, public_id: str, version: int, width: int = None, height: int = None):
+        """
+        :param public_id:
+        :param version: when missing, STORAGE['FALLBACK_VERSION'] is used, so the url is stable and stays cached
+            by the CDN
+        :param width:
+        :param height: the picture is cropped to width x height if both are given
+        :return: url
+        """
         if not version:
-            version = current_ts
-        if not transformation:
-            return CloudinaryImage(public_id=public_id, version=version).build_url()
-        return CloudinaryImage(public_id=public_id, version=version).build_url(transformation=transformation)
+            version = get_storage_setting('FALLBACK_VERSION', 1)
+        if not (width and height):
+            width = height = None
+        return cls.get_url_builder()(public_id, version, width, height)
+
+    @classmethod
+    def get_download_urls(cls, items, sizes=((None, None),)):
+        """
+        Build the urls of a page of objects in one pass, e.g. for a list serializer.
+
+        :param items: iterable of (public_id, version), items without public_id get no urls
+        :param sizes: iterable of (width, height), (None, None) for the original picture
+        :return: list with one dict {(width, height): url} per item, in the order of `items`
+        """
+        build = cls.get_url_builder()
+        fallback_version = get_storage_setting('FALLBACK_VERSION', 1)
+        sizes = [(w, h) if w and h else (None, None) for w, h in sizes]
+        result = []
+        for public_id, version in items:
+            if not public_id:
+                result.append({})
+                continue
+            version = version or fallback_version
+            result.append({(w, h): build(public_id, version, w, h) for w, h in sizes})
+        return result
 
     @classmethod
     def save_picture_for_object(cls, key: str, file: [File, str], directory='default'):
@@ -61,3 +221,32 @@ class Storage:
         logger.info('url=%s,directory=%s,key=%s', url, directory, key)
         public_id = '%s/%s' % (directory, key)
         return cls._save_file_from_url(url=url, public_id=public_id)
+
+    @classmethod
+    def save_picture_urls_for_objects(cls, items, directory='default', concurrency: int = None):
+        """
+        Run `save_picture_url_for_object` for many objects, with at most `concurrency` ingestions at the same time.
+        An ingestion which fails does not stop the others.
+
+        .. note::
+            The ingestions run in greenlets, they are only concurrent when gevent has patched the sockets
+            (e.g. in a gevent gunicorn worker).
+
+        :param items: iterable of (key, url)
+        :param directory:
+        :param concurrency: STORAGE['INGESTION_CONCURRENCY'] by default
+        :return: list of dict(key, url, public_id, version, error), in the order of `items`
+        """
+
+        def ingest(item):
+            key, url = item
+            result = {'key': key, 'url': url, 'public_id': None, 'version': None, 'error': None}
+            try:
+                result['public_id'], result['version'] = cls.save_picture_url_for_object(key, url, directory)
+            except Exception as e:
+                logger.exception('save_picture_urls_for_objects|error|key=%s,url=%s', key, url)
+                result['error'] = str(e)
+            return result
+
+        pool = Pool(concurrency or get_storage_setting('INGESTION_CONCURRENCY', 8))
+        return pool.map(ingest, items)
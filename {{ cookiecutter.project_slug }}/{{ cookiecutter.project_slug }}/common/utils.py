@@ -1,26 +1,33 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import bisect
 import datetime
 import json
 import logging
 import math
-import random
 import time
 from decimal import Decimal, ROUND_HALF_UP
-from functools import wraps
+from functools import partial, wraps
 import gevent
 import pytz
 from django.contrib.contenttypes.models import ContentType
 from django.core.paginator import Paginator
 from django.core.serializers.json import DjangoJSONEncoder
-from django.db.models.fields.files import FieldFile
 from django.forms import model_to_dict
 from django.utils import timezone
 from django.utils.timezone import localtime
 
+from common import ids
+from common import projection as queryset_projection
+from common.counts import CountStrategyPaginator
+from common.executors import DEFAULT_EXECUTOR, ProcessExecutor, get_executor
+from common.field_plans import compare_data, compute_changes, get_field_plan  # noqa: F401
+from common.pagination import KeysetPaginator, normalize_ordering
+
 RANDOM_CHARACTER_SET = '1234567890abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
 RANDOM_DIGIT_SET = '1234567890'
+UNIX_EPOCH = datetime.datetime(1970, 1, 1, 0, 0).replace(tzinfo=pytz.utc)
 
 logger = logging.getLogger('main')
 
@@ -52,8 +59,7 @@ def date_to_datetime(date):
 def datetime_to_utc_unix_ms(datetime_object):
     if not datetime_object:
         return None
-    unix_time = datetime.datetime(1970, 1, 1, 0, 0).replace(tzinfo=pytz.utc)
-    unix_time = (datetime_object - unix_time).total_seconds()
+    unix_time = (datetime_object - UNIX_EPOCH).total_seconds()
     unix_time = int(unix_time) * 1000
     return unix_time
 
@@ -61,8 +67,7 @@ def datetime_to_utc_unix_ms(datetime_object):
 def datetime_to_utc_unix(datetime_object):
     if not datetime_object:
         return 0
-    unix_time = datetime.datetime(1970, 1, 1, 0, 0).replace(tzinfo=pytz.utc)
-    unix_time = (datetime_object - unix_time).total_seconds()
+    unix_time = (datetime_object - UNIX_EPOCH).total_seconds()
     return int(unix_time)
 
 
@@ -75,57 +80,149 @@ def utc_unix_to_current_datetime(utc_unix_time):
     return current_tz.normalize(utc_datetime)
 
 
+def datetimes_to_utc_unix_ms(datetime_objects):
+    """
+    datetime_to_utc_unix_ms of every item, in one pass
+    """
+    epoch = UNIX_EPOCH
+    return [int((value - epoch).total_seconds()) * 1000 if value else None for value in datetime_objects]
+
+
+def datetimes_to_utc_unix(datetime_objects):
+    """
+    datetime_to_utc_unix of every item, in one pass
+    """
+    epoch = UNIX_EPOCH
+    return [int((value - epoch).total_seconds()) if value else 0 for value in datetime_objects]
+
+
+def get_from_utc(tz):
+    """
+    :return: function converting a naive UTC datetime to an aware datetime of `tz`, like `tz.normalize` of the UTC
+        datetime. The offset of the last transition period is cached: the rows of a list are usually in the same one.
+    """
+    if not hasattr(tz, 'normalize'):
+        return lambda value: value.replace(tzinfo=pytz.utc).astimezone(tz)
+    # pytz: normalize of an UTC datetime is fromutc of the naive datetime
+    transitions = getattr(tz, '_utc_transition_times', None)
+    if not transitions:
+        return tz.fromutc
+    # [start, end, offset, tzinfo] of the cached period
+    period = [datetime.datetime.max, datetime.datetime.min, None, None]
+
+    def from_utc(value):
+        if period[0] <= value < period[1]:
+            return (value + period[2]).replace(tzinfo=period[3])
+        result = tz.fromutc(value)
+        # the period chosen by DstTzInfo.fromutc
+        index = max(0, bisect.bisect_right(transitions, value) - 1)
+        period[0] = transitions[index] if index else datetime.datetime.min
+        period[1] = transitions[index + 1] if index + 1 < len(transitions) else datetime.datetime.max
+        period[2] = result.utcoffset()
+        period[3] = result.tzinfo
+        return result
+
+    return from_utc
+
+
+def utc_unix_to_current_datetimes(utc_unix_times):
+    """
+    utc_unix_to_current_datetime of every item, in one pass: the current time zone is resolved once
+    """
+    from_utc = get_from_utc(timezone.get_current_timezone())
+    utcfromtimestamp = timezone.datetime.utcfromtimestamp
+    return [from_utc(utcfromtimestamp(value / 1000)) if value else None for value in utc_unix_times]
+
+
 def get_content_type_for_model(obj):
     return ContentType.objects.get_for_model(obj, for_concrete_model=False)
 
 
+def get_page_number(page_number):
+    """
+    :return: `page_number` as an int of at least 1, 1 when it is not a number, like Paginator.get_page
+    """
+    try:
+        return max(int(page_number), 1)
+    except (TypeError, ValueError):
+        return 1
+
+
 def generate_result_from_paginator(
         model_cls, serializer_cls,
         search_options=None, sort_options=(),
-        start_id=None, page_number=1, page_size=20
+        start_id=None, page_number=1, page_size=20, cursor=None, projection=None
 ):
-    qs = model_cls.objects.order_by('-id')
-
-    if sort_options:
-        for option in sort_options:
-            qs = qs.order_by(option)
+    """
+    Return a page of `model_cls` objects using keyset pagination, see `common.pagination.KeysetPaginator`.
+
+    :param model_cls:
+    :param serializer_cls:
+    :param search_options: filter kwargs
+    :param sort_options: ordering, e.g. ('-created_at',); ties are broken by id
+    :param start_id: deprecated, only return objects with `id < start_id`. Use `cursor` instead.
+    :param page_number: only used without `cursor` (OFFSET based, avoid it for deep pages). Parsed like
+        Paginator.get_page: 1 when it is not a number, the last page when it is out of range
+    :param page_size:
+    :param cursor: `next_cursor` or `previous_cursor` of a previous result
+    :param projection: whether the queryset is projected on the fields of `serializer_cls`, see
+        `common.projection`; None for settings.PROJECTION['ENABLED']
+    :return: dict
+    """
+    qs = model_cls.objects.all()
 
     if search_options:
         qs = qs.filter(**search_options)
 
-    # Note:
-    # This line will override the behavior of paginator, so we can not trust the paginator.count as total records
-    if start_id:
+    # the paginator reads the sort keys of the rows for the cursors
+    qs = queryset_projection.project(qs, serializer_cls,
+                                     extra_columns=[name for name, _ in normalize_ordering(sort_options)],
+                                     enabled=projection)
+
+    if start_id and not cursor:
         qs = qs.filter(id__lt=start_id)
         page_number = 1
 
-    paginator = Paginator(qs, page_size, allow_empty_first_page=True)
-    page = paginator.get_page(page_number)
+    paginator = KeysetPaginator(qs, page_size, ordering=sort_options)
+    page_number = get_page_number(page_number)
+    page = paginator.get_page(cursor=cursor, offset=(page_number - 1) * paginator.page_size)
+    if not cursor and not page.object_list and page_number > 1:
+        # out of range: the last page, the rows are only counted in this case
+        last_page_number = max(math.ceil(qs.count() / paginator.page_size), 1)
+        page = paginator.get_page(offset=(last_page_number - 1) * paginator.page_size)
 
-    has_next = page.has_next()
     data = serializer_cls(instance=page.object_list, many=True).data
 
-    last_id = list(page.object_list)[-1].id if data else None
+    last_id = page.object_list[-1].id if page.object_list else None
     return {
-        'has_next': has_next,
+        'has_next': page.has_next,
+        'has_previous': page.has_previous,
         'data': data,
         'last_id': last_id,
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
     }
 
 
 def generate_result_from_paginator_for_admin_portal(model_cls, serializer_cls, search_options=None, sort_options=(),
-                                                    page_number=1, page_size=20
-                                                    ):
-    qs = model_cls.objects.order_by('-id')
+                                                    page_number=1, page_size=20, count_strategy=None,
+                                                    projection=None):
+    """
+    Return a page of `model_cls` objects with the total number of objects.
 
-    if sort_options:
-        for option in sort_options:
-            qs = qs.order_by(option)
+    The total comes from `count_strategy` (see `common.counts.CountStrategy`): it may be cached, or estimated on big
+    tables, in which case `total_is_estimated` is True. The queryset is projected like in
+    `generate_result_from_paginator`, rows of values() may replace the instances.
+    """
+    qs = model_cls.objects.order_by(*(sort_options or ('-id',)))
 
     if search_options:
         qs = qs.filter(**search_options)
 
-    paginator = Paginator(qs, page_size, allow_empty_first_page=True)
+    qs = queryset_projection.project(qs, serializer_cls, values=True, enabled=projection)
+
+    paginator = CountStrategyPaginator(qs, page_size, search_options=search_options, count_strategy=count_strategy,
+                                       allow_empty_first_page=True)
     page = paginator.get_page(page_number)
 
     data = serializer_cls(instance=page.object_list, many=True).data
@@ -133,56 +230,24 @@ def generate_result_from_paginator_for_admin_portal(model_cls, serializer_cls, s
     return {
         'data': data,
         'total': paginator.count,
+        'total_is_estimated': paginator.count_result.is_estimated,
     }
 
 
-def compare_data(instance_field, input_data):
-    if isinstance(instance_field, FieldFile):
-        if instance_field.name != input_data:
-            return instance_field.name, input_data
-
-    return instance_field, input_data
-
-
 def diff(instance, input_data):
-    changes = {}
-    for name, value in input_data.items():
-        if hasattr(instance, name) and input_data[name] != getattr(instance, name):
-            _from, _to = compare_data(getattr(instance, name), input_data[name])
-            if _from == _to:
-                continue
-
-            changes[name] = {
-                'from': _from,
-                'to': _to,
-            }
-    return changes
+    return compute_changes(instance, input_data)[2]
 
 
 def get_diff(instance, input_data):
-    from_data = {}
-    to_data = {}
-    changes = {}
-    for name, value in input_data.items():
-        if hasattr(instance, name) and input_data[name] != getattr(instance, name):
-            _from, _to = compare_data(getattr(instance, name), input_data[name])
-            if _from == _to:
-                continue
-            changes[name] = {
-                'from': _from,
-                'to': _to,
-            }
-            from_data[name] = _from
-            to_data[name] = _to
-    return from_data, to_data, changes
+    return compute_changes(instance, input_data)
 
 
 def get_valid_fields_for_model(model_cls, data_map):
-    valid_field_names = [f.name for f in model_cls._meta.get_fields()]
-    return {name: data_map[name] for name in valid_field_names if name in data_map}
+    return {name: data_map[name] for name in get_field_plan(model_cls).field_names if name in data_map}
 
 
 def dump_to_json(data):
+    # the stored format (separators, ASCII escapes) is kept, see common.json_engine.dumps for a compact UTF-8 encoding
     return json.dumps(data, cls=DjangoJSONEncoder)
 
 
@@ -191,22 +256,23 @@ def dump_instance_to_json(instance):
 
 
 def make_change_message(instance, input_data):
-    changes = diff(instance, input_data)
+    _, _, changes = compute_changes(instance, input_data)
     if changes:
         return dump_to_json(changes)
     return ''
 
 
 def random_string(length, allowed_chars=RANDOM_CHARACTER_SET):
-    max_index = len(allowed_chars) - 1
-    return ''.join([allowed_chars[random.randint(0, max_index)] for _ in range(length)])
+    # secrets based, see common.ids.random_tokens to generate many at once
+    return ids.random_token(length, allowed_chars)
 
 
 def random_digit(length):
     return random_string(length, allowed_chars=RANDOM_DIGIT_SET)
 
 
-def get_list_result_from_paginator(queryset, page_size, page_number, serializer_cls):
+def get_list_result_from_paginator(queryset, page_size, page_number, serializer_cls, projection=None):
+    queryset = queryset_projection.project(queryset, serializer_cls, values=True, enabled=projection)
     paginator = Paginator(queryset, page_size, allow_empty_first_page=True)
     page = paginator.get_page(page_number)
 
@@ -240,12 +306,15 @@ def get_update_data(data_field, db_field, data):
     return {}
 
 
-def should_asynchronous(func):
+def should_asynchronous(func=None, executor=DEFAULT_EXECUTOR):
     """
     Decorator for functions that should be executed in asynchronous way, usually for IO tasks, calling external services
     like sending emails, ...
     Asynchronous is default behaviour of decorated function, but can still execute synchronously.
 
+    The tasks are run by a bounded executor of the worker, see `common.executors`: `executor` is the name of its
+    configuration in settings.ASYNC_EXECUTORS. Use an executor in `process` mode for CPU bound functions.
+
     Examples:
         @should_asynchronous
         def foo():
@@ -253,13 +322,22 @@ def should_asynchronous(func):
             time.sleep(1000) # do something extremely long
             return
 
+        @should_asynchronous(executor='cpu')
+        def bar():
+            pass
+
         foo() -> execute function in asynchronous way (by default)
         foo(should_async=False) -> execute function in synchronous way
 
     :param func:
+    :param executor:
     :return:
     """
-    def exception_logging_wrapper(func, *args, **kwargs):
+    if func is None:
+        return partial(should_asynchronous, executor=executor)
+
+    @wraps(func)
+    def exception_logging_wrapper(*args, **kwargs):
         try:
             logger.info('begin|async|%s.%s', func.__module__, func.__name__)
             func(*args, **kwargs)
@@ -269,11 +347,16 @@ def should_asynchronous(func):
             logger.exception('error|async|%s.%s', func.__module__, func.__name__)
             raise e
 
+    @wraps(func)
     def inner(*args, **kwargs):
         should_async = kwargs.pop('should_async', True)
         if not should_async:
             return func(*args, **kwargs)
-        gevent.spawn(exception_logging_wrapper, func, *args, **kwargs)
+        task_executor = get_executor(executor)
+        if isinstance(task_executor, ProcessExecutor):
+            task_executor.submit(func, *args, **kwargs)
+        else:
+            task_executor.submit(exception_logging_wrapper, *args, **kwargs)
         # switch the execution
         gevent.sleep(0)
         return None
@@ -1,10 +1,17 @@
+import copy
 import logging
 import time
-import json
+from collections import namedtuple
+from types import MappingProxyType
+
 import six
 from rest_framework import views, exceptions
 
+from common.access_log import AccessLogger
 from common.exceptions import InvalidParameters
+from common.invalidation import watch_model
+from common.metrics import REQUEST_DURATION
+from common.response_cache import SCOPE_USER, ResponseCache
 
 HTTP_METHOD_SERIALIZER_CLASS_NAME_FORMAT = 'http_method_%s_serializer_class'
 CUSTOMIZED_HTTP_METHODS = ('get', 'post', 'put')
@@ -32,35 +39,135 @@ def format_errors(errors):
     return '\n'.join(messages)
 
 
+PLAN_VALIDATE = 'validate'
+PLAN_SKIP = 'skip'
+PLAN_DYNAMIC = 'dynamic'
+PLAN_ERROR = 'error'
+
+_fast_serializer_classes = {}
+
+
+class SerializerPlan(namedtuple('SerializerPlan', ['action', 'serializer_class'])):
+    """
+    What the wrapper of a http method handler does, decided once when the view class is created:
+
+        - PLAN_VALIDATE: validate the input data with `serializer_class`
+        - PLAN_SKIP: do not validate, the handler receives `None` as serializer
+        - PLAN_DYNAMIC: the view overrides `get_serializer_class`, call it on every request
+        - PLAN_ERROR: there is no serializer class for this method
+    """
+
+
+class FastValidationMixin:
+    """
+    Build the fields and the validators of the serializer once per serializer class, instead of once per instance.
+    Each instance gets a copy of the cached fields.
+
+    .. note::
+        Only for serializers whose `get_fields` and `get_validators` do not depend on the instance or the context.
+    """
+
+    def get_fields(self):
+        cls = type(self)
+        fields = cls.__dict__.get('_cached_fields')
+        if fields is None:
+            fields = super(FastValidationMixin, self).get_fields()
+            cls._cached_fields = fields
+        return copy.deepcopy(fields)
+
+    def get_validators(self):
+        cls = type(self)
+        validators = cls.__dict__.get('_cached_validators')
+        if validators is None:
+            validators = tuple(super(FastValidationMixin, self).get_validators())
+            cls._cached_validators = validators
+        return list(validators)
+
+
+def get_fast_serializer_class(serializer_class):
+    fast_serializer_class = _fast_serializer_classes.get(serializer_class)
+    if fast_serializer_class is None:
+        fast_serializer_class = type(serializer_class.__name__, (FastValidationMixin, serializer_class), {
+            '__module__': serializer_class.__module__,
+            '__doc__': serializer_class.__doc__,
+        })
+        _fast_serializer_classes[serializer_class] = fast_serializer_class
+    return fast_serializer_class
+
+
+def has_custom_get_serializer_class(view):
+    func = getattr(view, 'get_serializer_class', None)
+    # Skip the wrappers added by SerializerValidationMeta
+    while func is not None and hasattr(func, 'origin'):
+        func = func.origin
+    return func is not None
+
+
+def build_serializer_plans(view):
+    """
+    :param view: a view class, or a view instance when its serializer class attributes are set by `as_view`
+    :return: an immutable {method: SerializerPlan}
+    """
+    plans = {}
+    for method in CUSTOMIZED_HTTP_METHODS:
+        serializer_class_name = HTTP_METHOD_SERIALIZER_CLASS_NAME_FORMAT % method
+        if hasattr(view, serializer_class_name):
+            serializer_class = getattr(view, serializer_class_name)
+            action = PLAN_SKIP if serializer_class is None else PLAN_VALIDATE
+        elif has_custom_get_serializer_class(view):
+            serializer_class, action = None, PLAN_DYNAMIC
+        else:
+            serializer_class = getattr(view, 'serializer_class', None)
+            if serializer_class is not None:
+                action = PLAN_VALIDATE
+            else:
+                action = PLAN_SKIP if method == 'get' else PLAN_ERROR
+
+        if serializer_class is not None and getattr(view, 'fast_validation', False):
+            serializer_class = get_fast_serializer_class(serializer_class)
+        plans[method] = SerializerPlan(action, serializer_class)
+    return MappingProxyType(plans)
+
+
 def construct_validate_serializer_wrapper(method, origin_func):
     def validate_serializer_wrapper(_func):
         def inner(self, request, *args, **kwargs):
-            serializer_class_name = HTTP_METHOD_SERIALIZER_CLASS_NAME_FORMAT % method.lower()
-            if hasattr(self, serializer_class_name):
-                serializer_class = getattr(self, serializer_class_name)
-                if serializer_class is None:
-                    return _func(self, request, None, *args, **kwargs)
-            else:
+            action, serializer_class = self._serializer_plans[method]
+            if action == PLAN_DYNAMIC:
                 try:
                     serializer_class = self.get_serializer_class()
                 except (AssertionError, AttributeError):
-                    if method.lower() == 'get':
-                        return _func(self, request, None, *args, **kwargs)
+                    serializer_class = None
+                if serializer_class is None and method == 'get':
+                    action = PLAN_SKIP
+                if serializer_class is not None and self.fast_validation:
+                    serializer_class = get_fast_serializer_class(serializer_class)
+
+            serializer = None
+            if action != PLAN_SKIP:
+                if serializer_class is None:
                     raise exceptions.APIException(
-                        'For http method, you must define a serializer class which is used to validate the input data.'
+                        'For http method, you must define a serializer class which is used to validate the input '
+                        'data.'
                     )
 
-            # There is no `partial` in the initialization params, which means do not support partial update for now.
-            if method == 'get':
-                serializer = serializer_class(data=request.query_params)
-            else:
-                serializer = serializer_class(data=request.data)
+                # There is no `partial` in the initialization params, which means do not support partial update for
+                # now.
+                if method == 'get':
+                    serializer = serializer_class(data=request.query_params)
+                else:
+                    serializer = serializer_class(data=request.data)
 
-            if not serializer.is_valid():
-                raise InvalidParameters(detail=format_errors(serializer.errors))
+                if not serializer.is_valid():
+                    raise InvalidParameters(detail=format_errors(serializer.errors))
 
+            if method == 'get' and self.response_cache_timeout:
+                return self.get_response_cache().respond(
+                    request, serializer, lambda: _func(self, request, serializer, *args, **kwargs)
+                )
             return _func(self, request, serializer, *args, **kwargs)
 
+        inner.validates_serializer = True
         return inner
 
     return validate_serializer_wrapper(origin_func)
@@ -113,6 +220,7 @@ def get_serializer_class_wrapper(func):
 
         return get_serializer_class_func(self, *args, **kwargs)
 
+    get_serializer_class.origin = func
     return get_serializer_class
 
 
@@ -136,8 +244,9 @@ class SerializerValidationMeta(type):
             return new_class
 
         for method in CUSTOMIZED_HTTP_METHODS:
-            if hasattr(new_class, method):
-                origin_func = getattr(new_class, method)
+            origin_func = getattr(new_class, method, None)
+            # Handlers inherited from another view are already wrapped
+            if origin_func is not None and not getattr(origin_func, 'validates_serializer', False):
                 new_func = construct_validate_serializer_wrapper(method, origin_func)
                 setattr(new_class, method, new_func)
 
@@ -145,38 +254,84 @@ class SerializerValidationMeta(type):
         origin_get_serializer_class = getattr(new_class, 'get_serializer_class', None)
         setattr(new_class, 'get_serializer_class', get_serializer_class_wrapper(origin_get_serializer_class))
 
+        # Resolve the serializer class of each method once, so a request only does a dict lookup.
+        new_class._serializer_plans = build_serializer_plans(new_class)
+
+        # The generations of the cached models must be bumped by every process, before any request
+        for model_cls in new_class.response_cache_models or ():
+            watch_model(model_cls)
+
         return new_class
 
 
 class BaseAPIView(six.with_metaclass(SerializerValidationMeta, views.APIView)):
+    # Cache the fields and validators of the serializer classes, see FastValidationMixin
+    fast_validation = False
+    # See common.access_log.AccessLogger
+    access_log_sample_rate = None
+    access_log_status_sample_rates = None
+    access_log_body = True
+    access_log_redact_fields = ()
+    access_log_sql = None
+    # See common.response_cache.ResponseCache
+    response_cache_timeout = None
+    response_cache_models = ()
+    response_cache_scope = SCOPE_USER
+    response_cache_backend = None
+    # Seconds the successful GET responses are cached by nginx (the micro-cache of the nginx roles, which is bypassed
+    # for authenticated requests), None to not cache them. Only for responses which do not depend on the user.
+    micro_cache_seconds = None
+
+    _serializer_plans = build_serializer_plans(views.APIView)
+
+    def __init__(self, **kwargs):
+        super(BaseAPIView, self).__init__(**kwargs)
+        if any(key.endswith('serializer_class') or key == 'fast_validation' for key in kwargs):
+            self._serializer_plans = build_serializer_plans(self)
+
+    @classmethod
+    def get_access_logger(cls):
+        access_logger = cls.__dict__.get('_access_logger')
+        if access_logger is None:
+            access_logger = AccessLogger(cls)
+            cls._access_logger = access_logger
+        return access_logger
+
+    @classmethod
+    def get_response_cache(cls):
+        response_cache = cls.__dict__.get('_response_cache')
+        if response_cache is None:
+            response_cache = ResponseCache(cls)
+            cls._response_cache = response_cache
+        return response_cache
+
+    @classmethod
+    def get_metrics_name(cls):
+        name = cls.__dict__.get('_metrics_name')
+        if name is None:
+            name = '%s.%s' % (cls.__module__, cls.__qualname__)
+            cls._metrics_name = name
+        return name
+
     @classmethod
     def get_field(cls, obj, field):
-        if not hasattr(obj, field):
-            return '...'
-        try:
-            data = json.dumps(getattr(obj, field))
-        except TypeError:
-            return '...'
-        if len(data) > 4096:
-            return '...'
-        return data
+        return cls.get_access_logger().encode_field(obj, field)
 
     def dispatch(self, request, *args, **kwargs):
+        access_logger = self.get_access_logger()
+        recorder = access_logger.get_query_recorder()
         start = time.time()
-        response = super(BaseAPIView, self).dispatch(request, *args, **kwargs)
-        duration = int((time.time() - start) * 1000)
+        if recorder is None:
+            response = super(BaseAPIView, self).dispatch(request, *args, **kwargs)
+        else:
+            with recorder.record():
+                response = super(BaseAPIView, self).dispatch(request, *args, **kwargs)
+        elapsed = time.time() - start
+        duration = int(elapsed * 1000)
+        REQUEST_DURATION.observe(elapsed, self.get_metrics_name(), request.method, response.status_code)
+        if self.micro_cache_seconds and request.method in ('GET', 'HEAD') and response.status_code == 200:
+            response['X-Accel-Expires'] = str(self.micro_cache_seconds)
         # self.request is the REST framework request, instead of Django HttpRequest
-        logger.info(
-            'ACCESS_LOG|view=[%s], uri=[%s], user=[%s], method=[%s], duration=[%s ms], query_params=[%s],'
-            ' data=[%s], response_status=[%s], response_content=[%s]',
-            self.get_view_name(),
-            self.request._request.build_absolute_uri(self.request._request.get_full_path()),
-            self.request.user,
-            self.request.method,
-            duration,
-            self.get_field(self.request, 'query_params'),
-            self.get_field(self.request, 'data'),
-            response.status_code,
-            self.get_field(self.response, 'data'),
-        )
+        sql_fields = access_logger.get_sql_fields(self, self.request, recorder) if recorder is not None else {}
+        access_logger.log(self, self.request, response, duration, **sql_fields)
         return response
@@ -0,0 +1,92 @@
+"""
+Do the lazy initializations of Django and REST framework before a worker accepts requests, instead of in its first
+requests. Called by the `post_worker_init` hook of the gunicorn config.
+"""
+import logging
+import time
+
+from django.apps import apps
+from django.db import connections
+from django.urls import URLPattern, URLResolver, get_resolver
+
+from common.field_plans import get_field_plan
+
+logger = logging.getLogger('main')
+
+
+def iter_views(patterns):
+    """
+    :return: the view classes of the URL patterns, recursively
+    """
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_views(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern):
+            view_cls = getattr(pattern.callback, 'view_class', None)
+            if view_cls is not None:
+                yield view_cls
+
+
+def warmup_urls():
+    resolver = get_resolver()
+    # Import the URLconf and build the reverse lookup tables
+    resolver.reverse_dict
+    return set(iter_views(resolver.url_patterns))
+
+
+def warmup_models():
+    models = apps.get_models()
+    for model_cls in models:
+        get_field_plan(model_cls)
+    return models
+
+
+def warmup_content_types(models):
+    from django.contrib.contenttypes.models import ContentType
+
+    ContentType.objects.get_for_models(*models, for_concrete_models=False)
+
+
+def warmup_serializers(view_classes):
+    from common.views import BaseAPIView
+
+    count = 0
+    for view_cls in view_classes:
+        if not issubclass(view_cls, BaseAPIView):
+            continue
+        view_cls.get_access_logger()
+        for _, serializer_class in view_cls._serializer_plans.values():
+            if serializer_class is None:
+                continue
+            try:
+                # Build the fields of the serializer, e.g. the introspection of the model of a ModelSerializer
+                serializer_class().fields
+            except Exception:
+                logger.exception('warmup|error|serializer=%s', serializer_class.__name__)
+                continue
+            count += 1
+    return count
+
+
+def warmup():
+    """
+    Load the URLconf, the app registry, the content types and the serializers of the views.
+    A step which fails is logged and skipped, e.g. when the database is not reachable yet.
+    """
+    start = time.time()
+    view_classes = set()
+    models = []
+    steps = (
+        ('urls', lambda: view_classes.update(warmup_urls())),
+        ('models', lambda: models.extend(warmup_models())),
+        ('content_types', lambda: warmup_content_types(models)),
+        ('serializers', lambda: warmup_serializers(view_classes)),
+    )
+    for name, step in steps:
+        try:
+            step()
+        except Exception:
+            logger.exception('warmup|error|step=%s', name)
+    # The connections were opened by this thread, the requests use their own
+    connections.close_all()
+    logger.info('warmup|done|views=%s,models=%s,elapsed=%s', len(view_classes), len(models), time.time() - start)
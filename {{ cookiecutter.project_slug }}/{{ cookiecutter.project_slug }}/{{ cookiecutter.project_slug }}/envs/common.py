@@ -21,6 +21,8 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django_extensions',
+    # management commands of common, e.g. loadtest
+    'common',
 ]
 
 MIDDLEWARE = [
@@ -90,9 +92,153 @@ USE_TZ = True
 STATIC_URL = '/admin/static/'
 STATIC_ROOT = '/tmp/static/'
 
+# Variants written by collectstatic with common.staticfiles.CompressedManifestStaticFilesStorage
+STATIC_COMPRESSION = {
+    'ENABLED': True,
+    # when the brotli package is installed
+    'BROTLI': True,
+    'EXTENSIONS': ('.css', '.js', '.map', '.json', '.svg', '.txt', '.html', '.xml', '.ico', '.ttf', '.eot', '.otf'),
+    # in bytes
+    'MIN_SIZE': 256,
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
-    ]
+    ],
+    # JSON encoded/decoded with orjson when it is installed, see common.json_engine
+    'DEFAULT_RENDERER_CLASSES': [
+        'common.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'common.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    # Opt in to common.exceptions.exception_handler (ERROR_LOG below): the errors of the project get an error_code,
+    # and any other exception becomes a JSON 500 response logged by the handler instead of being raised, so the
+    # Django error handling (handler500, Sentry's capture of unhandled exceptions) does not see it anymore.
+    # 'EXCEPTION_HANDLER': 'common.exceptions.exception_handler',
+}
+
+
+# Totals of admin portal list pages, see common.counts.CountStrategy
+# Counts are cached per model & search options, and invalidated on post_save/post_delete or after the timeout.
+COUNT_CACHE_TIMEOUT = 60
+# Above this number of rows, use the database planner estimate instead of an exact COUNT(*). None to always count.
+COUNT_ESTIMATE_THRESHOLD = 100000
+
+# Model generations of common.invalidation (count and response caches): the cache must be shared by all the processes,
+# see live settings. A save or delete of a watched model writes its generation to this cache after the commit.
+INVALIDATION_CACHE_ALIAS = 'default'
+# 'app_label.ModelName' of the models whose counts are cached (admin portal list pages), watched when a process starts.
+# The response_cache_models of the views are watched anyway.
+INVALIDATION_WATCHED_MODELS = []
+
+# Projection of the querysets of the paginator helpers on the fields of their serializer, see common.projection
+PROJECTION = {
+    'ENABLED': True,
+    # rows of values() instead of instances, when every field of the serializer is a plain column
+    'VALUES': True,
+}
+
+# Streaming exports, see common.export.ExportAPIView
+EXPORT = {
+    # rows read, serialized and sent at once
+    'CHUNK_SIZE': 2000,
+    'GZIP_LEVEL': 6,
+}
+
+# Access log of BaseAPIView, see common.access_log.AccessLogger
+ACCESS_LOG = {
+    # ratio of the requests which are logged
+    'SAMPLE_RATE': 1.0,
+    # ratio per response status code, e.g. {200: 0.1}
+    'STATUS_SAMPLE_RATES': {},
+    # query params, request data and response data longer than this are logged as '...'
+    'BODY_BUDGET': 4096,
+    'REDACT_FIELDS': ('password',),
+    # record the queries of every request, without DEBUG
+    'SQL': True,
+    # warn when a statement runs this many times in a request (N+1), or above this many queries or milliseconds
+    'N_PLUS_ONE_THRESHOLD': 10,
+    'SQL_COUNT_THRESHOLD': 100,
+    'SQL_TIME_THRESHOLD_MS': 1000,
 }
 
+# Exceptions logged by common.exceptions.exception_handler, when it is REST_FRAMEWORK['EXCEPTION_HANDLER']
+# In every WINDOW seconds, at most BURST occurrences of the same error (error code, exception class, origin frame) are
+# logged with their traceback, the next logged occurrence reports how many were suppressed.
+ERROR_LOG = {
+    'WINDOW': 60,
+    'BURST': 5,
+    'MAX_KEYS': 1000,
+}
+
+# Responses of the views with a response_cache_timeout, see common.response_cache.ResponseCache
+# BACKEND is lru (memory of the process), django (ALIAS of CACHES) or file (DIRECTORY).
+RESPONSE_CACHE = {
+    'DEFAULT': 'local',
+    'BACKENDS': {
+        'local': {
+            'BACKEND': 'lru',
+            'MAX_ENTRIES': 1000,
+        },
+    },
+}
+
+# Files stored by common.storage.Storage
+STORAGE = {
+    # downloads of remote files (save_picture_url_for_object)
+    'DOWNLOAD_CONNECT_TIMEOUT': 5,
+    'DOWNLOAD_READ_TIMEOUT': 10,
+    'DOWNLOAD_TIMEOUT': 30,
+    'DOWNLOAD_MAX_SIZE': 20 * 1024 * 1024,
+    'DOWNLOAD_POOL_SIZE': 10,
+    # number of concurrent ingestions of save_picture_urls_for_objects
+    'INGESTION_CONCURRENCY': 8,
+    # number of download urls memoized per process
+    'URL_CACHE_SIZE': 10000,
+    # version of the urls of files saved without version
+    'FALLBACK_VERSION': 1,
+}
+
+# Executors of the functions decorated by common.utils.should_asynchronous, see common.executors
+# FULL_POLICY is what happens when QUEUE_SIZE tasks are pending: block (up to BLOCK_TIMEOUT seconds), inline or reject.
+ASYNC_EXECUTORS = {
+    'default': {
+        'POOL_SIZE': 100,
+        'QUEUE_SIZE': 1000,
+        'FULL_POLICY': 'block',
+        'BLOCK_TIMEOUT': 10,
+    },
+    # for CPU bound functions: @should_asynchronous(executor='cpu')
+    'cpu': {
+        'MODE': 'process',
+        'MAX_WORKERS': 2,
+        'QUEUE_SIZE': 100,
+        'FULL_POLICY': 'inline',
+    },
+}
+# Pending tasks are given this time to finish when the process exits. In gunicorn, graceful_timeout is used.
+ASYNC_EXECUTORS_SHUTDOWN_TIMEOUT = 10
+
+# Metrics of the workers, exposed on /internal/metrics, see common.metrics
+METRICS = {
+    # the files of the processes, set by the gunicorn config; None to keep the metrics in the memory of the process
+    'DIRECTORY': os.environ.get('METRICS_DIRECTORY'),
+    # hosts allowed to read the metrics
+    'ALLOWED_NETWORKS': ('127.0.0.0/8', '::1/128', '10.0.0.0/8', '172.16.0.0/12', '192.168.0.0/16'),
+}
+
+# Sortable ids, see common.ids
+IDS = {
+    # milliseconds since the Unix epoch, never change it once ids are stored
+    'EPOCH_MS': 1577836800000,
+    # 0 to 1023, for a single process; None for the IDS_WORKER_ID environment variable (set for the gunicorn workers)
+    # or, without it, a hash of the host name and the pid, which is not unique
+    'WORKER_ID': None,
+    # raise ImproperlyConfigured instead of using the hash
+    'REQUIRE_WORKER_ID': False,
+}
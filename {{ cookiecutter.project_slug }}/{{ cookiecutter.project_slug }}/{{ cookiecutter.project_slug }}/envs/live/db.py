@@ -1,8 +1,34 @@
 from {{ cookiecutter.project_slug }}.envs.common import *
 
+# common.db.backends.* are the Django backends (sqlite3, mysql, postgresql) with a connection pool per process,
+# bounded whatever the number of greenlets, see common.db.backends.base.PooledDatabaseWrapperMixin.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'common.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Connections are given back to the pool at the end of every request, the pool keeps them open
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'MAX_SIZE': 10,
+            # seconds to wait for a connection when MAX_SIZE are in use
+            'CHECKOUT_TIMEOUT': 10,
+            # seconds before a connection is closed and replaced
+            'MAX_AGE': 3600,
+            # a connection idle for more seconds is checked before being used
+            'HEALTH_CHECK_INTERVAL': 30,
+        },
+        # executed on every new connection (SQLite only)
+        'PRAGMAS': {
+            # readers do not block the writer
+            'journal_mode': 'WAL',
+            # safe with WAL, fsync at checkpoints only
+            'synchronous': 'NORMAL',
+            'mmap_size': 256 * 1024 * 1024,
+            # in KiB when negative
+            'cache_size': -64000,
+            'temp_store': 'MEMORY',
+            # milliseconds to wait for a lock instead of failing with "database is locked"
+            'busy_timeout': 5000,
+        },
     }
 }
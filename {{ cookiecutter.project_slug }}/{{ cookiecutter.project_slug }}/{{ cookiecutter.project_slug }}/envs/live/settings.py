@@ -4,6 +4,17 @@ from {{ cookiecutter.project_slug }}.envs.live.db import *
 # TODO: you should re-generate it
 SECRET_KEY = 'w)w@lz#)but(87fg)_#w_iwcfl1y&0g#i1f0j!cx9d5%lk#@rj'
 
+# The model generations of common.invalidation are kept per process by default: a change is only seen by the other
+# processes after the cache timeouts (COUNT_CACHE_TIMEOUT, response_cache_timeout). To share them, add a cache shared
+# by all the processes (memcached, redis) and set INVALIDATION_CACHE_ALIAS. A DatabaseCache on the primary database
+# adds queries to every write of a watched model.
+
+# The sortable ids of common.ids must not use a worker id shared by two processes
+IDS = dict(IDS, REQUIRE_WORKER_ID=True)
+
+# Hashed names and precompressed variants, served by nginx with a far-future cache
+STATICFILES_STORAGE = 'common.staticfiles.CompressedManifestStaticFilesStorage'
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -17,9 +28,14 @@ LOGGING = {
     'handlers': {
         'main_file': {
             'level': 'DEBUG',
-            'class': 'common.loggers.DailyFileHandler',
+            'class': 'common.loggers.QueuedDailyFileHandler',
             'filename': '/var/log/{{ cookiecutter.organization }}/{{ cookiecutter.project_slug }}/main.log',
             'formatter': 'standard',
+            'queue_size': 10000,
+            'batch_size': 500,
+            'flush_interval': 1.0,
+            # block, drop or sample
+            'overflow_policy': 'sample',
         },
     },
     'loggers': {
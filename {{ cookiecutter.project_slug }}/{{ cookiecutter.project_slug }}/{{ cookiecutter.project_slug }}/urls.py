@@ -13,9 +13,18 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import os
+
 from django.contrib import admin
-from django.urls import path
+from django.urls import include, path
+
+from common.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('internal/metrics', metrics_view),
 ]
+
+# Sample endpoints, only in the servers started by the loadtest management command
+if os.environ.get('LOADTEST_ENDPOINTS'):
+    urlpatterns.append(path('loadtest/', include('common.loadtest')))